@@ -0,0 +1,188 @@
+"""Adaptive (AIMD) concurrency limiter for LLM calls."""
+import asyncio
+import collections
+import random
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import openai
+
+from metrics import get_metrics
+
+INITIAL_LIMIT = 10
+MIN_LIMIT = 1
+MAX_LIMIT = 64
+# Calls slower than this do not grow the window even when they succeed
+LATENCY_TARGET_SECONDS = 20.0
+DECREASE_FACTOR = 0.5
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+def is_overload_error(error: BaseException) -> bool:
+    """Rate limits, timeouts and server-side failures: signals to back off."""
+    if isinstance(error, (
+        asyncio.TimeoutError,
+        openai.error.RateLimitError,
+        openai.error.Timeout,
+        openai.error.ServiceUnavailableError,
+        openai.error.APIConnectionError,
+    )):
+        return True
+    return isinstance(error, openai.error.APIError) and (error.http_status or 0) >= 500
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """Seconds requested by the provider's Retry-After header, if any."""
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after-ms") or headers.get("Retry-After-Ms")
+    if value is not None:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter():
+    """
+    Concurrency window that grows additively while calls succeed within the
+    latency target and shrinks multiplicatively on rate limits and timeouts.
+    A Retry-After from the provider pauses every new call until it expires.
+
+    The limiter is not thread-safe: it must only be used from one event loop,
+    which is the LlmEngine loop for the shared per-model limiters.
+    """
+
+    def __init__(self, initial_limit: int = INITIAL_LIMIT, min_limit: int = MIN_LIMIT, max_limit: int = MAX_LIMIT,
+                 latency_target: float = LATENCY_TARGET_SECONDS, decrease_factor: float = DECREASE_FACTOR) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.decrease_factor = decrease_factor
+        self._limit = float(initial_limit)
+        self._waiters = collections.deque()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._latency = None
+        self._wake_scheduled = False
+        self.in_flight = 0
+        self.successes = 0
+        self.overloads = 0
+
+    @property
+    def window(self) -> int:
+        """Current number of calls allowed in flight."""
+        return max(self.min_limit, int(self._limit))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "window": self.window,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "blocked_for": max(0.0, self._blocked_until - time.monotonic()),
+            "latency": self._latency,
+            "successes": self.successes,
+            "overloads": self.overloads,
+        }
+
+    async def acquire(self) -> None:
+        while True:
+            delay = self._blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if self.in_flight < self.window and not self._waiters:
+                self.in_flight += 1
+                return
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            try:
+                # The slot is handed over by _wake, in_flight already counts us
+                await future
+                return
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # Cancelled after _wake handed us a slot: pass it on
+                    self.release()
+                elif future in self._waiters:
+                    # _wake drops cancelled futures itself, so it may be gone already
+                    self._waiters.remove(future)
+                raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self, scheduled: bool = False) -> None:
+        if scheduled:
+            self._wake_scheduled = False
+        delay = self._blocked_until - time.monotonic()
+        if delay > 0:
+            if self._waiters and not self._wake_scheduled:
+                self._wake_scheduled = True
+                asyncio.get_running_loop().call_later(delay, self._wake, True)
+            return
+        while self._waiters and self.in_flight < self.window:
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def on_success(self, latency: float) -> None:
+        self.successes += 1
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        # Only grow when the window is actually the bottleneck
+        if latency <= self.latency_target and self.in_flight >= self.window:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def on_overload(self, error: BaseException) -> None:
+        self.overloads += 1
+        now = time.monotonic()
+        wait = retry_after(error)
+        if wait:
+            self._blocked_until = max(self._blocked_until, now + wait)
+        # Calls already in flight will fail for the same reason; decrease once per round trip
+        if now - self._last_decrease >= (self._latency or 1.0):
+            self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+            self._last_decrease = now
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one slot of the window for the duration of a call and records its outcome."""
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            if is_overload_error(e):
+                self.on_overload(e)
+            raise
+        else:
+            self.on_success(time.monotonic() - start)
+        finally:
+            self.release()
+
+    async def call(self, make_call: Callable[[], Awaitable[Any]], max_attempts: int = MAX_ATTEMPTS) -> Any:
+        """Runs `make_call()` inside a slot, retrying overload errors with jittered exponential backoff."""
+        for attempt in range(max_attempts):
+            try:
+                async with self.slot():
+                    return await make_call()
+            except Exception as e:
+                if not is_overload_error(e) or attempt == max_attempts - 1:
+                    raise
+                get_metrics().inc("llm_retries_total", error=type(e).__name__)
+                backoff = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt)
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+import adaptive_limiter
+from adaptive_limiter import AdaptiveLimiter, retry_after
+
+
+def rate_limit(retry_after_seconds=None):
+    headers = {"Retry-After": str(retry_after_seconds)} if retry_after_seconds is not None else {}
+    return openai.error.RateLimitError("Rate limit reached", http_status=429, headers=headers)
+
+
+def test_waiter_cancelled_before_release_raises_cancelled_error():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        # Cancelling all tasks while a running call releases its slot
+        waiter.cancel()
+        limiter.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        return limiter.snapshot()
+
+    snapshot = asyncio.run(scenario())
+
+    assert snapshot["in_flight"] == 0
+    assert snapshot["waiting"] == 0
+
+
+def test_waiter_cancelled_after_handover_gives_the_slot_back():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+
+        limiter.release()
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # The slot is free for the next caller
+        await asyncio.wait_for(limiter.acquire(), 1)
+        return limiter.snapshot()
+
+    snapshot = asyncio.run(scenario())
+
+    assert snapshot["in_flight"] == 1
+    assert snapshot["waiting"] == 0
+
+
+def test_window_limits_concurrency():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=3, max_limit=3)
+        running, peak = 0, 0
+
+        async def call():
+            nonlocal running, peak
+            async with limiter.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(call() for _ in range(12)))
+        return peak, limiter.snapshot()
+
+    peak, snapshot = asyncio.run(scenario())
+
+    assert peak == 3
+    assert snapshot["in_flight"] == 0
+    assert snapshot["successes"] == 12
+
+
+def test_rate_limit_halves_the_window_once_per_round_trip():
+    limiter = AdaptiveLimiter(initial_limit=8)
+
+    limiter.on_overload(rate_limit())
+    assert limiter.window == 4
+    # Calls already in flight fail for the same reason
+    limiter.on_overload(rate_limit())
+    assert limiter.window == 4
+    assert limiter.overloads == 2
+
+
+def test_window_does_not_go_below_the_minimum():
+    limiter = AdaptiveLimiter(initial_limit=2, min_limit=1)
+
+    for _ in range(5):
+        limiter._last_decrease = 0.0
+        limiter.on_overload(rate_limit())
+
+    assert limiter.window == 1
+
+
+def test_retry_after_pauses_new_calls():
+    async def scenario():
+        limiter = AdaptiveLimiter(initial_limit=4)
+        limiter.on_overload(rate_limit(0.2))
+        start = time.monotonic()
+        await limiter.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.19
+
+
+def test_retry_after_header_formats():
+    assert retry_after(rate_limit(3)) == 3.0
+    assert retry_after(openai.error.RateLimitError("x", headers={"retry-after-ms": "1500"})) == 1.5
+    assert retry_after(rate_limit()) is None
+
+
+def test_call_retries_overload_errors(monkeypatch):
+    monkeypatch.setattr(adaptive_limiter, "BACKOFF_BASE_SECONDS", 0.0)
+    attempts = []
+
+    async def make_call():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise rate_limit(0.1)
+        return "ok"
+
+    limiter = AdaptiveLimiter(initial_limit=4)
+    result = asyncio.run(limiter.call(make_call))
+
+    assert result == "ok"
+    assert len(attempts) == 2
+    assert attempts[1] - attempts[0] >= 0.09
+    assert limiter.window == 2
+
+
+def test_call_does_not_retry_other_errors():
+    attempts = []
+
+    async def make_call():
+        attempts.append(1)
+        raise openai.error.InvalidRequestError("bad prompt", param=None)
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        asyncio.run(AdaptiveLimiter().call(make_call))
+    assert len(attempts) == 1
@@ -0,0 +1,213 @@
+"""Teacher analytics over game_results: item difficulty, per-question correct rate, mastery and time on task."""
+import json
+import threading
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from database import DB_PATH, get_connection
+from qcm_chain import DIFFICULTY_LEVELS
+
+# Classical item difficulty bands on the proportion of correct answers
+EASY_CORRECT_RATE = 0.7
+HARD_CORRECT_RATE = 0.3
+# Results read per query when catching up, so a long backlog is not loaded at once
+REFRESH_CHUNK = 5000
+
+ITEM_COLUMNS = ["attempts", "correct"]
+STUDENT_COLUMNS = ["answered", "correct", "games", "time_spent", "timed_games"]
+GAME_COLUMNS = ["plays", "score", "accuracy", "time_spent", "timed_games"]
+
+def _empty(index: List[str], columns: List[str]) -> pd.DataFrame:
+    if len(index) == 1:
+        keys = pd.Index([], dtype="int64", name=index[0])
+    else:
+        keys = pd.MultiIndex.from_arrays([[] for _ in index], names=index)
+    return pd.DataFrame(columns=columns, index=keys, dtype="float64")
+
+def _select(totals: pd.DataFrame, key: int, level: str, index: List[str], columns: List[str]) -> pd.DataFrame:
+    """The rows of `totals` whose `level` is `key`, without that level."""
+    try:
+        return totals.xs(key, level=level).copy()
+    except KeyError:
+        return _empty(index, columns)
+
+def _accumulate(total: pd.DataFrame, increment: pd.DataFrame) -> pd.DataFrame:
+    """Sums `increment` into `total`, aligned on their index; new keys are added."""
+    if total.empty:
+        return increment.astype("float64")
+    return total.add(increment, fill_value=0)
+
+def explode_answers(results: pd.DataFrame) -> pd.DataFrame:
+    """
+    One row per answered question: result, user, game, the question's position
+    in the game and whether it was correct. Answers are stored in the order
+    the questions were asked, so the position identifies the question.
+    """
+    parsed = [json.loads(answers) if answers else [] for answers in results["answers"]]
+    lengths = np.fromiter(map(len, parsed), dtype=np.int64, count=len(parsed))
+    total = int(lengths.sum())
+    starts = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return pd.DataFrame({
+        "user_id": np.repeat(results["user_id"].to_numpy(), lengths),
+        "game_id": np.repeat(results["game_id"].to_numpy(), lengths),
+        "question_index": np.arange(total) - starts,
+        "is_correct": np.fromiter(
+            (bool(answer.get("is_correct")) for answers in parsed for answer in answers), dtype=bool, count=total
+        ),
+    })
+
+
+class TeacherAnalytics():
+    """
+    Aggregates of every result in game_results, kept as running sums.
+
+    Each query first checks the newest result id, an O(1) primary key lookup:
+    if results arrived since the last query, only those are read, exploded
+    into answers and added to the sums with vectorized groupbys. Rates and
+    averages are derived from the sums when asked for, so a page load never
+    recomputes anything from scratch.
+    """
+
+    def __init__(self, db_path: str = DB_PATH) -> None:
+        self.db_path = db_path
+        self.last_result_id = 0
+        self._items = _empty(["game_id", "question_index"], ITEM_COLUMNS)
+        self._students = _empty(["user_id"], STUDENT_COLUMNS)
+        self._student_games = _empty(["user_id", "game_id"], STUDENT_COLUMNS)
+        self._games = _empty(["game_id"], GAME_COLUMNS)
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def refresh(self) -> int:
+        """Adds the results stored since the last refresh to the sums; returns how many."""
+        with self._lock:
+            latest = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM game_results").fetchone()[0]
+            added = 0
+            while self.last_result_id < latest:
+                results = pd.read_sql_query(
+                    "SELECT id, user_id, game_id, score, accuracy, time_spent, answers FROM game_results "
+                    "WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                    self._conn(), params=(self.last_result_id, latest, REFRESH_CHUNK),
+                )
+                if results.empty:
+                    break
+                self._add(results)
+                self.last_result_id = int(results["id"].iloc[-1])
+                added += len(results)
+            return added
+
+    def _add(self, results: pd.DataFrame) -> None:
+        # Results of deleted games or anonymous players still count for the others
+        results = results.assign(
+            user_id=results["user_id"].fillna(-1).astype(np.int64),
+            game_id=results["game_id"].fillna(-1).astype(np.int64),
+            timed=results["time_spent"].notna(),
+            time_spent=results["time_spent"].fillna(0),
+        )
+        answers = explode_answers(results)
+
+        items = answers.groupby(["game_id", "question_index"])["is_correct"].agg(["size", "sum"])
+        self._items = _accumulate(self._items, items.set_axis(ITEM_COLUMNS, axis=1))
+
+        for key, target in ((["user_id"], "_students"), (["user_id", "game_id"], "_student_games")):
+            answered = answers.groupby(key)["is_correct"].agg(["size", "sum"]).set_axis(["answered", "correct"], axis=1)
+            played = results.groupby(key).agg(games=("id", "size"), time_spent=("time_spent", "sum"),
+                                              timed_games=("timed", "sum"))
+            increment = answered.join(played, how="outer").fillna(0)[STUDENT_COLUMNS]
+            setattr(self, target, _accumulate(getattr(self, target), increment))
+
+        games = results.groupby("game_id").agg(
+            plays=("id", "size"), score=("score", "sum"), accuracy=("accuracy", "sum"),
+            time_spent=("time_spent", "sum"), timed_games=("timed", "sum"),
+        )
+        self._games = _accumulate(self._games, games[GAME_COLUMNS])
+
+    def _games_info(self, game_ids) -> pd.DataFrame:
+        ids = [int(game_id) for game_id in game_ids if game_id >= 0]
+        if not ids:
+            return pd.DataFrame(columns=["title", "subject", "game_mode"], index=pd.Index([], name="game_id"))
+        placeholders = ", ".join("?" * len(ids))
+        return pd.read_sql_query(
+            f"SELECT id AS game_id, title, subject, game_mode FROM games WHERE id IN ({placeholders})",
+            self._conn(), params=ids, index_col="game_id",
+        )
+
+    def _users_info(self, user_ids) -> pd.DataFrame:
+        ids = [int(user_id) for user_id in user_ids if user_id >= 0]
+        if not ids:
+            return pd.DataFrame(columns=["name"], index=pd.Index([], name="user_id"))
+        placeholders = ", ".join("?" * len(ids))
+        return pd.read_sql_query(
+            "SELECT id AS user_id, COALESCE(NULLIF(TRIM(COALESCE(first_name, '') || ' ' || COALESCE(last_name, '')), ''), "
+            f"username) AS name FROM users WHERE id IN ({placeholders})",
+            self._conn(), params=ids, index_col="user_id",
+        )
+
+    def game_summary(self) -> pd.DataFrame:
+        """Per game: plays, average score, accuracy and minutes, most played first."""
+        self.refresh()
+        with self._lock:
+            games = self._games.copy()
+        summary = pd.DataFrame({
+            "plays": games["plays"].astype(np.int64),
+            "avg_score": games["score"] / games["plays"],
+            "avg_accuracy": games["accuracy"] / games["plays"],
+            "avg_minutes": games["time_spent"] / games["timed_games"].replace(0, np.nan) / 60,
+        }, index=games.index)
+        summary = self._games_info(summary.index).join(summary, how="right")
+        return summary.sort_values("plays", ascending=False)
+
+    def item_stats(self, game_id: int) -> pd.DataFrame:
+        """Per question of the game: attempts, correct rate, difficulty index and band, hardest first."""
+        self.refresh()
+        with self._lock:
+            items = _select(self._items, game_id, "game_id", ["question_index"], ITEM_COLUMNS)
+        correct_rate = items["correct"] / items["attempts"]
+        stats = pd.DataFrame({
+            "attempts": items["attempts"].astype(np.int64),
+            "correct_rate": correct_rate,
+            # Difficulty index: the share of wrong answers
+            "difficulty": 1 - correct_rate,
+            "band": np.select(
+                [correct_rate >= EASY_CORRECT_RATE, correct_rate < HARD_CORRECT_RATE],
+                [DIFFICULTY_LEVELS[0], DIFFICULTY_LEVELS[2]], default=DIFFICULTY_LEVELS[1],
+            ),
+        }, index=items.index)
+        return stats.sort_values("correct_rate")
+
+    def student_mastery(self, game_id: Optional[int] = None) -> pd.DataFrame:
+        """
+        Per student, over all games or one: games played, questions answered,
+        mastery (share of correct answers) and time on task in minutes.
+        """
+        self.refresh()
+        with self._lock:
+            if game_id is None:
+                students = self._students.copy()
+            else:
+                students = _select(self._student_games, game_id, "game_id", ["user_id"], STUDENT_COLUMNS)
+        mastery = pd.DataFrame({
+            "games": students["games"].astype(np.int64),
+            "answered": students["answered"].astype(np.int64),
+            "mastery": students["correct"] / students["answered"].replace(0, np.nan),
+            "minutes": students["time_spent"] / 60,
+            "minutes_per_game": students["time_spent"] / students["timed_games"].replace(0, np.nan) / 60,
+        }, index=students.index)
+        mastery = self._users_info(mastery.index).join(mastery, how="right")
+        return mastery.sort_values("mastery", ascending=False)
+
+
+_analytics = None
+_analytics_lock = threading.Lock()
+
+def get_analytics() -> TeacherAnalytics:
+    """Returns the process-wide analytics, shared by every session's dashboard."""
+    global _analytics
+    with _analytics_lock:
+        if _analytics is None:
+            _analytics = TeacherAnalytics()
+    return _analytics
@@ -0,0 +1,90 @@
+import json
+import random
+
+import pandas as pd
+import pytest
+
+import analytics
+from analytics import TeacherAnalytics
+from database import get_connection
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "eduplay.db")
+    with get_connection(path) as conn:
+        conn.executemany("INSERT INTO users (id, username, email, password_hash, first_name) VALUES (?, ?, ?, '!', ?)",
+                         [(1, "ana", "ana@eduplay.local", "Ana"), (2, "luis", "luis@eduplay.local", None)])
+        conn.executemany("INSERT INTO games (id, title, subject, difficulty, game_mode, questions) "
+                         "VALUES (?, ?, 'Biología', 'Medio', 'quiz', '[]')", [(1, "Células"), (2, "Genética")])
+    return path
+
+
+def add_result(db_path, user_id, game_id, correct, score=100, time_spent=60):
+    answers = [{"question": f"¿{i}?", "is_correct": is_correct} for i, is_correct in enumerate(correct)]
+    with get_connection(db_path) as conn:
+        conn.execute(
+            "INSERT INTO game_results (user_id, game_id, score, accuracy, time_spent, questions_correct, "
+            "total_questions, answers) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, game_id, score, sum(correct) / len(correct), time_spent, sum(correct), len(correct),
+             json.dumps(answers)),
+        )
+
+
+def test_item_stats_and_mastery(db_path):
+    add_result(db_path, 1, 1, [True, True, False], score=200, time_spent=120)
+    add_result(db_path, 2, 1, [True, False, False], score=100, time_spent=None)
+    stats = TeacherAnalytics(db_path)
+
+    items = stats.item_stats(1)
+    assert items["attempts"].tolist() == [2, 2, 2]
+    assert items.loc[0, "correct_rate"] == 1.0
+    assert items.loc[0, "band"] == "Fácil"
+    assert items.loc[1, "band"] == "Medio"
+    assert items.loc[2, "band"] == "Difícil"
+
+    mastery = stats.student_mastery()
+    assert mastery.loc[1, "name"] == "Ana"
+    # Without a first name the username is shown
+    assert mastery.loc[2, "name"] == "luis"
+    assert mastery.loc[1, "mastery"] == pytest.approx(2 / 3)
+    assert mastery.loc[1, "minutes"] == pytest.approx(2.0)
+    assert pd.isna(mastery.loc[2, "minutes_per_game"])
+
+    summary = stats.game_summary()
+    assert summary.loc[1, "plays"] == 2
+    assert summary.loc[1, "avg_score"] == pytest.approx(150)
+    # Only timed games count towards the average time
+    assert summary.loc[1, "avg_minutes"] == pytest.approx(2.0)
+
+
+def test_incremental_refresh_matches_a_full_recompute(db_path, monkeypatch):
+    # Small chunks so catching up takes several reads
+    monkeypatch.setattr(analytics, "REFRESH_CHUNK", 3)
+    rng = random.Random(4)
+    incremental = TeacherAnalytics(db_path)
+
+    for _ in range(4):
+        for _ in range(rng.randint(1, 7)):
+            add_result(db_path, rng.choice([1, 2, None]), rng.choice([1, 2]),
+                       [rng.random() < 0.6 for _ in range(rng.randint(1, 6))],
+                       rng.randint(0, 500), rng.choice([None, rng.randint(10, 300)]))
+        incremental.refresh()
+    full = TeacherAnalytics(db_path)
+
+    for game_id in (1, 2):
+        pd.testing.assert_frame_equal(incremental.item_stats(game_id), full.item_stats(game_id))
+        pd.testing.assert_frame_equal(incremental.student_mastery(game_id), full.student_mastery(game_id))
+    pd.testing.assert_frame_equal(incremental.student_mastery(), full.student_mastery())
+    pd.testing.assert_frame_equal(incremental.game_summary(), full.game_summary())
+
+
+def test_refresh_reads_only_new_results(db_path):
+    stats = TeacherAnalytics(db_path)
+    add_result(db_path, 1, 1, [True, False])
+
+    assert stats.refresh() == 1
+    assert stats.refresh() == 0
+    add_result(db_path, 1, 2, [True])
+    assert stats.refresh() == 1
+    assert stats.student_mastery().loc[1, "games"] == 2
@@ -0,0 +1,216 @@
+"""
+End-to-end generation benchmark against the offline mock LLM.
+
+Builds synthetic PDFs, runs them through load, chunking, generation and
+parsing with the same functions the UI's generation jobs call, but directly:
+the job queue's SQLite bookkeeping (job rows, per-page checkpoints) is not
+measured. Prints one JSON report per run so two commits can be compared:
+
+    python benchmark.py --pages 1 10 100 500 --latency 0.8 --errors rate_limit=0.02 --output bench.json
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+from uuid import UUID
+
+# Every run starts from an empty question cache, outside the app's database
+if "EDUPLAY_DB_PATH" not in os.environ:
+    _directory = tempfile.mkdtemp(prefix="eduplay-bench-")
+    atexit.register(shutil.rmtree, _directory, ignore_errors=True)
+    os.environ["EDUPLAY_DB_PATH"] = os.path.join(_directory, "bench.db")
+
+from fpdf import FPDF
+from langchain.callbacks.base import AsyncCallbackHandler
+
+import qa_llm
+from mock_llm import DEFAULT_LATENCY_SECONDS, DEFAULT_LATENCY_SIGMA, MockLLM, SyntheticResponder, parse_error_rates
+from pdf_to_quizz import load_pages, pages_to_quizz_stream
+from qa_llm import DEFAULT_MODEL, get_engine
+from qcm_chain import DEFAULT_DIFFICULTY
+
+DEFAULT_PAGE_COUNTS = [1, 10, 50, 100, 500]
+# README target: 95% of requests answered in under 2 seconds, checked on each LLM call
+SLO_P95_SECONDS = 2.0
+
+SUBJECTS = ["La fotosíntesis", "La célula", "La independencia del Perú", "El ciclo del agua", "La energía cinética",
+            "El sistema solar", "La Revolución Francesa", "Los ecosistemas", "La tabla periódica", "El teorema de Pitágoras"]
+VERBS = ["explica", "describe", "transforma", "depende de", "se relaciona con", "produce", "requiere", "determina"]
+OBJECTS = ["la energía del sistema", "los procesos de la materia", "la organización social", "el equilibrio natural",
+           "las reacciones químicas", "los movimientos de los planetas", "la estructura de los seres vivos",
+           "el desarrollo histórico de la región", "la distribución del agua", "las propiedades de los elementos"]
+
+def synthetic_page(rng: random.Random, page: int) -> str:
+    subject = rng.choice(SUBJECTS)
+    paragraphs = []
+    # Page density varies like in real documents: some pages are nearly empty
+    for _ in range(rng.choice([1, 2, 3, 4, 6])):
+        sentences = [
+            f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} según el apartado {page}.{k}."
+            for k in range(rng.randint(3, 8))
+        ]
+        paragraphs.append(" ".join(sentences))
+    return f"Capítulo {page}: {subject}\n\n" + "\n\n".join(paragraphs)
+
+def make_synthetic_pdf(path: str, num_pages: int, seed: int = 0) -> str:
+    """Writes a `num_pages` PDF of varied, Spanish-like course text to `path`."""
+    rng = random.Random(f"{seed}:{num_pages}")
+    pdf = FPDF()
+    pdf.set_font("Arial", size=11)
+    for page in range(1, num_pages + 1):
+        pdf.add_page()
+        pdf.multi_cell(0, 6, synthetic_page(rng, page))
+    pdf.output(path)
+    return path
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, None for an empty list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+class CallLatencies(AsyncCallbackHandler):
+    """Wall-clock seconds of every LLM call that got an answer, from request to response."""
+
+    def __init__(self) -> None:
+        self.seconds: List[float] = []
+        self._starts: Dict[UUID, float] = {}
+
+    async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts[run_id] = time.perf_counter()
+
+    async def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        start = self._starts.pop(run_id, None)
+        if start is not None:
+            self.seconds.append(time.perf_counter() - start)
+
+    async def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self._starts.pop(run_id, None)
+
+def peak_rss_mb() -> float:
+    """Process-wide high-water mark, so each run's figure includes the runs before it."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+async def run_pdf(pdf_path: str, output_format: str, num_questions: Optional[int], difficulty: str,
+                  latencies: CallLatencies) -> Dict[str, Any]:
+    llm = get_engine().get_qa_llm(DEFAULT_MODEL).get_llm()
+    calls_before = llm.calls
+    latencies_before = len(latencies.seconds)
+    limiter_before = get_engine().limiter_stats().get(DEFAULT_MODEL, {})
+
+    start = time.perf_counter()
+    pages = load_pages(pdf_path)
+    loaded = time.perf_counter()
+
+    questions, empty_pages = 0, 0
+    async for _, page_questions in pages_to_quizz_stream(pages, output_format, num_questions, difficulty):
+        questions += len(page_questions or [])
+        empty_pages += not page_questions
+    finished = time.perf_counter()
+
+    limiter = get_engine().limiter_stats().get(DEFAULT_MODEL, {})
+    return {
+        "chunks": len(pages),
+        "questions": questions,
+        "empty_chunks": empty_pages,
+        "load_seconds": loaded - start,
+        "generate_seconds": finished - loaded,
+        "total_seconds": finished - start,
+        "call_latencies": latencies.seconds[latencies_before:],
+        "llm_calls": llm.calls - calls_before,
+        "limiter_successes": limiter.get("successes", 0) - limiter_before.get("successes", 0),
+        "limiter_overloads": limiter.get("overloads", 0) - limiter_before.get("overloads", 0),
+        "limiter_window": limiter.get("window"),
+    }
+
+def run_benchmark(page_counts: List[int], responder: SyntheticResponder, output_format: str = "text",
+                  num_questions: Optional[int] = None, difficulty: str = DEFAULT_DIFFICULTY,
+                  seed: int = 0) -> Dict[str, Any]:
+    """Runs one synthetic PDF per page count and returns the JSON-serializable report."""
+    latencies = CallLatencies()
+
+    def benchmark_backend(model_name, temperature, manager):
+        manager.add_handler(latencies)
+        return MockLLM(responder=responder, model_name=model_name, callback_manager=manager)
+
+    qa_llm.register_backend("benchmark", benchmark_backend)
+    qa_llm.LLM_BACKEND = "benchmark"
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="eduplay-bench-pdf-") as directory:
+        for num_pages in page_counts:
+            pdf_path = make_synthetic_pdf(os.path.join(directory, f"synthetic_{num_pages}.pdf"), num_pages, seed)
+            result = asyncio.run(run_pdf(pdf_path, output_format, num_questions, difficulty, latencies))
+            call_latencies = result.pop("call_latencies")
+            p95 = percentile(call_latencies, 95)
+            runs.append({
+                "pages": num_pages,
+                **result,
+                "pages_per_second": num_pages / result["total_seconds"] if result["total_seconds"] else None,
+                "call_latency_p50": percentile(call_latencies, 50),
+                "call_latency_p95": p95,
+                "call_latency_p99": percentile(call_latencies, 99),
+                "slo_p95_met": p95 is not None and p95 < SLO_P95_SECONDS,
+                "peak_rss_mb": peak_rss_mb(),
+            })
+            print(f"{num_pages:>4} pages: {runs[-1]['pages_per_second']:.1f} pages/s, "
+                  f"p95 {p95 or 0:.2f}s, {result['llm_calls']} calls", file=sys.stderr)
+
+    return {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {
+            "latency": responder.latency,
+            "latency_sigma": responder.latency_sigma,
+            "error_rates": responder.error_rates,
+            "seed": seed,
+            "output_format": output_format,
+            "num_questions": num_questions,
+            "difficulty": difficulty,
+        },
+        "runs": runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark PDF question generation against the mock LLM.")
+    parser.add_argument("--pages", type=int, nargs="+", default=DEFAULT_PAGE_COUNTS)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY_SECONDS, help="median seconds per LLM call")
+    parser.add_argument("--latency-sigma", type=float, default=DEFAULT_LATENCY_SIGMA)
+    parser.add_argument("--errors", default="", help="e.g. rate_limit=0.05,server_error=0.01")
+    parser.add_argument("--format", choices=["text", "json"], default="text")
+    parser.add_argument("--questions", type=int, default=None, help="question budget per PDF (default 2 per page)")
+    parser.add_argument("--difficulty", default=DEFAULT_DIFFICULTY)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    responder = SyntheticResponder(args.latency, args.latency_sigma, parse_error_rates(args.errors), args.seed)
+    report = run_benchmark(args.pages, responder, args.format, args.questions, args.difficulty, args.seed)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
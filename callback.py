@@ -1,123 +1,82 @@
-from langchain.callbacks.base import BaseCallbackHandler
-from pydantic import BaseModel
+import logging
+import os
+import random
+import time
 from typing import Any, Dict, List, Union
-from langchain.schema import AgentAction, AgentFinish, LLMResult
+from uuid import UUID
 
-class BaseMyCallbackHandler(BaseModel):
-    """Base fake callback handler for testing."""
+from langchain.callbacks.base import AsyncCallbackHandler
+from langchain.schema import LLMResult
 
-    starts: int = 0
-    ends: int = 0
-    errors: int = 0
-    text: int = 0
-    ignore_llm_: bool = False
-    ignore_chain_: bool = False
-    ignore_agent_: bool = False
-    always_verbose_: bool = False
+from metrics import TOKEN_BUCKETS, cost_usd, get_metrics, page_ids, upload_id
+from usage import get_usage_tracker
 
-    @property
-    def always_verbose(self) -> bool:
-        """Whether to call verbose callbacks even if verbose is False."""
-        return True
+logger = logging.getLogger(__name__)
 
-    @property
-    def ignore_llm(self) -> bool:
-        """Whether to ignore LLM callbacks."""
-        return self.ignore_llm_
+# Fraction of LLM calls whose prompt and answer are logged at DEBUG level
+LOG_SAMPLE_RATE = float(os.environ.get("EDUPLAY_LOG_SAMPLE_RATE", "0.01"))
 
-    @property
-    def ignore_chain(self) -> bool:
-        """Whether to ignore chain callbacks."""
-        return self.ignore_chain_
+class MetricsCallbackHandler(AsyncCallbackHandler):
+    """
+    Records latency, tokens, cost and errors of every LLM call into the
+    metrics registry, tagged with the upload and pages it was made for, and
+    adds its tokens and cost to the upload's usage accounting.
 
-    @property
-    def ignore_agent(self) -> bool:
-        """Whether to ignore agent callbacks."""
-        return self.ignore_agent_
+    Async so that it runs in the calling task and sees its correlation
+    context variables; langchain runs sync handlers in a thread pool.
+    """
 
-    # add finer-grained counters for easier debugging of failing tests
-    chain_starts: int = 0
-    chain_ends: int = 0
-    llm_starts: int = 0
-    llm_ends: int = 0
-    llm_streams: int = 0
-    tool_starts: int = 0
-    tool_ends: int = 0
-    agent_ends: int = 0
+    def __init__(self, model_name: str, sample_rate: float = LOG_SAMPLE_RATE) -> None:
+        self.model_name = model_name
+        self.sample_rate = sample_rate
+        self.metrics = get_metrics()
+        self._runs: Dict[UUID, Dict[str, Any]] = {}
 
-class MyCallbackHandler(BaseMyCallbackHandler, BaseCallbackHandler):
-    """Fake callback handler for testing."""
-
-    def on_llm_start(
-        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+    async def on_llm_start(
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any
     ) -> None:
         """Run when LLM starts running."""
-        self.llm_starts += 1
-        self.starts += 1
-        print(prompts[0])
-
-    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
-        """Run when LLM generates a new token."""
-        self.llm_streams += 1
-
-    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self._runs[run_id] = {
+            "start": time.monotonic(),
+            "prompts": prompts,
+            "sampled": random.random() < self.sample_rate,
+        }
+        self.metrics.inc("llm_calls_started_total", model=self.model_name)
+
+    async def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
         """Run when LLM ends running."""
-        print(response)
-        self.llm_ends += 1
-        self.ends += 1
-
-    def on_llm_error(
-        self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any
+        run = self._runs.pop(run_id, None)
+        latency = time.monotonic() - run["start"] if run else 0.0
+        usage = (response.llm_output or {}).get("token_usage", {})
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+        cost = cost_usd(self.model_name, prompt_tokens, completion_tokens)
+
+        self.metrics.inc("llm_calls_total", model=self.model_name, status="ok")
+        self.metrics.observe("llm_latency_seconds", latency, model=self.model_name)
+        self.metrics.observe("llm_prompt_tokens", prompt_tokens, TOKEN_BUCKETS, model=self.model_name)
+        self.metrics.observe("llm_completion_tokens", completion_tokens, TOKEN_BUCKETS, model=self.model_name)
+        self.metrics.inc("llm_tokens_total", prompt_tokens, model=self.model_name, kind="prompt")
+        self.metrics.inc("llm_tokens_total", completion_tokens, model=self.model_name, kind="completion")
+        self.metrics.inc("llm_cost_usd_total", cost, model=self.model_name)
+        if upload_id.get() is not None:
+            get_usage_tracker().record(upload_id.get(), prompt_tokens, completion_tokens, cost)
+
+        logger.debug("llm call upload=%s pages=%s latency=%.2fs tokens=%d/%d cost=$%.5f", upload_id.get(),
+                     list(page_ids.get()), latency, prompt_tokens, completion_tokens, cost)
+        if run and run["sampled"]:
+            logger.debug("llm call upload=%s pages=%s prompt=%r answer=%r", upload_id.get(), list(page_ids.get()),
+                         run["prompts"][0], response.generations[0][0].text if response.generations else "")
+
+    async def on_llm_error(
+        self, error: Union[Exception, KeyboardInterrupt], *, run_id: UUID, **kwargs: Any
     ) -> None:
         """Run when LLM errors."""
-        self.errors += 1
-
-    def on_chain_start(
-        self, serialized: Dict[str, Any], inputs: Dict[str, Any], **kwargs: Any
-    ) -> None:
-        """Run when chain starts running."""
-        self.chain_starts += 1
-        self.starts += 1
-
-    def on_chain_end(self, outputs: Dict[str, Any], **kwargs: Any) -> None:
-        """Run when chain ends running."""
-        self.chain_ends += 1
-        self.ends += 1
-
-    def on_chain_error(
-        self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any
-    ) -> None:
-        """Run when chain errors."""
-        self.errors += 1
-
-    def on_tool_start(
-        self, serialized: Dict[str, Any], input_str: str, **kwargs: Any
-    ) -> None:
-        """Run when tool starts running."""
-        self.tool_starts += 1
-        self.starts += 1
-
-    def on_tool_end(self, output: str, **kwargs: Any) -> None:
-        """Run when tool ends running."""
-        self.tool_ends += 1
-        self.ends += 1
-
-    def on_tool_error(
-        self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any
-    ) -> None:
-        """Run when tool errors."""
-        self.errors += 1
-
-    def on_text(self, text: str, **kwargs: Any) -> None:
-        """Run when agent is ending."""
-        self.text += 1
-
-    def on_agent_finish(self, finish: AgentFinish, **kwargs: Any) -> None:
-        """Run when agent ends running."""
-        self.agent_ends += 1
-        self.ends += 1
-
-    def on_agent_action(self, action: AgentAction, **kwargs: Any) -> Any:
-        """Run on agent action."""
-        self.tool_starts += 1
-        self.starts += 1
+        run = self._runs.pop(run_id, None)
+        error_type = type(error).__name__
+        self.metrics.inc("llm_calls_total", model=self.model_name, status="error")
+        self.metrics.inc("llm_errors_total", model=self.model_name, error=error_type)
+        if run:
+            self.metrics.observe("llm_error_latency_seconds", time.monotonic() - run["start"], model=self.model_name)
+        logger.warning("llm call failed upload=%s pages=%s error=%s: %s", upload_id.get(), list(page_ids.get()),
+                       error_type, error)
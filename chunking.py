@@ -0,0 +1,122 @@
+"""Token-aware chunking of document pages before question generation."""
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, List
+
+from qa_llm import DEFAULT_MODEL
+
+# Pages below MIN_CHUNK_TOKENS are merged with their neighbours, chunks above
+# MAX_CHUNK_TOKENS are split on paragraph boundaries, and pages with fewer
+# than SKIP_BELOW_TOKENS of text (blank scans, a lone page number) are dropped.
+# Short pages such as slides are merged, never dropped for being short.
+MIN_CHUNK_TOKENS = 300
+MAX_CHUNK_TOKENS = 1500
+SKIP_BELOW_TOKENS = 8
+
+BOILERPLATE_HEADINGS = re.compile(
+    r"^\s*(índice|indice|contenido|tabla de contenidos?|table of contents|contents|"
+    r"bibliografía|bibliografia|referencias( bibliográficas)?|references|bibliography|"
+    r"índice alfabético|index)\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+TOC_LINE = re.compile(r"(\.{3,}|…+|\s{3,})\s*\d{1,4}\s*$")
+REFERENCE_LINE = re.compile(r"^\s*(\[\d+\]|\d+\.\s+[A-ZÁÉÍÓÚ][^,]+,|[A-ZÁÉÍÓÚ][\w'-]+,\s+[A-Z]\.).*\b(1[89]|20)\d{2}\b")
+
+@lru_cache(maxsize=None)
+def _get_encoding(model_name: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken downloads its BPE files on first use; offline we estimate instead
+        return None
+
+def count_tokens(text: str, model_name: str = DEFAULT_MODEL) -> int:
+    """Counts tokens with tiktoken when installed, otherwise estimates ~4 characters per token."""
+    encoding = _get_encoding(model_name)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+def is_boilerplate(text: str, model_name: str = DEFAULT_MODEL) -> bool:
+    """Near-empty pages, tables of contents and reference lists."""
+    if count_tokens(text, model_name) < SKIP_BELOW_TOKENS:
+        return True
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return True
+    toc_lines = sum(1 for line in lines if TOC_LINE.search(line))
+    reference_lines = sum(1 for line in lines if REFERENCE_LINE.search(line))
+    if BOILERPLATE_HEADINGS.search("\n".join(lines[:3])) and (toc_lines + reference_lines) * 3 >= len(lines):
+        return True
+    # Without a heading, require a clear majority of TOC or reference lines
+    return toc_lines * 2 > len(lines) or reference_lines * 2 > len(lines)
+
+def _split_units(text: str) -> List[str]:
+    """Splits text into the coarsest units available: paragraphs, then lines, then sentences."""
+    for pattern in (r"\n\s*\n", r"\n", r"(?<=[.!?;:])\s+"):
+        units = [unit.strip() for unit in re.split(pattern, text) if unit.strip()]
+        if len(units) > 1:
+            return units
+    return text.split()
+
+def split_oversized(text: str, max_tokens: int = MAX_CHUNK_TOKENS, model_name: str = DEFAULT_MODEL) -> List[str]:
+    """Splits text above `max_tokens` on paragraph boundaries, going finer only when needed."""
+    if count_tokens(text, model_name) <= max_tokens:
+        return [text]
+    units = _split_units(text)
+    if len(units) == 1:
+        return units
+
+    chunks, current, current_tokens = [], [], 0
+    for unit in units:
+        unit_tokens = count_tokens(unit, model_name)
+        if unit_tokens > max_tokens:
+            if current:
+                chunks.append("\n\n".join(current))
+                current, current_tokens = [], 0
+            chunks.extend(split_oversized(unit, max_tokens, model_name))
+            continue
+        if current and current_tokens + unit_tokens > max_tokens:
+            chunks.append("\n\n".join(current))
+            current, current_tokens = [], 0
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+def iter_chunks(pages: Iterable[str], min_tokens: int = MIN_CHUNK_TOKENS, max_tokens: int = MAX_CHUNK_TOKENS,
+                model_name: str = DEFAULT_MODEL) -> Iterator[str]:
+    """
+    Turns page texts into generation chunks: merges small adjacent pages,
+    splits oversized ones and skips only near-empty, table of contents and
+    bibliography pages. Pages are consumed lazily, so chunks are produced
+    while later pages are still being extracted.
+    """
+    pending, pending_tokens = [], 0
+    for page in pages:
+        if is_boilerplate(page, model_name):
+            continue
+        for piece in split_oversized(page.strip(), max_tokens, model_name):
+            piece_tokens = count_tokens(piece, model_name)
+            if pending and pending_tokens + piece_tokens > max_tokens:
+                yield "\n\n".join(pending)
+                pending, pending_tokens = [], 0
+            pending.append(piece)
+            pending_tokens += piece_tokens
+            if pending_tokens >= min_tokens:
+                yield "\n\n".join(pending)
+                pending, pending_tokens = [], 0
+    if pending:
+        yield "\n\n".join(pending)
+
+def chunk_pages(pages: Iterable[str], min_tokens: int = MIN_CHUNK_TOKENS, max_tokens: int = MAX_CHUNK_TOKENS,
+                model_name: str = DEFAULT_MODEL) -> List[str]:
+    return list(iter_chunks(pages, min_tokens, max_tokens, model_name))
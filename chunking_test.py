@@ -0,0 +1,63 @@
+from chunking import MAX_CHUNK_TOKENS, chunk_pages, count_tokens, is_boilerplate, iter_chunks
+
+SLIDES = [
+    f"Diapositiva {i}: La fotosíntesis convierte luz en energía química en los cloroplastos de las hojas."
+    for i in range(20)
+]
+
+TOC = """Índice
+1. Introducción ........................ 1
+2. La célula ........................... 5
+3. La fotosíntesis ..................... 12
+4. La respiración celular .............. 20"""
+
+BIBLIOGRAPHY = """Bibliografía
+Campbell, N. Biología. Editorial Médica Panamericana, 2007.
+Alberts, B. Biología molecular de la célula. Omega, 2010.
+Curtis, H. Invitación a la biología. Panamericana, 2015."""
+
+
+def test_short_adjacent_pages_are_merged_not_dropped():
+    chunks = chunk_pages(SLIDES)
+
+    assert 0 < len(chunks) < len(SLIDES)
+    merged = "\n\n".join(chunks)
+    for slide in SLIDES:
+        assert slide in merged
+
+
+def test_near_empty_pages_are_skipped():
+    assert is_boilerplate("12")
+    assert is_boilerplate("   \n\n  ")
+    assert chunk_pages(["", "3", SLIDES[0]]) == [SLIDES[0]]
+
+
+def test_toc_and_bibliography_pages_are_skipped():
+    assert is_boilerplate(TOC)
+    assert is_boilerplate(BIBLIOGRAPHY)
+    assert not is_boilerplate(SLIDES[0])
+    assert chunk_pages([TOC, SLIDES[0], BIBLIOGRAPHY]) == [SLIDES[0]]
+
+
+def test_oversized_pages_are_split_on_paragraphs():
+    paragraph = "La mitocondria produce energía a partir de la glucosa mediante la respiración celular. " * 20
+    page = "\n\n".join([paragraph] * 10)
+
+    chunks = chunk_pages([page])
+
+    assert len(chunks) > 1
+    assert all(count_tokens(chunk) <= MAX_CHUNK_TOKENS for chunk in chunks)
+
+
+def test_pages_are_consumed_lazily():
+    consumed = []
+
+    def pages():
+        for slide in SLIDES * 5:
+            consumed.append(slide)
+            yield slide
+
+    first = next(iter_chunks(pages()))
+
+    assert first
+    assert len(consumed) < len(SLIDES) * 5
@@ -0,0 +1,17 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+# Set before any app module is imported: tests never touch eduplay.db, the
+# data directory or the OpenAI API
+_directory = tempfile.mkdtemp(prefix="eduplay-tests-")
+atexit.register(shutil.rmtree, _directory, ignore_errors=True)
+os.environ["EDUPLAY_DB_PATH"] = os.path.join(_directory, "eduplay.db")
+os.environ["EDUPLAY_RESULTS_JOURNAL"] = os.path.join(_directory, "game_results.journal")
+os.environ["EDUPLAY_UPLOADS_DIR"] = os.path.join(_directory, "uploads")
+os.environ["EDUPLAY_LLM_BACKEND"] = "mock"
+os.environ["EDUPLAY_MOCK_LATENCY"] = "0.01"
+os.environ.pop("EDUPLAY_MOCK_ERRORS", None)
+os.environ.pop("EDUPLAY_METRICS_PORT", None)
+os.environ.pop("EDUPLAY_METRICS_DUMP_PATH", None)
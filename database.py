@@ -0,0 +1,41 @@
+"""
+Acceso compartido a la base de datos SQLite de EduPlay
+"""
+import os
+import sqlite3
+import threading
+
+from migrations import migrate
+
+DB_PATH = os.environ.get("EDUPLAY_DB_PATH", "eduplay.db")
+
+_local = threading.local()
+# Bases de datos ya migradas por este proceso
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+def get_connection(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Retorna la conexión del hilo actual a `db_path`, creándola la primera vez.
+    Las conexiones de sqlite3 no deben compartirse entre hilos, así que cada
+    hilo (sesión de Streamlit, worker) reutiliza la suya. La primera conexión
+    del proceso a una base de datos le aplica las migraciones pendientes.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        # WAL permite lectores concurrentes mientras otro hilo escribe
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+        with _migrate_lock:
+            if db_path not in _migrated:
+                migrate(conn)
+                _migrated.add(db_path)
+        connections[db_path] = conn
+    return conn
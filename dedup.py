@@ -0,0 +1,93 @@
+"""Near-duplicate detection of generated questions with shingled MinHash and LSH banding."""
+import re
+import unicodedata
+import zlib
+from typing import Any, Dict, Iterable, List, Set
+
+import numpy as np
+
+SHINGLE_CHARS = 5
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: pairs above ~0.5 Jaccard share a band with high probability
+BANDS = 16
+# Candidates sharing a band are duplicates from this shingle Jaccard similarity
+# of their stems, provided their correct answers match too
+DUPLICATE_THRESHOLD = 0.6
+# Correct answers match from this similarity: short answers ("46", "1914")
+# are a single shingle, so they must be equal
+ANSWER_THRESHOLD = 0.8
+
+MERSENNE_PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(1)
+PERMUTATION_A = _rng.randint(1, 1 << 31, NUM_PERMUTATIONS).astype(np.uint64)
+PERMUTATION_B = _rng.randint(0, 1 << 31, NUM_PERMUTATIONS).astype(np.uint64)
+
+def question_text(question: Dict[str, Any]) -> str:
+    """The stem, what near-duplicates are looked up by."""
+    return question.get("question", "")
+
+def answer_text(question: Dict[str, Any]) -> str:
+    """The correct answer: similar stems asking for different answers are different questions."""
+    return question.get(question.get("reponse", ""), "")
+
+def similar(a: Set[int], b: Set[int], threshold: float) -> bool:
+    """Whether the Jaccard similarity of two shingle sets reaches `threshold`."""
+    return len(a & b) >= threshold * len(a | b)
+
+def shingles(text: str, size: int = SHINGLE_CHARS) -> Set[int]:
+    """Hashed character shingles of the accent-, case- and punctuation-insensitive text."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = " ".join(re.findall(r"[^\W_]+", "".join(c for c in text if not unicodedata.combining(c))))
+    if len(text) <= size:
+        return {zlib.crc32(text.encode("utf-8"))}
+    return {zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)}
+
+def minhash(hashes: Set[int]) -> np.ndarray:
+    """NUM_PERMUTATIONS minimums of (a * x + b) mod p over the shingle hashes, vectorized."""
+    values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    # a, b < 2^31 and x < 2^32, so a * x + b fits in 64 bits
+    return ((np.outer(PERMUTATION_A, values) + PERMUTATION_B[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+
+class QuestionDeduplicator():
+    """
+    Keeps the first of every group of near-duplicate questions seen so far:
+    nearly the same stem and the same correct answer, whatever the
+    distractors. "¿... diploide? 46" and "¿... haploide? 23" are both kept.
+    Each question is hashed once and compared only with the questions sharing
+    one of its LSH bands, so deduplicating a document is roughly linear in
+    its number of questions.
+    """
+
+    def __init__(self, threshold: float = DUPLICATE_THRESHOLD, bands: int = BANDS) -> None:
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERMUTATIONS // bands
+        self._shingles: List[Set[int]] = []
+        self._answers: List[Set[int]] = []
+        self._buckets: Dict[Any, List[int]] = {}
+        self.duplicates = 0
+
+    def add(self, question: Dict[str, Any]) -> bool:
+        """Remembers the question and returns True, or returns False if it duplicates a kept one."""
+        hashes = shingles(question_text(question))
+        answer = shingles(answer_text(question))
+        signature = minhash(hashes)
+        keys = [(band, signature[band * self.rows:(band + 1) * self.rows].tobytes()) for band in range(self.bands)]
+
+        candidates = {i for key in keys for i in self._buckets.get(key, ())}
+        for i in candidates:
+            if similar(hashes, self._shingles[i], self.threshold) and similar(answer, self._answers[i], ANSWER_THRESHOLD):
+                self.duplicates += 1
+                return False
+
+        index = len(self._shingles)
+        self._shingles.append(hashes)
+        self._answers.append(answer)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(index)
+        return True
+
+    def filter(self, questions: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """The questions that are not near-duplicates of any question seen before, in order."""
+        return [question for question in questions if self.add(question)]
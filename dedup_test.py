@@ -0,0 +1,64 @@
+from dedup import QuestionDeduplicator, shingles
+
+
+def question(text, answer="La mitocondria", reponse="B"):
+    options = {"A": "El núcleo", "B": "La mitocondria", "C": "El ribosoma", "D": "La vacuola"}
+    options[reponse] = answer
+    return {"question": text, **options, "reponse": reponse}
+
+
+def test_shingles_ignore_case_accents_and_punctuation():
+    assert shingles("¿Qué orgánulo produce ENERGÍA?") == shingles("que organulo produce energia")
+
+
+def test_near_duplicates_are_dropped():
+    dedup = QuestionDeduplicator()
+    questions = [
+        question("¿Qué orgánulo de la célula produce la mayor parte de su energía?"),
+        # The same question from an overlapping page, reworded slightly and with other distractors
+        {**question("¿Qué orgánulo de la célula produce la mayor parte de la energía?"), "A": "El aparato de Golgi"},
+        question("¿Qué orgánulo de la celula produce la mayor parte de su energia"),
+        question("¿Dónde se almacena la información genética de la célula?", "El núcleo", "A"),
+    ]
+
+    kept = dedup.filter(questions)
+
+    assert kept == [questions[0], questions[3]]
+    assert dedup.duplicates == 2
+
+
+def test_distinct_questions_are_kept():
+    dedup = QuestionDeduplicator()
+    questions = [
+        question("¿Qué orgánulo de la célula produce la mayor parte de su energía?"),
+        question("¿Dónde se almacena la información genética de la célula?", "El núcleo", "A"),
+        question("¿Qué gas liberan las plantas durante la fotosíntesis?", "Oxígeno"),
+        question("¿En qué fase de la mitosis se separan las cromátidas hermanas?", "Anafase", "C"),
+        question("¿Cuántos cromosomas tiene una célula humana diploide?", "46", "D"),
+        question("¿Qué molécula transporta los aminoácidos al ribosoma?", "El ARN de transferencia"),
+    ]
+
+    assert dedup.filter(questions) == questions
+    assert dedup.duplicates == 0
+
+
+def test_similar_stems_with_different_answers_are_kept():
+    dedup = QuestionDeduplicator()
+    questions = [
+        question("¿Cuántos cromosomas tiene una célula humana diploide?", "46"),
+        question("¿Cuántos cromosomas tiene una célula humana haploide?", "23"),
+        question("¿En qué año comenzó la Primera Guerra Mundial?", "1914", "C"),
+        question("¿En qué año terminó la Primera Guerra Mundial?", "1918", "C"),
+    ]
+
+    assert dedup.filter(questions) == questions
+    # The same stem and answer is still a duplicate, however the answer is written
+    assert dedup.filter([question("¿Cuántos cromosomas tiene una célula humana diploide?", " 46.", "A")]) == []
+
+
+def test_questions_seen_in_an_earlier_call_are_remembered():
+    dedup = QuestionDeduplicator()
+    first = question("¿Qué orgánulo de la célula produce la mayor parte de su energía?")
+
+    assert dedup.filter([first]) == [first]
+    assert dedup.filter([dict(first)]) == []
@@ -0,0 +1,158 @@
+"""Registry of document extractors yielding normalized text segments lazily, one per page, slide or section."""
+import io
+import os
+import re
+import unicodedata
+import zipfile
+from typing import Any, Callable, Dict, Iterator, Optional
+from xml.etree import ElementTree
+
+from pdf_extract import count_pdf_pages, iter_pdf_pages
+
+# Plain text has no pages: paragraphs are grouped into segments of about this size
+TEXT_SEGMENT_CHARS = 3000
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DRAWING_NS = "{http://schemas.openxmlformats.org/drawingml/2006/main}"
+SLIDE_PATH = re.compile(r"^ppt/slides/slide(\d+)\.xml$")
+
+def normalize_segment(text: str) -> str:
+    """NFKC (ligatures, full-width forms), no NULs or trailing spaces, at most one blank line in a row."""
+    text = unicodedata.normalize("NFKC", text).replace("\x00", "")
+    text = re.sub(r"[ \t]+\n", "\n", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+def _binary(source: Any):
+    """Opens a path, or rewinds an already open binary file object."""
+    if isinstance(source, (str, os.PathLike)):
+        return open(source, "rb")
+    source.seek(0)
+    return source
+
+def iter_text_segments(source: Any, segment_chars: int = TEXT_SEGMENT_CHARS) -> Iterator[str]:
+    """Reads the text line by line and yields paragraphs grouped up to `segment_chars`."""
+    stream = io.TextIOWrapper(_binary(source), encoding="utf-8-sig", errors="replace")
+    try:
+        segment, size = [], 0
+        for line in stream:
+            segment.append(line)
+            size += len(line)
+            # Cut on a blank line (or a form feed) once the segment is big enough
+            if size >= segment_chars and (not line.strip() or "\f" in line):
+                yield "".join(segment)
+                segment, size = [], 0
+        if segment:
+            yield "".join(segment)
+    finally:
+        if isinstance(source, (str, os.PathLike)):
+            stream.close()
+        else:
+            # Do not close the caller's file object along with the wrapper
+            stream.detach()
+
+def iter_docx_segments(source: Any) -> Iterator[str]:
+    """
+    Streams word/document.xml and yields the text between explicit page
+    breaks, with one line per paragraph. Tables contribute their cell text.
+    """
+    with zipfile.ZipFile(_binary(source)) as archive, archive.open("word/document.xml") as document:
+        paragraphs, current = [], []
+        for event, element in ElementTree.iterparse(document, events=("end",)):
+            tag = element.tag
+            if tag == f"{WORD_NS}t":
+                current.append(element.text or "")
+            elif tag == f"{WORD_NS}tab":
+                current.append("\t")
+            elif tag == f"{WORD_NS}br" and element.get(f"{WORD_NS}type") == "page":
+                paragraphs.append("".join(current))
+                current = []
+                yield "\n".join(paragraphs)
+                paragraphs = []
+            elif tag == f"{WORD_NS}p":
+                paragraphs.append("".join(current))
+                current = []
+                element.clear()
+        if paragraphs:
+            yield "\n".join(paragraphs)
+
+def iter_pptx_segments(source: Any) -> Iterator[str]:
+    """Reads each slide's XML straight from the archive, in slide order, one segment per slide."""
+    with zipfile.ZipFile(_binary(source)) as archive:
+        slides = sorted(
+            (int(match.group(1)), name) for name in archive.namelist() if (match := SLIDE_PATH.match(name))
+        )
+        for _, name in slides:
+            with archive.open(name) as slide:
+                paragraphs = []
+                for _, element in ElementTree.iterparse(slide, events=("end",)):
+                    if element.tag == f"{DRAWING_NS}p":
+                        paragraphs.append("".join(t.text or "" for t in element.iter(f"{DRAWING_NS}t")))
+                        element.clear()
+            yield "\n".join(paragraphs)
+
+def count_pptx_slides(source: Any) -> int:
+    """Number of slides, from the archive's directory alone."""
+    with zipfile.ZipFile(_binary(source)) as archive:
+        return sum(1 for name in archive.namelist() if SLIDE_PATH.match(name))
+
+EXTRACTORS: Dict[str, Callable[[Any], Iterator[str]]] = {
+    "pdf": iter_pdf_pages,
+    "docx": iter_docx_segments,
+    "pptx": iter_pptx_segments,
+    "txt": iter_text_segments,
+}
+
+# Formats whose number of segments is known before extracting them; docx page
+# breaks and text paragraphs are only found by reading the whole document
+SEGMENT_COUNTERS: Dict[str, Callable[[Any], int]] = {
+    "pdf": count_pdf_pages,
+    "pptx": count_pptx_slides,
+}
+
+def register_extractor(extension: str, extractor: Callable[[Any], Iterator[str]],
+                       counter: Optional[Callable[[Any], int]] = None) -> None:
+    """
+    Adds or replaces the extractor of a file extension; it gets a path or a
+    binary file object. `counter` returns the number of segments the
+    extractor yields, when that is cheap to know up front.
+    """
+    extension = extension.lower().lstrip(".")
+    EXTRACTORS[extension] = extractor
+    if counter is None:
+        SEGMENT_COUNTERS.pop(extension, None)
+    else:
+        SEGMENT_COUNTERS[extension] = counter
+
+def supported_extensions():
+    return sorted(EXTRACTORS)
+
+def _extension(source: Any, extension: Optional[str]) -> str:
+    if extension is None:
+        extension = os.path.splitext(source if isinstance(source, (str, os.PathLike)) else source.name)[1]
+    return extension.lower().lstrip(".")
+
+def count_segments(source: Any, extension: Optional[str] = None) -> Optional[int]:
+    """
+    Number of segments iter_segments reads from the document (pages, slides),
+    without extracting them; None for formats where only reading it tells.
+    """
+    counter = SEGMENT_COUNTERS.get(_extension(source, extension))
+    return counter(source) if counter is not None else None
+
+def iter_segments(source: Any, extension: Optional[str] = None,
+                  on_read: Optional[Callable[[], None]] = None) -> Iterator[str]:
+    """
+    Yields the normalized text segments of a document, lazily, so they can be
+    chunked while the rest is still being read. `extension` defaults to the
+    path's; file objects (uploads) must give it or have a `name`. `on_read`
+    is called for every segment read, with or without text (see count_segments).
+    """
+    extension = _extension(source, extension)
+    if extension not in EXTRACTORS:
+        raise ValueError(f"Unsupported document format: {extension}")
+    for segment in EXTRACTORS[extension](source):
+        if on_read is not None:
+            on_read()
+        segment = normalize_segment(segment)
+        if segment:
+            yield segment
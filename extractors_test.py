@@ -0,0 +1,99 @@
+import io
+import zipfile
+
+import pytest
+
+from chunking import chunk_pages
+from extractors import count_segments, iter_segments, normalize_segment
+
+SLIDE_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<p:sld xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"
+       xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main">
+  <p:cSld><p:spTree><p:sp><p:txBody>
+    <a:p><a:r><a:t>{title}</a:t></a:r></a:p>
+    <a:p><a:r><a:t>{body}</a:t></a:r><a:r><a:t> {more}</a:t></a:r></a:p>
+  </p:txBody></p:sp></p:spTree></p:cSld>
+</p:sld>"""
+
+DOCUMENT_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>
+  <w:p><w:r><w:t>Capítulo 1</w:t></w:r></w:p>
+  <w:p><w:r><w:t>La célula es la unidad básica de la vida.</w:t></w:r><w:r><w:br w:type="page"/></w:r></w:p>
+  <w:p><w:r><w:t>Capítulo 2</w:t></w:r></w:p>
+</w:body></w:document>"""
+
+
+def make_pptx(slides):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("[Content_Types].xml", "<Types/>")
+        # Written out of order: slides are read by number, not by archive position
+        for number, (title, body) in reversed(list(enumerate(slides, 1))):
+            archive.writestr(f"ppt/slides/slide{number}.xml",
+                             SLIDE_XML.format(title=title, body=body, more="Es un proceso esencial."))
+    buffer.name = "clase.pptx"
+    return buffer
+
+
+def make_docx():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("word/document.xml", DOCUMENT_XML)
+    buffer.name = "apuntes.docx"
+    return buffer
+
+
+def test_pptx_yields_one_segment_per_slide_in_order():
+    slides = [(f"Diapositiva {i}", f"La fotosíntesis ocurre en los cloroplastos, parte {i}.") for i in range(1, 12)]
+
+    segments = list(iter_segments(make_pptx(slides)))
+
+    assert len(segments) == len(slides)
+    assert segments[0] == "Diapositiva 1\nLa fotosíntesis ocurre en los cloroplastos, parte 1. Es un proceso esencial."
+    assert segments[-1].startswith("Diapositiva 11\n")
+
+
+def test_multi_slide_pptx_produces_chunks():
+    slides = [(f"Diapositiva {i}", f"La fotosíntesis convierte luz en energía química, parte {i}.") for i in range(1, 21)]
+
+    chunks = chunk_pages(iter_segments(make_pptx(slides)))
+
+    assert chunks
+    assert all(chunk.strip() for chunk in chunks)
+    assert "Diapositiva 20" in chunks[-1]
+
+
+def test_segments_are_counted_without_extracting_them():
+    deck = make_pptx([(f"Diapositiva {i}", "Texto.") for i in range(1, 8)])
+    read = []
+
+    assert count_segments(deck) == 7
+    assert len(list(iter_segments(deck, on_read=lambda: read.append(1)))) == 7
+    assert len(read) == 7
+    assert count_segments(make_docx()) is None
+
+
+def test_docx_is_split_on_page_breaks():
+    segments = list(iter_segments(make_docx()))
+
+    assert segments == ["Capítulo 1\nLa célula es la unidad básica de la vida.", "Capítulo 2"]
+
+
+def test_txt_is_grouped_by_paragraphs():
+    text = ("Primer párrafo sobre la célula.\n\n" * 200).encode("utf-8")
+    upload = io.BytesIO(text)
+    upload.name = "notas.txt"
+
+    segments = list(iter_segments(upload))
+
+    assert len(segments) > 1
+    assert "".join(segment + "\n\n" for segment in segments).count("Primer párrafo") == 200
+
+
+def test_unsupported_extension_is_rejected():
+    with pytest.raises(ValueError):
+        list(iter_segments(io.BytesIO(b""), "odt"))
+
+
+def test_normalize_segment():
+    assert normalize_segment("ﬁbra\x00  \n\n\n\nfin  ") == "fibra\n\nfin"
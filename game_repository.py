@@ -0,0 +1,102 @@
+"""
+Repositorio de juegos sobre la tabla games de eduplay.db
+"""
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+from database import DB_PATH, get_connection
+
+# Todo menos las preguntas: la biblioteca no las carga hasta abrir un juego
+SUMMARY_COLUMNS = (
+    "id, title, subject, difficulty, game_mode, filename, total_questions, best_score, "
+    "total_plays AS times_played, avg_score, created_by, substr(created_at, 1, 16) AS created_at"
+)
+
+INSERT_GAME = """
+INSERT INTO games (title, subject, difficulty, game_mode, questions, filename, total_questions, created_by)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SELECT_GAME = f"SELECT {SUMMARY_COLUMNS} FROM games WHERE id = ?"
+LIST_GAMES = f"""
+SELECT {SUMMARY_COLUMNS} FROM games
+WHERE is_active AND created_by IS ?
+ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?
+"""
+SELECT_QUESTIONS = "SELECT questions FROM games WHERE id = ?"
+UPDATE_QUESTIONS = """
+UPDATE games SET questions = ?, total_questions = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?
+"""
+# El promedio se actualiza de forma incremental con el total anterior de partidas
+RECORD_PLAY = """
+UPDATE games SET
+    avg_score = (avg_score * total_plays + ?) / (total_plays + 1),
+    total_plays = total_plays + 1,
+    best_score = MAX(best_score, ?)
+WHERE id = ?
+"""
+
+
+class GameRepository():
+    """
+    Juegos guardados en eduplay.db, compartidos entre sesiones y recargas.
+
+    Cada hilo usa su propia conexión (ver database.get_connection) en modo WAL;
+    las consultas son constantes con parámetros, así que sqlite3 reutiliza sus
+    sentencias preparadas. Los listados no traen las preguntas, que se leen
+    solo al abrir un juego, para que la memoria no crezca con la biblioteca.
+    """
+
+    def __init__(self, db_path: str = DB_PATH) -> None:
+        self.db_path = db_path
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def create_game(self, title: str, subject: str, difficulty: str, game_mode: str, questions: List[Dict[str, Any]],
+                    filename: Optional[str] = None, created_by: Optional[int] = None) -> Dict[str, Any]:
+        """Guarda un juego nuevo y retorna su resumen, con el id asignado por la base de datos"""
+        with self._conn() as conn:
+            cursor = conn.execute(INSERT_GAME, (
+                title, subject, difficulty, game_mode, json.dumps(questions, ensure_ascii=False),
+                filename, len(questions), created_by,
+            ))
+        return self.get_game(cursor.lastrowid)
+
+    def get_game(self, game_id: int) -> Optional[Dict[str, Any]]:
+        """Resumen de un juego, sin sus preguntas"""
+        row = self._conn().execute(SELECT_GAME, (game_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_games(self, created_by: Optional[int] = None, limit: int = -1, offset: int = 0) -> List[Dict[str, Any]]:
+        """Resúmenes de los juegos de un usuario, del más reciente al más antiguo"""
+        return [dict(row) for row in self._conn().execute(LIST_GAMES, (created_by, limit, offset))]
+
+    def get_questions(self, game_id: int) -> List[Dict[str, Any]]:
+        """Preguntas de un juego, o una lista vacía si el juego no existe"""
+        row = self._conn().execute(SELECT_QUESTIONS, (game_id,)).fetchone()
+        return json.loads(row["questions"]) if row else []
+
+    def set_questions(self, game_id: int, questions: List[Dict[str, Any]]) -> None:
+        """Reemplaza las preguntas de un juego y actualiza su total"""
+        with self._conn() as conn:
+            conn.execute(UPDATE_QUESTIONS, (json.dumps(questions, ensure_ascii=False), len(questions), game_id))
+
+    def record_play(self, game_id: int, score: int) -> bool:
+        """Suma una partida al juego y retorna True si `score` es su nuevo récord"""
+        with self._conn() as conn:
+            previous = conn.execute("SELECT best_score FROM games WHERE id = ?", (game_id,)).fetchone()
+            conn.execute(RECORD_PLAY, (score, score, game_id))
+        return previous is not None and score > previous["best_score"]
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_game_repository() -> GameRepository:
+    """Retorna el repositorio de juegos compartido por todas las sesiones"""
+    global _repository
+    with _repository_lock:
+        if _repository is None:
+            _repository = GameRepository()
+    return _repository
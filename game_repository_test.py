@@ -0,0 +1,71 @@
+import pytest
+
+from game_repository import GameRepository
+
+
+@pytest.fixture
+def repository(tmp_path):
+    return GameRepository(db_path=str(tmp_path / "eduplay.db"))
+
+
+def question(text):
+    return {"question": text, "A": "Sí", "B": "No", "C": "Quizás", "D": "Nunca", "reponse": "A"}
+
+
+def create(repository, title, questions=(), created_by=1):
+    return repository.create_game(title, "Biología", "Medio", "cuestionario", list(questions),
+                                  filename=f"{title}.pdf", created_by=created_by)
+
+
+def test_create_game_returns_its_summary(repository):
+    first = create(repository, "Células", [question("¿Qué es una célula?")])
+    second = create(repository, "Genética")
+
+    assert second["id"] == first["id"] + 1
+    assert first["title"] == "Células"
+    assert first["filename"] == "Células.pdf"
+    assert first["total_questions"] == 1
+    assert first["times_played"] == 0
+    assert "questions" not in first
+    assert repository.get_game(first["id"]) == first
+    assert repository.get_game(first["id"] + 10) is None
+
+
+def test_list_games_of_a_user_without_their_questions(repository):
+    older = create(repository, "Células", [question("¿Qué es una célula?")])
+    newer = create(repository, "Genética", [question("¿Qué es un gen?")])
+    create(repository, "Roma", created_by=2)
+    create(repository, "Anónimo", created_by=None)
+
+    games = repository.list_games(created_by=1)
+
+    assert [game["id"] for game in games] == [newer["id"], older["id"]]
+    assert all("questions" not in game for game in games)
+    assert [game["title"] for game in repository.list_games(created_by=None)] == ["Anónimo"]
+    assert [game["id"] for game in repository.list_games(created_by=1, limit=1, offset=1)] == [older["id"]]
+
+
+def test_set_questions_replaces_them_and_their_total(repository):
+    game = create(repository, "Células", [question("¿Qué es una célula?")])
+    questions = [question("¿Qué es un orgánulo?"), question("¿Qué es el núcleo?")]
+
+    repository.set_questions(game["id"], questions)
+
+    assert repository.get_questions(game["id"]) == questions
+    assert repository.get_game(game["id"])["total_questions"] == 2
+    assert repository.get_questions(game["id"] + 10) == []
+
+
+def test_record_play_reports_a_new_record(repository):
+    game = create(repository, "Células")
+
+    assert repository.record_play(game["id"], 80)
+    assert not repository.record_play(game["id"], 60)
+    assert not repository.record_play(game["id"], 80)
+    assert repository.record_play(game["id"], 100)
+    assert not repository.record_play(game["id"] + 10, 500)
+
+    summary = repository.get_game(game["id"])
+    assert summary["times_played"] == 4
+    assert summary["best_score"] == 100
+    assert summary["avg_score"] == pytest.approx(80)
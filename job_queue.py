@@ -0,0 +1,404 @@
+"""SQLite-backed queue of document-to-quiz generation jobs run by a pool of worker threads."""
+import asyncio
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from database import DB_PATH, get_connection
+from dedup import QuestionDeduplicator
+from extractors import count_segments
+from game_repository import get_game_repository
+from metrics import get_metrics
+from pdf_to_quizz import aiter_pages, aload_pages, pages_to_quizz_stream, stream_pages_to_quizz
+from qcm_chain import DEFAULT_DIFFICULTY
+from question_budget import plan_within_budget
+from usage import BudgetExceededError, get_usage_tracker
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.environ.get("EDUPLAY_JOB_WORKERS", "2"))
+POLL_SECONDS = 1.0
+# Running jobs refresh their heartbeat this often; a job whose heartbeat is
+# older than JOB_STALE_SECONDS lost its worker (restart, crash) and is requeued
+HEARTBEAT_SECONDS = 10
+JOB_STALE_SECONDS = 60
+# A job requeued this many times is failing its worker and is given up
+MAX_JOB_ATTEMPTS = 3
+
+ACTIVE_STATUSES = ("queued", "running")
+# Finished with some pages that failed every attempt; retry() generates only those
+PARTIAL_STATUS = "partial"
+
+# Fair scheduling: the oldest queued job of the user with the fewest running jobs
+CLAIM_JOB = """
+UPDATE generation_jobs
+SET status = 'running', worker = ?, heartbeat_at = ?, started_at = COALESCE(started_at, ?), attempts = attempts + 1
+WHERE id = (
+    SELECT queued.id FROM generation_jobs AS queued
+    WHERE queued.status = 'queued'
+    ORDER BY (SELECT COUNT(*) FROM generation_jobs AS running
+              WHERE running.status = 'running' AND running.user_id IS queued.user_id),
+             queued.created_at
+    LIMIT 1
+) AND status = 'queued'
+RETURNING *
+"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a job whose row was cancelled while it was running."""
+
+
+class JobQueue():
+    """
+    Persistent queue of generation jobs in eduplay.db.
+
+    Jobs are submitted from the Streamlit script and run by `workers` daemon
+    threads, so they outlive reruns and browser disconnects. Each page's
+    questions are stored as soon as the page is generated; the UI polls
+    progress() and pages() to follow a job. A job whose worker died is
+    requeued and resumes with only the pages it had not finished, and a
+    partial job retried with retry() generates only its failed pages.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, workers: int = JOB_WORKERS) -> None:
+        self.db_path = db_path
+        self.workers = workers
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self.metrics = get_metrics()
+        self._wakeup = threading.Event()
+        self._running: Dict[str, str] = {}
+        self._running_lock = threading.Lock()
+        self._started = False
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def start(self) -> None:
+        """Starts the worker threads and the heartbeat thread, once."""
+        if self._started:
+            return
+        self._started = True
+        self.recover()
+        for n in range(self.workers):
+            threading.Thread(target=self._work, args=(f"{self.worker_prefix}:{n}",),
+                             name=f"generation-worker-{n}", daemon=True).start()
+        threading.Thread(target=self._heartbeat, name="generation-heartbeat", daemon=True).start()
+
+    def submit(self, file_path: str, num_questions: Optional[int] = None, difficulty: str = DEFAULT_DIFFICULTY,
+               user_id: Optional[int] = None, output_format: str = "text", file_name: Optional[str] = None) -> str:
+        """
+        Queues a document (any format in extractors) for generation and returns
+        the job id, also used as its upload id.
+        `file_name` is the name it was uploaded with, when `file_path` is a stored upload.
+        """
+        job_id = uuid.uuid4().hex[:12]
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO generation_jobs (id, user_id, file_path, file_name, num_questions, difficulty, "
+                "output_format, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, file_path, file_name or os.path.basename(file_path), num_questions, difficulty,
+                 output_format, time.time()),
+            )
+        self.metrics.inc("jobs_total", status="queued")
+        self._wakeup.set()
+        return job_id
+
+    def cancel(self, job_id: str) -> None:
+        """Stops a job; a running one stops after its current page."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE generation_jobs SET status = 'cancelled', finished_at = ? "
+                "WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+
+    def retry(self, job_id: str) -> None:
+        """Requeues a failed, cancelled or partial job; it resumes from its unfinished pages."""
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE generation_jobs SET status = 'queued', error = NULL, attempts = 0, finished_at = NULL "
+                "WHERE id = ? AND status IN ('failed', 'cancelled', 'partial')",
+                (job_id,),
+            )
+        self._wakeup.set()
+
+    def progress(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job row: status, total_pages, pages_done, pages_failed, questions, notice and error."""
+        row = self._conn().execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def pages(self, job_id: str, after_seq: int = 0) -> List[Dict[str, Any]]:
+        """Finished pages of a job in completion order, from the (after_seq + 1)-th one."""
+        rows = self._conn().execute(
+            "SELECT page_index, questions, seq FROM generation_job_pages "
+            "WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after_seq),
+        ).fetchall()
+        return [
+            {"page_index": row["page_index"], "questions": json.loads(row["questions"]), "seq": row["seq"]}
+            for row in rows
+        ]
+
+    def attach_game(self, job_id: str, game_id: int) -> None:
+        """Links a game created from the job, so it also gets the pages generated after its creation."""
+        with self._conn() as conn:
+            conn.execute("UPDATE generation_jobs SET game_id = ? WHERE id = ?", (game_id, job_id))
+        self.sync_game(job_id)
+
+    def sync_game(self, job_id: str) -> None:
+        """
+        Rewrites the questions of the job's game from its finished pages.
+        The pages are the source of truth, so syncing twice is harmless.
+        """
+        row = self._conn().execute("SELECT game_id FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["game_id"] is None:
+            return
+        questions = [question for page in self.pages(job_id) for question in page["questions"]]
+        get_game_repository().set_questions(row["game_id"], questions)
+
+    def recover(self) -> int:
+        """Requeues running jobs whose worker stopped sending heartbeats; returns how many."""
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE generation_jobs SET status = 'failed', finished_at = ?, "
+                "error = 'El trabajo se interrumpió demasiadas veces' "
+                "WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (now, now - JOB_STALE_SECONDS, MAX_JOB_ATTEMPTS),
+            )
+            requeued = conn.execute(
+                "UPDATE generation_jobs SET status = 'queued', worker = NULL "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (now - JOB_STALE_SECONDS,),
+            ).rowcount
+        if requeued:
+            logger.info("requeued %d stale generation jobs", requeued)
+            self.metrics.inc("jobs_requeued_total", requeued)
+            self._wakeup.set()
+        return requeued
+
+    def _claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute(CLAIM_JOB, (worker, now, now)).fetchone()
+        return dict(row) if row else None
+
+    def _work(self, worker: str) -> None:
+        while True:
+            try:
+                job = self._claim(worker)
+            except Exception:
+                logger.exception("could not claim a generation job")
+                job = None
+            if job is None:
+                self._wakeup.wait(POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+
+            with self._running_lock:
+                self._running[job["id"]] = worker
+            try:
+                failed = asyncio.run(self._run(job))
+                if failed:
+                    self._finish(job["id"], PARTIAL_STATUS, f"No se pudieron generar {failed} páginas")
+                else:
+                    self._finish(job["id"], "done")
+            except JobCancelled:
+                self.metrics.inc("jobs_total", status="cancelled")
+            except BudgetExceededError as e:
+                self._finish(job["id"], "failed", f"💰 {e}")
+            except Exception as e:
+                logger.exception("generation job %s failed", job["id"])
+                self._finish(job["id"], "failed", str(e))
+            finally:
+                with self._running_lock:
+                    self._running.pop(job["id"], None)
+
+    def _heartbeat(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                with self._running_lock:
+                    running = list(self._running.items())
+                if running:
+                    with self._conn() as conn:
+                        conn.executemany(
+                            "UPDATE generation_jobs SET heartbeat_at = ? WHERE id = ? AND worker = ?",
+                            [(time.time(), job_id, worker) for job_id, worker in running],
+                        )
+                self.recover()
+            except Exception:
+                logger.exception("generation job heartbeat failed")
+
+    def _finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE generation_jobs SET status = ?, error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                (status, error, time.time(), job_id),
+            )
+        try:
+            self.sync_game(job_id)
+        except Exception:
+            logger.exception("could not update the game of generation job %s", job_id)
+        self.metrics.inc("jobs_total", status=status)
+
+    def _plan(self, job: Dict[str, Any], pages: List[str]) -> List[List[str]]:
+        """Plans the job on its first run and stores it; a resumed job keeps its original plan."""
+        rows = self._conn().execute(
+            "SELECT page_index, plan FROM generation_job_pages WHERE job_id = ? ORDER BY page_index", (job["id"],)
+        ).fetchall()
+        if rows:
+            plans = [json.loads(row["plan"]) for row in rows]
+            if len(plans) < len(pages):
+                # A streamed job stopped before its last pages were planned: they share what is left
+                planned = sum(map(len, plans))
+                budget = None if job["num_questions"] is None else max(0, job["num_questions"] - planned)
+                try:
+                    extra, _ = plan_within_budget(pages[len(plans):], budget, job["difficulty"], job["user_id"],
+                                                  upload_id=job["id"], first_question=planned)
+                except BudgetExceededError:
+                    extra = [[] for _ in pages[len(plans):]]
+                self._store_plans(job["id"], len(plans), extra)
+                plans += extra
+            return plans
+
+        # Reserves the job's cost too, so the plan stays within budget while it runs
+        plans, estimate = plan_within_budget(pages, job["num_questions"], job["difficulty"], job["user_id"],
+                                             upload_id=job["id"])
+        granted = sum(map(len, plans))
+        self._store_plans(job["id"], 0, plans)
+        self._set_notice(job, granted, estimate)
+        return plans
+
+    def _set_notice(self, job: Dict[str, Any], granted: int, estimate: float) -> None:
+        """Tells the user when the budget only allowed part of the questions they asked for."""
+        notice = None
+        if job["num_questions"] and granted < job["num_questions"]:
+            notice = (f"💰 Por el presupuesto disponible se generarán {granted} de "
+                      f"{job['num_questions']} preguntas (costo estimado ${estimate:.3f})")
+        with self._conn() as conn:
+            conn.execute("UPDATE generation_jobs SET notice = ? WHERE id = ?", (notice, job["id"]))
+
+    def _store_plans(self, job_id: str, first_page: int, plans: List[List[str]]) -> None:
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO generation_job_pages (job_id, page_index, plan) VALUES (?, ?, ?)",
+                [(job_id, first_page + i, json.dumps(plan)) for i, plan in enumerate(plans)],
+            )
+
+    async def _run(self, job: Dict[str, Any]) -> int:
+        """Generates the job's unfinished pages; returns how many failed every attempt."""
+        job_id = job["id"]
+        planned = self._conn().execute(
+            "SELECT COUNT(*) FROM generation_job_pages WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        if not planned:
+            total_segments = None
+            if job["num_questions"] is not None:
+                total_segments = await asyncio.to_thread(count_segments, job["file_path"])
+            if job["num_questions"] is None or total_segments:
+                return await self._stream(job, total_segments)
+
+        # A resumed job follows its stored plan, and a question budget over a
+        # document of unknown length is spread over every page: both need all pages first
+        pages = await aload_pages(job["file_path"])
+        with self._conn() as conn:
+            conn.execute("UPDATE generation_jobs SET total_pages = ?, pages_failed = 0 WHERE id = ?",
+                         (len(pages), job_id))
+        plans = self._plan(job, pages)
+
+        done = {row["page_index"] for row in self._conn().execute(
+            "SELECT page_index FROM generation_job_pages WHERE job_id = ? AND status = 'done'", (job_id,)
+        )}
+        if done:
+            logger.info("resuming generation job %s with %d of %d pages done", job_id, len(done), len(pages))
+        # Finished pages are sent with an empty plan, so they never reach the LLM again
+        remaining = [[] if i in done else plan for i, plan in enumerate(plans)]
+        # and their questions are the ones new pages must not duplicate
+        dedup = QuestionDeduplicator()
+        for page in self.pages(job_id):
+            dedup.filter(page["questions"])
+
+        failed = 0
+        async for i, questions in pages_to_quizz_stream(pages, job["output_format"], upload_id=job_id,
+                                                        user_id=job["user_id"], plans=remaining, dedup=dedup):
+            if i not in done:
+                failed += self._store_page(job_id, i, questions)
+        return failed
+
+    async def _stream(self, job: Dict[str, Any], total_segments: Optional[int] = None) -> int:
+        """
+        First run of a job: pages are generated while the document is
+        extracted. A question budget is shared out over the `total_segments`
+        the document has as they are read (see stream_pages_to_quizz).
+        """
+        job_id = job["id"]
+        with self._conn() as conn:
+            conn.execute("UPDATE generation_jobs SET total_pages = 0, pages_failed = 0 WHERE id = ?", (job_id,))
+
+        granted = 0
+
+        def on_planned(first_page: int, plans: List[List[str]]) -> None:
+            nonlocal granted
+            granted += sum(map(len, plans))
+            self._store_plans(job_id, first_page, plans)
+            with self._conn() as conn:
+                conn.execute("UPDATE generation_jobs SET total_pages = total_pages + ? WHERE id = ?",
+                             (len(plans), job_id))
+
+        failed = 0
+        async for i, questions in stream_pages_to_quizz(aiter_pages(job["file_path"]), job["output_format"],
+                                                        job["num_questions"], job["difficulty"], upload_id=job_id,
+                                                        user_id=job["user_id"], on_planned=on_planned,
+                                                        total_segments=total_segments):
+            failed += self._store_page(job_id, i, questions)
+        usage = get_usage_tracker().upload_usage(job_id)
+        self._set_notice(job, granted, usage["estimated_cost_usd"] if usage else 0.0)
+        return failed
+
+    def _store_page(self, job_id: str, i: int, questions: Optional[List[Dict[str, Any]]]) -> bool:
+        """Stores a generated page, or marks it failed when `questions` is None; returns whether it failed."""
+        with self._conn() as conn:
+            status = conn.execute("SELECT status FROM generation_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            if status != "running":
+                raise JobCancelled(job_id)
+            if questions is None:
+                conn.execute(
+                    "UPDATE generation_job_pages SET status = 'failed', attempts = attempts + 1 "
+                    "WHERE job_id = ? AND page_index = ?",
+                    (job_id, i),
+                )
+                conn.execute("UPDATE generation_jobs SET pages_failed = pages_failed + 1, heartbeat_at = ? "
+                             "WHERE id = ?", (time.time(), job_id))
+                return True
+            conn.execute(
+                "UPDATE generation_job_pages SET status = 'done', attempts = attempts + 1, questions = ?, "
+                "seq = (SELECT COALESCE(MAX(seq), 0) + 1 FROM generation_job_pages WHERE job_id = ?) "
+                "WHERE job_id = ? AND page_index = ?",
+                (json.dumps(questions, ensure_ascii=False), job_id, job_id, i),
+            )
+            conn.execute(
+                "UPDATE generation_jobs SET pages_done = pages_done + 1, questions = questions + ?, "
+                "heartbeat_at = ? WHERE id = ?",
+                (len(questions), time.time(), job_id),
+            )
+        return False
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue, starting its workers and resuming interrupted jobs."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+            _queue.start()
+    return _queue
@@ -0,0 +1,201 @@
+import asyncio
+import json
+
+import pytest
+
+import pdf_to_quizz
+from chunking import count_tokens
+from benchmark import make_synthetic_pdf
+from job_queue import MAX_JOB_ATTEMPTS, PARTIAL_STATUS, JobCancelled, JobQueue
+from question_budget import estimate_cost, plan_questions
+from usage import get_usage_tracker
+
+
+@pytest.fixture(scope="module")
+def pdf(tmp_path_factory):
+    return make_synthetic_pdf(str(tmp_path_factory.mktemp("documents") / "apuntes.pdf"), 12)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    # No worker threads: tests claim and run jobs themselves
+    return JobQueue(db_path=str(tmp_path / "eduplay.db"), workers=0)
+
+
+@pytest.fixture
+def generated(monkeypatch):
+    """Texts of the pages sent for generation with a non-empty plan, in order."""
+    sent = []
+    generate = pdf_to_quizz.generate_quizz_stream
+
+    def recording(pages, model_name, output_format, plans):
+        sent.extend(page for page, plan in zip(pages, plans) if plan)
+        return generate(pages, model_name, output_format, plans=plans)
+
+    monkeypatch.setattr(pdf_to_quizz, "generate_quizz_stream", recording)
+    return sent
+
+
+def run_next(queue):
+    """What a worker does with the next job: claims it, runs it and records how it ended."""
+    job = queue._claim("worker")
+    failed = asyncio.run(queue._run(job))
+    queue._finish(job["id"], PARTIAL_STATUS if failed else "done")
+    return job["id"]
+
+
+def job_pages(queue, job_id):
+    rows = queue._conn().execute(
+        "SELECT page_index, plan, status, seq FROM generation_job_pages WHERE job_id = ? ORDER BY page_index",
+        (job_id,),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def page_texts(pdf):
+    return pdf_to_quizz.load_pages(pdf)
+
+
+def test_claim_is_fair_between_users(queue, pdf):
+    first = queue.submit(pdf, user_id=1)
+    second = queue.submit(pdf, user_id=1)
+    other = queue.submit(pdf, user_id=2)
+
+    claimed = [queue._claim("worker")["id"] for _ in range(3)]
+
+    # The other user's job goes before the first user's second one
+    assert claimed == [first, other, second]
+    assert queue._claim("worker") is None
+    assert queue.progress(first)["attempts"] == 1
+
+
+def test_recover_requeues_stale_jobs_up_to_the_attempts_cap(queue, pdf):
+    stale = queue.submit(pdf, user_id=1)
+    exhausted = queue.submit(pdf, user_id=2)
+    queue._claim("worker")
+    queue._claim("worker")
+    with queue._conn() as conn:
+        conn.execute("UPDATE generation_jobs SET heartbeat_at = 0")
+        conn.execute("UPDATE generation_jobs SET attempts = ? WHERE id = ?", (MAX_JOB_ATTEMPTS, exhausted))
+
+    assert queue.recover() == 1
+
+    assert queue.progress(stale)["status"] == "queued"
+    assert queue.progress(exhausted)["status"] == "failed"
+    assert queue._claim("worker")["id"] == stale
+
+
+def test_streamed_job_stores_every_page(queue, pdf, generated):
+    job_id = queue.submit(pdf)
+
+    run_next(queue)
+
+    progress = queue.progress(job_id)
+    pages = job_pages(queue, job_id)
+    assert progress["status"] == "done"
+    assert progress["total_pages"] == len(pages) == len(page_texts(pdf))
+    assert progress["pages_done"] == len(pages)
+    assert all(page["status"] == "done" for page in pages)
+    assert sorted(page["seq"] for page in pages) == list(range(1, len(pages) + 1))
+    assert progress["questions"] == sum(len(page["questions"]) for page in queue.pages(job_id))
+    assert len(generated) == len(pages)
+
+
+def test_budgeted_job_plans_its_question_budget(queue, pdf):
+    job_id = queue.submit(pdf, num_questions=7, difficulty="Mixta")
+
+    run_next(queue)
+
+    plans = [json.loads(page["plan"]) for page in job_pages(queue, job_id)]
+    assert sum(map(len, plans)) == 7
+    assert queue.progress(job_id)["notice"] is None
+
+
+def test_a_budget_that_only_covers_part_of_the_quiz_leaves_a_notice(queue, pdf, monkeypatch):
+    texts = page_texts(pdf)
+    full_cost = estimate_cost([count_tokens(text) for text in texts], plan_questions(texts, 12))
+    monkeypatch.setattr(get_usage_tracker(), "max_upload_cost", full_cost / 2)
+    job_id = queue.submit(pdf, num_questions=12)
+
+    run_next(queue)
+
+    granted = sum(len(json.loads(page["plan"])) for page in job_pages(queue, job_id))
+    assert 0 < granted < 12
+    assert queue.progress(job_id)["notice"].startswith(f"💰 Por el presupuesto disponible se generarán {granted} de 12")
+
+
+def test_resume_generates_only_the_unfinished_pages(queue, pdf, generated):
+    job_id = queue.submit(pdf, num_questions=8)
+    run_next(queue)
+    before = job_pages(queue, job_id)
+    # The worker died before storing two pages
+    with queue._conn() as conn:
+        conn.execute("UPDATE generation_job_pages SET status = 'pending', questions = NULL, seq = NULL "
+                     "WHERE job_id = ? AND page_index IN (1, 3)", (job_id,))
+        conn.execute("UPDATE generation_jobs SET status = 'queued', pages_done = pages_done - 2 WHERE id = ?",
+                     (job_id,))
+    generated.clear()
+
+    run_next(queue)
+
+    texts = page_texts(pdf)
+    after = job_pages(queue, job_id)
+    assert generated
+    assert generated == [texts[i] for i in (1, 3) if json.loads(before[i]["plan"])]
+    assert [page["plan"] for page in after] == [page["plan"] for page in before]
+    assert [page["seq"] for i, page in enumerate(after) if i not in (1, 3)] == \
+           [page["seq"] for i, page in enumerate(before) if i not in (1, 3)]
+    assert all(page["status"] == "done" for page in after)
+    assert queue.progress(job_id)["pages_done"] == len(after)
+
+
+def test_interrupted_stream_plans_the_rest_with_what_is_left_of_the_budget(queue, pdf):
+    job_id = queue.submit(pdf, num_questions=8)
+    run_next(queue)
+    # As if the worker died after planning and generating only the first waves
+    with queue._conn() as conn:
+        conn.execute("DELETE FROM generation_job_pages WHERE job_id = ? AND page_index >= 4", (job_id,))
+        conn.execute("UPDATE generation_jobs SET status = 'queued', pages_done = 4 WHERE id = ?", (job_id,))
+    kept = [json.loads(page["plan"]) for page in job_pages(queue, job_id)]
+
+    run_next(queue)
+
+    pages = job_pages(queue, job_id)
+    plans = [json.loads(page["plan"]) for page in pages]
+    assert len(pages) == len(page_texts(pdf))
+    assert plans[:4] == kept
+    assert sum(map(len, plans)) == 8
+    assert all(page["status"] == "done" for page in pages)
+
+
+def test_cancelled_job_stops_at_its_next_page(queue, pdf):
+    job_id = queue.submit(pdf)
+    job = queue._claim("worker")
+    queue.cancel(job_id)
+
+    with pytest.raises(JobCancelled):
+        asyncio.run(queue._run(job))
+
+    assert queue.progress(job_id)["status"] == "cancelled"
+    assert queue.progress(job_id)["pages_done"] == 0
+
+
+def test_retry_of_a_partial_job_generates_only_its_failed_pages(queue, pdf, generated):
+    job_id = queue.submit(pdf)
+    run_next(queue)
+    with queue._conn() as conn:
+        conn.execute("UPDATE generation_job_pages SET status = 'failed', questions = NULL, seq = NULL "
+                     "WHERE job_id = ? AND page_index = 2", (job_id,))
+        conn.execute("UPDATE generation_jobs SET status = ?, pages_done = pages_done - 1, pages_failed = 1 "
+                     "WHERE id = ?", (PARTIAL_STATUS, job_id))
+    generated.clear()
+
+    queue.retry(job_id)
+    assert queue.progress(job_id)["status"] == "queued"
+    run_next(queue)
+
+    assert generated == [page_texts(pdf)[2]]
+    progress = queue.progress(job_id)
+    assert progress["status"] == "done"
+    assert progress["pages_failed"] == 0
+    assert progress["pages_done"] == len(job_pages(queue, job_id))
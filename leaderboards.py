@@ -0,0 +1,145 @@
+"""Global, per-subject and weekly leaderboards maintained incrementally from game_results."""
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from database import DB_PATH, get_connection
+
+GLOBAL_BOARD = "global"
+TOP_N = 10
+
+def subject_board(subject: str) -> str:
+    return f"subject:{subject}"
+
+def week_board(timestamp: Optional[float] = None) -> str:
+    """Board of the UTC week containing `timestamp` (now by default), weeks starting on Monday."""
+    return time.strftime("week:%Y-%W", time.gmtime(timestamp))
+
+
+class _Board():
+    """Users of one board sorted by points: rank lookups are a binary search."""
+
+    def __init__(self, rows: Iterable[Tuple[int, int]]) -> None:
+        self.points: Dict[int, int] = dict(rows)
+        self.order: List[Tuple[int, int]] = sorted((-points, user_id) for user_id, points in self.points.items())
+
+    def set(self, user_id: int, points: int) -> None:
+        old = self.points.get(user_id)
+        if old is not None:
+            del self.order[bisect_left(self.order, (-old, user_id))]
+        self.points[user_id] = points
+        insort(self.order, (-points, user_id))
+
+    def rank(self, user_id: int) -> Optional[int]:
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return bisect_left(self.order, (-points, user_id)) + 1
+
+
+class Leaderboards():
+    """
+    Leaderboards of eduplay.db. Totals live in leaderboard_scores, kept up
+    to date by a trigger on game_results, so a page render never scans the
+    results. Each board that is viewed is also kept in memory sorted by
+    points: top() and rank() are O(log n) in the number of players, and
+    apply() repositions only the players of newly written results.
+    """
+
+    def __init__(self, db_path: str = DB_PATH) -> None:
+        self.db_path = db_path
+        self._boards: Dict[str, _Board] = {}
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def _board(self, board: str) -> _Board:
+        # Loaded under the lock, so apply() cannot update the board while it is being read
+        with self._lock:
+            loaded = self._boards.get(board)
+            if loaded is None:
+                rows = self._conn().execute(
+                    "SELECT user_id, points FROM leaderboard_scores WHERE board = ?", (board,)
+                ).fetchall()
+                loaded = self._boards[board] = _Board((row["user_id"], row["points"]) for row in rows)
+        return loaded
+
+    def _players(self, board: str, entries: List[Tuple[int, int]]) -> List[Dict[str, Any]]:
+        """Name, level and board totals of (rank, user_id) entries, in the given order."""
+        if not entries:
+            return []
+        user_ids = [user_id for _, user_id in entries]
+        placeholders = ", ".join("?" * len(user_ids))
+        rows = {row["user_id"]: row for row in self._conn().execute(
+            f"SELECT s.user_id, s.points, s.games, s.questions_correct, s.total_questions, u.level, "
+            f"COALESCE(NULLIF(TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '')), ''), u.username) AS name "
+            f"FROM leaderboard_scores AS s JOIN users AS u ON u.id = s.user_id "
+            f"WHERE s.board = ? AND s.user_id IN ({placeholders})",
+            (board, *user_ids),
+        )}
+        players = []
+        for rank, user_id in entries:
+            row = rows.get(user_id)
+            if row is not None:
+                accuracy = row["questions_correct"] / row["total_questions"] * 100 if row["total_questions"] else 0
+                players.append({**dict(row), "rank": rank, "accuracy": accuracy})
+        return players
+
+    def top(self, board: str = GLOBAL_BOARD, n: int = TOP_N) -> List[Dict[str, Any]]:
+        """The `n` players with the most points: rank, name, level, points, games and accuracy."""
+        loaded = self._board(board)
+        with self._lock:
+            entries = [(rank, user_id) for rank, (_, user_id) in enumerate(loaded.order[:n], 1)]
+        return self._players(board, entries)
+
+    def rank(self, board: str, user_id: int) -> Optional[Dict[str, Any]]:
+        """The user's position in the board, or None if they have not played in it."""
+        loaded = self._board(board)
+        with self._lock:
+            position = loaded.rank(user_id)
+        if position is None:
+            return None
+        players = self._players(board, [(position, user_id)])
+        return players[0] if players else None
+
+    def subjects(self) -> List[str]:
+        """Subjects with at least one result, for the per-subject boards."""
+        return [row["board"][len("subject:"):] for row in self._conn().execute(
+            "SELECT DISTINCT board FROM leaderboard_scores WHERE board >= 'subject:' AND board < 'subject;' "
+            "ORDER BY board"
+        )]
+
+    def apply(self, results: Iterable[Dict[str, Any]]) -> None:
+        """Repositions, in the boards held in memory, the players of results just written."""
+        user_ids = {result["user_id"] for result in results if result.get("user_id") is not None}
+        with self._lock:
+            boards = list(self._boards)
+        if not user_ids or not boards:
+            return
+        conn = self._conn()
+        for board in boards:
+            placeholders = ", ".join("?" * len(user_ids))
+            rows = conn.execute(
+                f"SELECT user_id, points FROM leaderboard_scores WHERE board = ? AND user_id IN ({placeholders})",
+                (board, *user_ids),
+            ).fetchall()
+            with self._lock:
+                loaded = self._boards.get(board)
+                if loaded is not None:
+                    for row in rows:
+                        if loaded.points.get(row["user_id"]) != row["points"]:
+                            loaded.set(row["user_id"], row["points"])
+
+
+_leaderboards = None
+_leaderboards_lock = threading.Lock()
+
+def get_leaderboards() -> Leaderboards:
+    """Returns the process-wide leaderboards."""
+    global _leaderboards
+    with _leaderboards_lock:
+        if _leaderboards is None:
+            _leaderboards = Leaderboards()
+    return _leaderboards
@@ -0,0 +1,85 @@
+import pytest
+
+from database import get_connection
+from leaderboards import GLOBAL_BOARD, Leaderboards, subject_board, week_board
+
+
+@pytest.fixture
+def boards(tmp_path):
+    path = str(tmp_path / "eduplay.db")
+    with get_connection(path) as conn:
+        conn.executemany(
+            "INSERT INTO users (id, username, email, password_hash, first_name, last_name, level) "
+            "VALUES (?, ?, ?, '!', ?, ?, ?)",
+            [(1, "ana", "ana@eduplay.local", "Ana", "Pérez", 2), (2, "luis", "luis@eduplay.local", None, None, 1),
+             (3, "eva", "eva@eduplay.local", "Eva", None, 4)],
+        )
+        conn.executemany("INSERT INTO games (id, title, subject, difficulty, game_mode, questions) "
+                         "VALUES (?, ?, ?, 'Medio', 'quiz', '[]')", [(1, "Células", "Biología"), (2, "Roma", "Historia")])
+    return Leaderboards(path)
+
+
+def play(boards, user_id, game_id, score, correct=1, total=2):
+    with get_connection(boards.db_path) as conn:
+        conn.execute(
+            "INSERT INTO game_results (user_id, game_id, score, questions_correct, total_questions) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, game_id, score, correct, total),
+        )
+    return {"user_id": user_id, "game_id": game_id, "score": score}
+
+
+def test_top_orders_players_by_points(boards):
+    play(boards, 1, 1, 100)
+    play(boards, 2, 1, 300, correct=2)
+    play(boards, 3, 2, 100)
+    play(boards, 1, 2, 50)
+
+    top = boards.top(GLOBAL_BOARD)
+
+    assert [(player["rank"], player["user_id"], player["points"]) for player in top] == \
+           [(1, 2, 300), (2, 1, 150), (3, 3, 100)]
+    assert top[0]["name"] == "luis"
+    assert top[0]["accuracy"] == 100
+    assert top[1]["name"] == "Ana Pérez"
+    assert top[1]["games"] == 2
+    assert top[2]["level"] == 4
+    assert [player["user_id"] for player in boards.top(GLOBAL_BOARD, n=1)] == [2]
+
+
+def test_rank_of_a_player(boards):
+    play(boards, 1, 1, 100)
+    play(boards, 2, 1, 300)
+
+    assert boards.rank(GLOBAL_BOARD, 1)["rank"] == 2
+    assert boards.rank(subject_board("Biología"), 2)["rank"] == 1
+    assert boards.rank(week_board(), 1)["points"] == 100
+    # Players without results in a board have no position in it
+    assert boards.rank(GLOBAL_BOARD, 3) is None
+    assert boards.rank(subject_board("Historia"), 1) is None
+
+
+def test_apply_repositions_players_of_new_results(boards):
+    play(boards, 1, 1, 100)
+    play(boards, 2, 1, 200)
+    assert boards.rank(GLOBAL_BOARD, 1)["rank"] == 2
+
+    result = play(boards, 1, 2, 150)
+    # The board held in memory is only updated by apply()
+    assert boards.rank(GLOBAL_BOARD, 1)["rank"] == 2
+    boards.apply([result, {"user_id": None, "game_id": 1, "score": 10}])
+
+    assert boards.rank(GLOBAL_BOARD, 1)["rank"] == 1
+    assert boards.rank(GLOBAL_BOARD, 2)["rank"] == 2
+    assert [player["points"] for player in boards.top(GLOBAL_BOARD)] == [250, 200]
+    # A board first viewed afterwards is loaded with every result
+    assert boards.rank(subject_board("Historia"), 1)["points"] == 150
+
+
+def test_subjects_with_results(boards):
+    assert boards.subjects() == []
+
+    play(boards, 1, 2, 10)
+    play(boards, 2, 1, 10)
+
+    assert boards.subjects() == ["Biología", "Historia"]
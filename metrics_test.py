@@ -0,0 +1,67 @@
+import asyncio
+import json
+import logging
+
+from metrics import MetricsRegistry, get_metrics
+from pdf_to_quizz import pages_to_quizz_stream
+from usage import get_usage_tracker
+
+# A model of its own, so that its series only count this module's calls
+MODEL = "mock-metrics"
+
+
+def series(snapshot, section, name, **labels):
+    return next(entry for entry in snapshot[section][name] if entry["labels"] == labels)
+
+
+def test_registry_exports():
+    registry = MetricsRegistry()
+    registry.inc("pages_failed_total")
+    registry.inc("llm_calls_total", 2, model="gpt-4o-mini", status="ok")
+    registry.observe("llm_latency_seconds", 0.3, model="gpt-4o-mini")
+    registry.observe("llm_latency_seconds", 7.0, model="gpt-4o-mini")
+
+    text = registry.render_prometheus()
+
+    assert "eduplay_pages_failed_total 1" in text
+    assert 'eduplay_llm_calls_total{model="gpt-4o-mini",status="ok"} 2' in text
+    assert 'eduplay_llm_latency_seconds_bucket{model="gpt-4o-mini",le="0.5"} 1' in text
+    assert 'eduplay_llm_latency_seconds_bucket{model="gpt-4o-mini",le="+Inf"} 2' in text
+    assert 'eduplay_llm_latency_seconds_count{model="gpt-4o-mini"} 2' in text
+    histogram = series(registry.snapshot(), "histograms", "llm_latency_seconds", model="gpt-4o-mini")
+    assert histogram["p50"] == 0.5
+    assert histogram["p99"] == 10.0
+
+
+def test_llm_calls_are_exported_and_tagged_with_their_upload(tmp_path, caplog):
+    caplog.set_level(logging.DEBUG, logger="callback")
+    pages = [f"La célula número {i} contiene orgánulos que cumplen funciones distintas. "
+             f"El núcleo {i} guarda el material genético de la célula." for i in range(3)]
+
+    async def run():
+        return [item async for item in pages_to_quizz_stream(pages, plans=[["Medio"]] * 3,
+                                                              upload_id="metrics-upload", model_name=MODEL)]
+
+    assert len(asyncio.run(run())) == 3
+
+    # The first page goes alone, the other two in one call
+    snapshot = get_metrics().snapshot()
+    assert series(snapshot, "counters", "llm_calls_started_total", model=MODEL)["value"] == 2
+    assert series(snapshot, "counters", "llm_calls_total", model=MODEL, status="ok")["value"] == 2
+    prompt_tokens = series(snapshot, "counters", "llm_tokens_total", model=MODEL, kind="prompt")["value"]
+    assert prompt_tokens > 0
+    assert series(snapshot, "histograms", "llm_latency_seconds", model=MODEL)["count"] == 2
+    assert f'eduplay_llm_calls_total{{model="{MODEL}",status="ok"}} 2' in get_metrics().render_prometheus()
+    path = str(tmp_path / "metrics.json")
+    get_metrics().dump_json(path)
+    with open(path, encoding="utf-8") as f:
+        dumped = json.load(f)
+    assert {"labels": {"model": MODEL, "status": "ok"}, "value": 2} in dumped["counters"]["llm_calls_total"]
+
+    # The calls run on the engine's loop thread and still see the upload and pages they were made for
+    usage = get_usage_tracker().upload_usage("metrics-upload")
+    assert usage["calls"] == 2
+    assert usage["prompt_tokens"] == prompt_tokens
+    tagged = [record.getMessage() for record in caplog.records if record.name == "callback"]
+    assert any("upload=metrics-upload pages=[0] " in message for message in tagged)
+    assert any("upload=metrics-upload pages=[1, 2] " in message for message in tagged)
@@ -0,0 +1,385 @@
+"""
+Migraciones versionadas del esquema de eduplay.db
+
+Cada migración se aplica una sola vez, en orden y en su propia transacción,
+y queda registrada en schema_migrations. database.get_connection aplica las
+pendientes la primera vez que un proceso abre una base de datos, así que una
+base vacía recibe el esquema completo y una existente solo lo que le falta.
+Para cambiar el esquema se agrega una migración al final de MIGRATIONS;
+las ya publicadas no se modifican.
+"""
+import sqlite3
+import sys
+from typing import Callable, List, Tuple, Union
+
+# Tablas que existían solo en el eduplay.db distribuido
+INITIAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT UNIQUE NOT NULL,
+    email TEXT UNIQUE NOT NULL,
+    password_hash TEXT NOT NULL,
+    first_name TEXT,
+    last_name TEXT,
+    level INTEGER DEFAULT 1,
+    points INTEGER DEFAULT 0,
+    total_games INTEGER DEFAULT 0,
+    correct_answers INTEGER DEFAULT 0,
+    total_questions INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP,
+    user_type TEXT DEFAULT 'student',
+    is_active BOOLEAN DEFAULT TRUE
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    difficulty TEXT NOT NULL,
+    game_mode TEXT NOT NULL,
+    questions TEXT NOT NULL,
+    created_by INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_public BOOLEAN DEFAULT FALSE,
+    is_active BOOLEAN DEFAULT TRUE,
+    total_plays INTEGER DEFAULT 0,
+    avg_score REAL DEFAULT 0,
+    description TEXT,
+    tags TEXT,
+    FOREIGN KEY (created_by) REFERENCES users (id)
+);
+CREATE TABLE IF NOT EXISTS game_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    game_id INTEGER,
+    score INTEGER,
+    accuracy REAL,
+    time_spent INTEGER,
+    questions_correct INTEGER,
+    total_questions INTEGER,
+    answers TEXT,
+    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    session_data TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (game_id) REFERENCES games (id)
+);
+CREATE TABLE IF NOT EXISTS study_groups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    description TEXT,
+    created_by INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT TRUE,
+    max_members INTEGER DEFAULT 50,
+    FOREIGN KEY (created_by) REFERENCES users (id)
+);
+CREATE TABLE IF NOT EXISTS group_members (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id INTEGER,
+    user_id INTEGER,
+    joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    role TEXT DEFAULT 'member',
+    is_active BOOLEAN DEFAULT TRUE,
+    FOREIGN KEY (group_id) REFERENCES study_groups (id),
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    UNIQUE(group_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS assignments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    description TEXT,
+    game_id INTEGER,
+    teacher_id INTEGER,
+    target_group TEXT,
+    due_date TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    is_active BOOLEAN DEFAULT TRUE,
+    points_possible INTEGER DEFAULT 100,
+    FOREIGN KEY (game_id) REFERENCES games (id),
+    FOREIGN KEY (teacher_id) REFERENCES users (id)
+);
+CREATE TABLE IF NOT EXISTS assignment_submissions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    assignment_id INTEGER,
+    student_id INTEGER,
+    game_result_id INTEGER,
+    submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    points_earned INTEGER,
+    is_late BOOLEAN DEFAULT FALSE,
+    FOREIGN KEY (assignment_id) REFERENCES assignments (id),
+    FOREIGN KEY (student_id) REFERENCES users (id),
+    FOREIGN KEY (game_result_id) REFERENCES game_results (id),
+    UNIQUE(assignment_id, student_id)
+);
+CREATE TABLE IF NOT EXISTS achievements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    description TEXT,
+    icon TEXT,
+    points_required INTEGER,
+    games_required INTEGER,
+    accuracy_required REAL,
+    achievement_type TEXT,
+    is_active BOOLEAN DEFAULT TRUE
+);
+CREATE TABLE IF NOT EXISTS user_achievements (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    achievement_id INTEGER,
+    earned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (achievement_id) REFERENCES achievements (id),
+    UNIQUE(user_id, achievement_id)
+);
+"""
+
+QUESTION_CACHE = """
+CREATE TABLE IF NOT EXISTS question_cache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_question_cache_last_used ON question_cache (last_used_at);
+"""
+
+GENERATION_USAGE = """
+CREATE TABLE IF NOT EXISTS generation_usage (
+    upload_id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    game_id INTEGER,
+    model_name TEXT NOT NULL,
+    pages INTEGER DEFAULT 0,
+    questions_requested INTEGER DEFAULT 0,
+    calls INTEGER DEFAULT 0,
+    prompt_tokens INTEGER DEFAULT 0,
+    completion_tokens INTEGER DEFAULT 0,
+    cost_usd REAL DEFAULT 0,
+    estimated_cost_usd REAL DEFAULT 0,
+    status TEXT DEFAULT 'running',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (game_id) REFERENCES games (id)
+);
+CREATE INDEX IF NOT EXISTS idx_generation_usage_user_created ON generation_usage (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_generation_usage_created ON generation_usage (created_at);
+CREATE INDEX IF NOT EXISTS idx_generation_usage_game ON generation_usage (game_id);
+"""
+
+GENERATION_JOBS = """
+CREATE TABLE IF NOT EXISTS generation_jobs (
+    id TEXT PRIMARY KEY,
+    user_id INTEGER,
+    file_path TEXT NOT NULL,
+    file_name TEXT,
+    num_questions INTEGER,
+    difficulty TEXT NOT NULL,
+    output_format TEXT NOT NULL DEFAULT 'text',
+    game_id INTEGER,
+    status TEXT NOT NULL DEFAULT 'queued',
+    total_pages INTEGER,
+    pages_done INTEGER DEFAULT 0,
+    pages_failed INTEGER DEFAULT 0,
+    questions INTEGER DEFAULT 0,
+    notice TEXT,
+    error TEXT,
+    attempts INTEGER DEFAULT 0,
+    worker TEXT,
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    FOREIGN KEY (user_id) REFERENCES users (id),
+    FOREIGN KEY (game_id) REFERENCES games (id)
+);
+CREATE INDEX IF NOT EXISTS idx_generation_jobs_status ON generation_jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS generation_job_pages (
+    job_id TEXT NOT NULL,
+    page_index INTEGER NOT NULL,
+    plan TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    questions TEXT,
+    seq INTEGER,
+    PRIMARY KEY (job_id, page_index),
+    FOREIGN KEY (job_id) REFERENCES generation_jobs (id)
+);
+CREATE INDEX IF NOT EXISTS idx_generation_job_pages_seq ON generation_job_pages (job_id, seq);
+"""
+
+# Los juegos se guardan con su archivo, su cantidad de preguntas y su récord
+GAME_LIBRARY_COLUMNS = {
+    "filename": "TEXT",
+    "total_questions": "INTEGER DEFAULT 0",
+    "best_score": "INTEGER DEFAULT 0",
+}
+
+# Un total por ranking y usuario, actualizado por un trigger en la misma
+# transacción que inserta el resultado: un resultado repetido que se ignora
+# nunca se suma dos veces
+LEADERBOARDS = """
+CREATE TABLE IF NOT EXISTS leaderboard_scores (
+    board TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    points INTEGER NOT NULL DEFAULT 0,
+    games INTEGER NOT NULL DEFAULT 0,
+    questions_correct INTEGER NOT NULL DEFAULT 0,
+    total_questions INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (board, user_id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+CREATE INDEX IF NOT EXISTS idx_leaderboard_scores_points ON leaderboard_scores (board, points DESC, user_id);
+CREATE TRIGGER IF NOT EXISTS trg_game_results_leaderboards AFTER INSERT ON game_results
+WHEN NEW.user_id IS NOT NULL
+BEGIN
+    INSERT INTO leaderboard_scores (board, user_id, points, games, questions_correct, total_questions)
+    SELECT board, NEW.user_id, COALESCE(NEW.score, 0), 1, COALESCE(NEW.questions_correct, 0),
+           COALESCE(NEW.total_questions, 0)
+    FROM (SELECT 'global' AS board
+          UNION ALL SELECT 'week:' || strftime('%Y-%W', COALESCE(NEW.completed_at, CURRENT_TIMESTAMP))
+          UNION ALL SELECT 'subject:' || subject FROM games WHERE id = NEW.game_id)
+    WHERE true
+    ON CONFLICT (board, user_id) DO UPDATE SET
+        points = points + excluded.points,
+        games = games + 1,
+        questions_correct = questions_correct + excluded.questions_correct,
+        total_questions = total_questions + excluded.total_questions;
+END;
+"""
+
+# Los resultados guardados antes de que existiera el trigger, sumados una vez
+LEADERBOARDS_BACKFILL = """
+INSERT INTO leaderboard_scores (board, user_id, points, games, questions_correct, total_questions)
+SELECT board, user_id, SUM(COALESCE(score, 0)), COUNT(*), SUM(COALESCE(questions_correct, 0)),
+       SUM(COALESCE(total_questions, 0))
+FROM (
+    SELECT 'global' AS board, r.* FROM game_results AS r
+    UNION ALL SELECT 'week:' || strftime('%Y-%W', r.completed_at), r.* FROM game_results AS r
+    UNION ALL SELECT 'subject:' || g.subject, r.* FROM game_results AS r JOIN games AS g ON g.id = r.game_id
+)
+WHERE user_id IS NOT NULL
+GROUP BY board, user_id
+"""
+
+# Índices que cubren las consultas frecuentes: SQLite las responde desde el
+# índice, sin leer las filas de la tabla, aunque game_results crezca
+COVERING_INDEXES = """
+DROP INDEX IF EXISTS idx_game_results_user;
+DROP INDEX IF EXISTS idx_game_results_game;
+CREATE INDEX IF NOT EXISTS idx_game_results_user_completed
+    ON game_results (user_id, completed_at, game_id, score, accuracy, questions_correct, total_questions);
+CREATE INDEX IF NOT EXISTS idx_game_results_game_completed
+    ON game_results (game_id, completed_at, user_id, score, accuracy, questions_correct, total_questions);
+CREATE INDEX IF NOT EXISTS idx_assignment_submissions_assignment
+    ON assignment_submissions (assignment_id, submitted_at, student_id, points_earned, is_late);
+CREATE INDEX IF NOT EXISTS idx_assignment_submissions_student
+    ON assignment_submissions (student_id, submitted_at);
+CREATE INDEX IF NOT EXISTS idx_group_members_group
+    ON group_members (group_id, is_active, user_id, role);
+CREATE INDEX IF NOT EXISTS idx_group_members_user
+    ON group_members (user_id, is_active, group_id);
+CREATE INDEX IF NOT EXISTS idx_user_achievements_user
+    ON user_achievements (user_id, earned_at, achievement_id);
+CREATE INDEX IF NOT EXISTS idx_assignments_game ON assignments (game_id);
+"""
+
+def execute_script(conn: sqlite3.Connection, script: str) -> None:
+    """
+    Ejecuta las sentencias de `script` una por una dentro de la transacción
+    abierta; executescript haría COMMIT antes de empezar.
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        # Un trigger tiene ';' dentro: la sentencia termina donde SQLite la da por completa
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+def add_columns(table: str, columns: dict) -> Callable[[sqlite3.Connection], None]:
+    """Migración que agrega las columnas que falten en `table`"""
+    def migrate(conn: sqlite3.Connection) -> None:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, definition in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    return migrate
+
+def game_library(conn: sqlite3.Connection) -> None:
+    add_columns("games", GAME_LIBRARY_COLUMNS)(conn)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_games_created_by ON games (created_by, created_at)")
+
+def generation_jobs(conn: sqlite3.Connection) -> None:
+    execute_script(conn, GENERATION_JOBS)
+    # Bases creadas antes de que los trabajos se vincularan a un juego
+    add_columns("generation_jobs", {"game_id": "INTEGER REFERENCES games (id)"})(conn)
+
+def game_result_keys(conn: sqlite3.Connection) -> None:
+    add_columns("game_results", {"result_key": "TEXT"})(conn)
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_game_results_key ON game_results (result_key)")
+
+def leaderboards(conn: sqlite3.Connection) -> None:
+    created = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leaderboard_scores'"
+    ).fetchone() is None
+    execute_script(conn, LEADERBOARDS)
+    if created:
+        conn.execute(LEADERBOARDS_BACKFILL)
+
+MIGRATIONS: List[Tuple[int, str, Union[str, Callable[[sqlite3.Connection], None]]]] = [
+    (1, "initial_schema", INITIAL_SCHEMA),
+    (2, "question_cache", QUESTION_CACHE),
+    (3, "generation_usage", GENERATION_USAGE),
+    (4, "generation_jobs", generation_jobs),
+    (5, "game_library", game_library),
+    (6, "game_result_keys", game_result_keys),
+    (7, "leaderboards", leaderboards),
+    (8, "covering_indexes", COVERING_INDEXES),
+]
+
+def applied_versions(conn: sqlite3.Connection) -> set:
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """Aplica las migraciones pendientes y retorna sus versiones"""
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+    )
+    conn.commit()
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version in applied_versions(conn):
+            continue
+        # Otro proceso puede estar migrando: se vuelve a comprobar con la base bloqueada
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if version in applied_versions(conn):
+                conn.rollback()
+                continue
+            if callable(step):
+                step(conn)
+            else:
+                execute_script(conn, step)
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", (version, name))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+if __name__ == "__main__":
+    from database import DB_PATH, get_connection
+    db_path = sys.argv[1] if len(sys.argv) > 1 else DB_PATH
+    # get_connection aplica las migraciones pendientes
+    conn = get_connection(db_path)
+    for version, name, applied_at in conn.execute("SELECT version, name, applied_at FROM schema_migrations ORDER BY version"):
+        print(f"{version:>3} {name:<24} {applied_at}")
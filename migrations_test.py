@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+from migrations import INITIAL_SCHEMA, MIGRATIONS, execute_script, migrate
+from query_plans import review
+
+
+def connect(path):
+    conn = sqlite3.connect(str(path))
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def names(conn, kind):
+    return {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = ?", (kind,))}
+
+
+def test_an_empty_database_gets_every_migration_once(tmp_path):
+    conn = connect(tmp_path / "eduplay.db")
+
+    assert migrate(conn) == [version for version, _, _ in MIGRATIONS]
+    recorded = conn.execute("SELECT version, name FROM schema_migrations ORDER BY version").fetchall()
+    assert [tuple(row) for row in recorded] == [(version, name) for version, name, _ in MIGRATIONS]
+    assert {"users", "games", "game_results", "generation_jobs", "leaderboard_scores"} <= names(conn, "table")
+    assert {"idx_game_results_user_completed", "idx_group_members_group"} <= names(conn, "index")
+
+    # Applying again is a no-op
+    assert migrate(conn) == []
+    assert migrate(connect(tmp_path / "eduplay.db")) == []
+
+
+def test_a_shipped_database_only_gets_what_it_lacks(tmp_path):
+    conn = connect(tmp_path / "eduplay.db")
+    # The schema of the binary eduplay.db, with results saved before migrations existed
+    execute_script(conn, INITIAL_SCHEMA)
+    conn.execute("INSERT INTO games (id, title, subject, difficulty, game_mode, questions) "
+                 "VALUES (1, 'Células', 'Biología', 'Medio', 'quiz', '[]')")
+    conn.executemany("INSERT INTO game_results (user_id, game_id, score, questions_correct, total_questions, "
+                     "completed_at) VALUES (7, 1, ?, 3, 5, '2024-03-04 10:00:00')", [(100,), (50,)])
+    conn.commit()
+
+    migrate(conn)
+
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(games)")}
+    assert {"filename", "total_questions", "best_score"} <= columns
+    assert conn.execute("SELECT COUNT(*) FROM game_results").fetchone()[0] == 2
+    # Results saved before the leaderboards are summed once, on every board
+    boards = dict(conn.execute("SELECT board, points FROM leaderboard_scores WHERE user_id = 7").fetchall())
+    assert boards == {"global": 150, "subject:Biología": 150, "week:2024-10": 150}
+
+    # New results go through the trigger, not the backfill
+    conn.execute("INSERT INTO game_results (result_key, user_id, game_id, score) VALUES ('k', 7, 1, 10)")
+    conn.commit()
+    migrate(conn)
+    assert conn.execute("SELECT points FROM leaderboard_scores WHERE board = 'global'").fetchone()[0] == 160
+
+
+def test_a_failed_migration_is_rolled_back_and_not_recorded(tmp_path, monkeypatch):
+    conn = connect(tmp_path / "eduplay.db")
+
+    def broken(conn):
+        conn.execute("CREATE TABLE a_medias (id INTEGER)")
+        raise sqlite3.OperationalError("falla a mitad de camino")
+
+    monkeypatch.setattr("migrations.MIGRATIONS", MIGRATIONS + [(len(MIGRATIONS) + 1, "broken", broken)])
+    with pytest.raises(sqlite3.OperationalError):
+        migrate(conn)
+
+    assert "a_medias" not in names(conn, "table")
+    versions = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+    assert versions == {version for version, _, _ in MIGRATIONS}
+
+
+def test_hot_queries_do_not_scan_whole_tables(tmp_path):
+    flagged = {name: scans for name, (_, scans) in review(str(tmp_path / "eduplay.db")).items() if scans}
+
+    assert flagged == {}
+
+
+def test_query_plan_review_flags_a_missing_index(tmp_path):
+    path = str(tmp_path / "eduplay.db")
+    review(path)
+    conn = connect(path)
+    conn.execute("DROP INDEX idx_game_results_user_completed")
+    conn.commit()
+
+    flagged = {name for name, (_, scans) in review(path).items() if scans}
+
+    assert "results.by_user" in flagged
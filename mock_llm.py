@@ -0,0 +1,321 @@
+"""
+Offline stand-ins for the OpenAI backend: synthetic answers with configurable
+latency and errors, recorded-response replay, and a fake completions server.
+
+    EDUPLAY_LLM_BACKEND=mock streamlit run ui.py
+    EDUPLAY_LLM_BACKEND=replay EDUPLAY_LLM_REPLAY_PATH=data/llm_replay.jsonl streamlit run ui.py
+    python mock_llm.py --port 8765 --latency 0.8 --errors rate_limit=0.05
+    OPENAI_API_BASE=http://127.0.0.1:8765/v1 streamlit run ui.py
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import openai
+from langchain.llms.base import BaseLLM
+from langchain.schema import Generation, LLMResult
+
+DEFAULT_LATENCY_SECONDS = 0.5
+DEFAULT_LATENCY_SIGMA = 0.3
+# Simulated failures and what the real API answers for them
+ERROR_KINDS = {
+    "rate_limit": 429,
+    "server_error": 500,
+    "unavailable": 503,
+    "timeout": 504,
+}
+RATE_LIMIT_RETRY_AFTER_SECONDS = 1.0
+
+DOCUMENT = re.compile(r"<Begin Document (\d+)>\n(.*?)\n<End Document \1>", re.DOTALL)
+SINGLE_DOCUMENT = re.compile(r"<Begin Document>\n(.*?)\n<End Document>", re.DOTALL)
+PLAN_LINE = re.compile(r"^Documento (\d+): (\d+) preguntas \(([^)]*)\)", re.MULTILINE)
+SINGLE_COUNT = re.compile(r"genera exactamente (\d+) preguntas")
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+def parse_error_rates(spec: str) -> Dict[str, float]:
+    """Parses "rate_limit=0.05,timeout=0.01" into {kind: probability}."""
+    rates = {}
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        kind, _, value = part.partition("=")
+        if kind not in ERROR_KINDS:
+            raise ValueError(f"Unknown error kind: {kind}")
+        rates[kind] = float(value)
+    return rates
+
+def make_error(kind: str) -> openai.error.OpenAIError:
+    """The exception the openai client raises for a simulated failure."""
+    status = ERROR_KINDS[kind]
+    if kind == "rate_limit":
+        headers = {"retry-after": str(RATE_LIMIT_RETRY_AFTER_SECONDS)}
+        return openai.error.RateLimitError("Rate limit reached (simulated)", http_status=status, headers=headers)
+    if kind == "timeout":
+        return openai.error.Timeout("Request timed out (simulated)")
+    if kind == "unavailable":
+        return openai.error.ServiceUnavailableError("Service unavailable (simulated)", http_status=status)
+    return openai.error.APIError("Internal server error (simulated)", http_status=status)
+
+
+class SyntheticResponder():
+    """
+    Answers generation prompts with well-formed questions built from the
+    documents in the prompt, in whichever format the prompt asks for.
+
+    Latency is log-normal around `latency` seconds, and each call fails with
+    the probabilities in `error_rates`. With a `seed`, the content, latency
+    and failures of a given prompt are reproducible across runs.
+    """
+
+    def __init__(self, latency: float = DEFAULT_LATENCY_SECONDS, latency_sigma: float = DEFAULT_LATENCY_SIGMA,
+                 error_rates: Optional[Dict[str, float]] = None, seed: Optional[int] = None) -> None:
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rates = error_rates or {}
+        self.seed = seed
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt: str) -> random.Random:
+        if self.seed is None:
+            return random.Random()
+        key = prompt_key(prompt)
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        # Seeded per prompt and attempt: reproducible whatever the call order,
+        # and a retry of the same prompt does not replay the same failure
+        return random.Random(f"{self.seed}:{key}:{attempt}")
+
+    @staticmethod
+    def _questions(text: str, count: int, rng: random.Random) -> List[Dict[str, str]]:
+        sentences = [s.strip() for s in re.split(r"(?<=[.!?])\s+|\n+", text) if len(s.split()) >= 3] or [text.strip()]
+        questions = []
+        for k in range(count):
+            answer = sentences[k % len(sentences)]
+            distractors = [s for s in sentences if s != answer] or ["Ninguna de las anteriores"]
+            options = [answer[:120]] + [rng.choice(distractors)[:120] for _ in range(3)]
+            rng.shuffle(options)
+            topic = " ".join(answer.split()[:6])
+            questions.append({
+                "question": f"¿Qué afirma el documento sobre «{topic}»?",
+                "A": options[0], "B": options[1], "C": options[2], "D": options[3],
+                "reponse": "ABCD"[options.index(answer[:120])],
+            })
+        return questions
+
+    @staticmethod
+    def _as_text(questions: List[Dict[str, str]]) -> str:
+        return "\n\n".join(
+            f"Pregunta: {q['question']}\nOPCION_A: {q['A']}\nOPCION_B: {q['B']}\n"
+            f"OPCION_C: {q['C']}\nOPCION_D: {q['D']}\nRespuesta: {q['reponse']}"
+            for q in questions
+        )
+
+    def answer(self, prompt: str, rng: Optional[random.Random] = None) -> str:
+        """The completion text for `prompt`."""
+        rng = rng or random.Random(prompt_key(prompt))
+        documents = DOCUMENT.findall(prompt)
+        if not documents:
+            match = SINGLE_DOCUMENT.search(prompt)
+            count = SINGLE_COUNT.search(prompt)
+            text = match.group(1) if match else prompt
+            return self._as_text(self._questions(text, int(count.group(1)) if count else 2, rng))
+
+        counts = {int(number): int(count) for number, count, _ in PLAN_LINE.findall(prompt)}
+        if "arreglo JSON" in prompt:
+            items = []
+            for number, text in documents:
+                for question in self._questions(text, counts.get(int(number), 2), rng):
+                    items.append({"documento": int(number), **question})
+            return json.dumps(items, ensure_ascii=False)
+        return "\n\n".join(
+            f"### Documento {number}\n{self._as_text(self._questions(text, counts.get(int(number), 2), rng))}"
+            for number, text in documents
+        )
+
+    def sample(self, prompt: str) -> Tuple[float, Optional[str], str]:
+        """Returns (latency in seconds, simulated error kind or None, completion text) for one call."""
+        rng = self._rng(prompt)
+        latency = self.latency * math.exp(rng.gauss(0, self.latency_sigma)) if self.latency > 0 else 0.0
+        draw = rng.random()
+        for kind, rate in self.error_rates.items():
+            if draw < rate:
+                return latency, kind, ""
+            draw -= rate
+        return latency, None, self.answer(prompt, rng)
+
+
+class ReplayStore():
+    """
+    Completions recorded one JSON object per line, keyed by the hash of the
+    prompt. Misses are sent to `fallback` (usually the real backend) and
+    appended to the file, so a first run records and later runs replay.
+    """
+
+    def __init__(self, path: str, fallback: Optional[BaseLLM] = None) -> None:
+        self.path = path
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self._records: Dict[str, str] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._records[record["key"]] = record["text"]
+
+    def get(self, prompt: str) -> Optional[str]:
+        return self._records.get(prompt_key(prompt))
+
+    def record(self, prompt: str, text: str) -> None:
+        key = prompt_key(prompt)
+        with self._lock:
+            self._records[key] = text
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"key": key, "text": text}, ensure_ascii=False) + "\n")
+
+
+class MockLLM(BaseLLM):
+    """
+    LLM backend that never leaves the process. Answers come from `replay`
+    when the prompt was recorded, otherwise from `responder`; a replay miss
+    with a fallback LLM is forwarded to it and recorded.
+    """
+
+    responder: SyntheticResponder
+    replay: Optional[ReplayStore] = None
+    model_name: str = "mock"
+    calls: int = 0
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def _result(self, texts: List[str], prompts: List[str]) -> LLMResult:
+        prompt_tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+        completion_tokens = sum(estimate_tokens(text) for text in texts)
+        token_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        return LLMResult(
+            generations=[[Generation(text=text)] for text in texts],
+            llm_output={"token_usage": token_usage, "model_name": self.model_name},
+        )
+
+    async def _acomplete(self, prompt: str) -> str:
+        self.calls += 1
+        if self.replay is not None:
+            text = self.replay.get(prompt)
+            if text is not None:
+                return text
+            if self.replay.fallback is not None:
+                result = await self.replay.fallback.agenerate([prompt])
+                text = result.generations[0][0].text
+                self.replay.record(prompt, text)
+                return text
+        latency, error, text = self.responder.sample(prompt)
+        await asyncio.sleep(latency)
+        if error is not None:
+            raise make_error(error)
+        return text
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager: Any = None) -> LLMResult:
+        texts = [asyncio.run(self._acomplete(prompt)) for prompt in prompts]
+        return self._result(texts, prompts)
+
+    async def _agenerate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                         run_manager: Any = None) -> LLMResult:
+        texts = await asyncio.gather(*(self._acomplete(prompt) for prompt in prompts))
+        return self._result(list(texts), prompts)
+
+
+def responder_from_env() -> SyntheticResponder:
+    """SyntheticResponder configured by EDUPLAY_MOCK_LATENCY, EDUPLAY_MOCK_ERRORS and EDUPLAY_MOCK_SEED."""
+    seed = os.environ.get("EDUPLAY_MOCK_SEED")
+    return SyntheticResponder(
+        latency=float(os.environ.get("EDUPLAY_MOCK_LATENCY", DEFAULT_LATENCY_SECONDS)),
+        error_rates=parse_error_rates(os.environ.get("EDUPLAY_MOCK_ERRORS", "")),
+        seed=int(seed) if seed is not None else None,
+    )
+
+def create_app(responder: SyntheticResponder):
+    """aiohttp application answering /v1/chat/completions and /v1/completions like the OpenAI API."""
+    from aiohttp import web
+
+    async def complete(request, chat: bool):
+        body = await request.json()
+        if chat:
+            prompt = "\n".join(message.get("content", "") for message in body.get("messages", []))
+        else:
+            prompt = body.get("prompt", "")
+            prompt = prompt[0] if isinstance(prompt, list) else prompt
+        latency, error, text = responder.sample(prompt)
+        await asyncio.sleep(latency)
+        if error is not None:
+            headers = {"Retry-After": str(RATE_LIMIT_RETRY_AFTER_SECONDS)} if error == "rate_limit" else None
+            payload = {"error": {"message": f"{error} (simulated)", "type": error, "code": None}}
+            return web.json_response(payload, status=ERROR_KINDS[error], headers=headers)
+
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        choice = {"index": 0, "finish_reason": "stop"}
+        if chat:
+            choice["message"] = {"role": "assistant", "content": text}
+        else:
+            choice["text"] = text
+        return web.json_response({
+            "id": f"mock-{prompt_key(prompt)[:12]}",
+            "object": "chat.completion" if chat else "text_completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [choice],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    async def chat_completions(request):
+        return await complete(request, chat=True)
+
+    async def completions(request):
+        return await complete(request, chat=False)
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/completions", completions)
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI completions server for offline load tests.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY_SECONDS, help="median seconds per call")
+    parser.add_argument("--latency-sigma", type=float, default=DEFAULT_LATENCY_SIGMA)
+    parser.add_argument("--errors", default="", help="e.g. rate_limit=0.05,server_error=0.01")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    from aiohttp import web
+    responder = SyntheticResponder(args.latency, args.latency_sigma, parse_error_rates(args.errors), args.seed)
+    web.run_app(create_app(responder), host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
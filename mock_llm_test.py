@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+from aiohttp.test_utils import TestClient, TestServer
+
+from mock_llm import ERROR_KINDS, MockLLM, ReplayStore, SyntheticResponder, create_app
+
+PROMPT = ("Con el siguiente texto genera exactamente 3 preguntas.\n<Begin Document>\n"
+          "La mitocondria produce la energía de la célula. El núcleo guarda la información genética. "
+          "Los ribosomas sintetizan las proteínas.\n<End Document>")
+
+
+def complete(llm, prompt=PROMPT):
+    result = asyncio.run(llm.agenerate([prompt]))
+    return result.generations[0][0].text
+
+
+def test_replay_records_then_replays(tmp_path):
+    path = str(tmp_path / "llm_replay.jsonl")
+    fallback = MockLLM(responder=SyntheticResponder(latency=0, seed=1))
+    recording = MockLLM(responder=SyntheticResponder(latency=0, seed=2), replay=ReplayStore(path, fallback=fallback))
+
+    recorded = complete(recording)
+
+    assert fallback.calls == 1
+    assert [json.loads(line)["text"] for line in open(path, encoding="utf-8")] == [recorded]
+
+    # A new process replays the file without calling anything else
+    fallback.calls = 0
+    replaying = MockLLM(responder=SyntheticResponder(latency=0, seed=3), replay=ReplayStore(path, fallback=fallback))
+    assert complete(replaying) == recorded
+    assert fallback.calls == 0
+    # Prompts that were never recorded get a synthetic answer
+    assert complete(replaying, PROMPT.replace("3 preguntas", "2 preguntas")).count("Pregunta:") == 2
+
+
+def test_synthetic_answers_are_reproducible_per_seed():
+    def samples(seed):
+        responder = SyntheticResponder(latency=0.5, error_rates={"server_error": 0.3}, seed=seed)
+        return [responder.sample(PROMPT) for _ in range(10)]
+
+    first = samples(7)
+
+    assert samples(7) == first
+    assert samples(8) != first
+    # Retries of the same prompt are not stuck on the same failure
+    assert len({error for _, error, _ in first}) == 2
+    answer = next(text for _, error, text in first if error is None)
+    assert answer.count("Pregunta:") == 3
+    assert "La mitocondria produce la energía de la célula." in answer
+
+
+def test_fake_server_answers_like_the_openai_api():
+    async def run():
+        results = []
+        for responder in (SyntheticResponder(latency=0, seed=1),
+                          SyntheticResponder(latency=0, error_rates={"rate_limit": 1.0})):
+            async with TestClient(TestServer(create_app(responder))) as client:
+                response = await client.post("/v1/chat/completions", json={
+                    "model": "gpt-4o-mini", "messages": [{"role": "user", "content": PROMPT}],
+                })
+                results.append((response.status, response.headers.get("Retry-After"), await response.json()))
+        return results
+
+    (status, _, body), (error_status, retry_after, error) = asyncio.run(run())
+
+    assert status == 200
+    assert body["model"] == "gpt-4o-mini"
+    assert body["choices"][0]["message"]["content"].count("Pregunta:") == 3
+    assert body["usage"]["total_tokens"] == body["usage"]["prompt_tokens"] + body["usage"]["completion_tokens"]
+    assert error_status == ERROR_KINDS["rate_limit"]
+    assert retry_after is not None
+    assert error["error"]["type"] == "rate_limit"
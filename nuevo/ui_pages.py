@@ -3,12 +3,19 @@ Páginas individuales de la aplicación EduPlay
 """
 import streamlit as st
 import asyncio
+import html
 import json
+import os
 from datetime import datetime
 
 from nuevo.ui_components import *
 from ui_config import COLORS, MODERN_STYLES
 from ui_utils import db_manager, transform, clean_questions
+from extractors import supported_extensions
+from game_repository import get_game_repository
+from job_queue import get_job_queue
+from leaderboards import GLOBAL_BOARD, get_leaderboards, subject_board, week_board
+from upload_store import store_upload
 
 def show_login_page():
     """Página de login moderna"""
@@ -223,7 +230,7 @@ def show_upload_step():
 
     uploaded_file = st.file_uploader(
         "Selecciona tu archivo",
-        type=["pdf", "docx", "pptx", "txt"],
+        type=supported_extensions(),
         label_visibility="collapsed"
     )
 
@@ -347,11 +354,22 @@ def show_finalize_step():
             create_room()
 
 def create_room():
-    """Crea la sala con los datos proporcionados"""
-    # Simulación de creación
+    """Crea la sala con los datos proporcionados y encola la generación de sus preguntas"""
+    config = st.session_state.get('room_config', {})
+    file = st.session_state.uploaded_file
     with st.spinner("Creando tu sala..."):
-        import time
-        time.sleep(2)
+        # Cualquier formato soportado pasa por el mismo pipeline de extracción y generación
+        file_path = store_upload(file, os.path.splitext(file.name)[1].lower())
+        user_id = st.session_state.user_data['id']
+        difficulty = config.get('difficulty', 'Medio')
+        # La sala es un juego que se va llenando con las páginas que termine el trabajo
+        game = get_game_repository().create_game(
+            config.get('title') or file.name, config.get('subject', ''), difficulty,
+            config.get('game_mode', 'cuestionario'), [], filename=file.name, created_by=user_id
+        )
+        queue = get_job_queue()
+        job_id = queue.submit(file_path, difficulty=difficulty, user_id=user_id, file_name=file.name)
+        queue.attach_game(job_id, game['id'])
 
     # Éxito
     st.balloons()
@@ -399,18 +417,22 @@ def show_rooms_page():
     # Grid de salas
     rooms_html = '<div class="card-grid" style="margin-top: 2rem;">'
 
-    # Salas de ejemplo
-    rooms = [
-        ("Ecuaciones Cuadráticas", "Matemáticas", "Medio", 45, "🔢"),
-        ("Revolución Francesa", "Historia", "Difícil", 32, "📜"),
-        ("Sistema Solar", "Ciencias", "Fácil", 67, "🌍"),
-        ("Gramática Básica", "Lenguaje", "Fácil", 23, "📝"),
-        ("Capitales del Mundo", "Geografía", "Medio", 56, "🗺️"),
-        ("Verbos Irregulares", "Inglés", "Medio", 41, "🇬🇧")
-    ]
+    # Salas del usuario, con las preguntas que ya se han generado
+    rooms = get_game_repository().list_games(created_by=st.session_state.user_data['id'])
+    if search:
+        rooms = [room for room in rooms if search.lower() in room['title'].lower()]
+    if subject_filter != "Todas":
+        rooms = [room for room in rooms if room['subject'] == subject_filter]
+    if difficulty_filter != "Todas":
+        rooms = [room for room in rooms if room['difficulty'] == difficulty_filter]
 
-    for title, subject, difficulty, participants, emoji in rooms:
-        rooms_html += create_game_card(title, subject, difficulty, participants, emoji)
+    if not rooms:
+        st.info("No hay salas todavía. ¡Crea la primera!")
+        return
+
+    for room in rooms:
+        rooms_html += create_game_card(html.escape(room['title']), html.escape(room['subject']),
+                                       room['difficulty'], room['times_played'])
 
     rooms_html += '</div>'
 
@@ -519,41 +541,58 @@ def show_rankings_page():
     with tab1:
         # Ranking global
         st.markdown("<h3 style='color: #1f2937; margin: 2rem 0;'>Top 10 Global</h3>", unsafe_allow_html=True)
+        show_leaderboard(GLOBAL_BOARD)
 
-        rankings = [
-            ("María García", 2450, 8),
-            ("Juan López", 2380, 7),
-            ("Ana Martínez", 2290, 7),
-            ("Carlos Ruiz", 2150, 6),
-            ("Laura Díaz", 2100, 6),
-            ("Demo Usuario", 250, 3)
-        ]
+    with tab2:
+        subjects = get_leaderboards().subjects()
+        if subjects:
+            subject = st.selectbox("Materia", subjects, key="ranking_subject")
+            show_leaderboard(subject_board(subject))
+        else:
+            st.info("Todavía no hay partidas registradas por materia")
 
-        for i, (name, points, level) in enumerate(rankings):
-            medal = "🥇" if i == 0 else "🥈" if i == 1 else "🥉" if i == 2 else f"{i+1}."
+    with tab3:
+        st.markdown("<h3 style='color: #1f2937; margin: 2rem 0;'>Top 10 de la Semana</h3>", unsafe_allow_html=True)
+        show_leaderboard(week_board())
 
-            st.markdown(f"""
-            <div class="modern-card" style="
-                display: flex;
-                align-items: center;
-                gap: 1rem;
-                margin-bottom: 1rem;
-                {'background: linear-gradient(135deg, #fef3c7 0%, #fbbf24 100%);' if i < 3 else ''}
-            ">
-                <div style="
-                    font-size: 2rem;
-                    width: 60px;
-                    text-align: center;
-                ">{medal}</div>
-                <div style="flex: 1;">
-                    <div style="font-weight: 600; color: #1f2937;">{name}</div>
-                    <div style="display: flex; gap: 1rem; margin-top: 0.25rem;">
-                        {create_badge(f"Nivel {level}", "info")}
-                        {create_badge(f"{points} pts", "success")}
-                    </div>
+def show_leaderboard(board):
+    """Muestra el top 10 de un ranking y, si está más abajo, la posición del usuario"""
+    leaderboards = get_leaderboards()
+    players = leaderboards.top(board)
+    if not players:
+        st.info("Todavía no hay partidas registradas en este ranking")
+        return
+
+    me = leaderboards.rank(board, st.session_state.user_data['id'])
+    if me is not None and me['rank'] > len(players):
+        players = players + [me]
+
+    for player in players:
+        i = player['rank'] - 1
+        medal = "🥇" if i == 0 else "🥈" if i == 1 else "🥉" if i == 2 else f"{i+1}."
+
+        st.markdown(f"""
+        <div class="modern-card" style="
+            display: flex;
+            align-items: center;
+            gap: 1rem;
+            margin-bottom: 1rem;
+            {'background: linear-gradient(135deg, #fef3c7 0%, #fbbf24 100%);' if i < 3 else ''}
+        ">
+            <div style="
+                font-size: 2rem;
+                width: 60px;
+                text-align: center;
+            ">{medal}</div>
+            <div style="flex: 1;">
+                <div style="font-weight: 600; color: #1f2937;">{html.escape(player['name'])}</div>
+                <div style="display: flex; gap: 1rem; margin-top: 0.25rem;">
+                    {create_badge(f"Nivel {player['level']}", "info")}
+                    {create_badge(f"{player['points']} pts", "success")}
                 </div>
             </div>
-            """, unsafe_allow_html=True)
+        </div>
+        """, unsafe_allow_html=True)
 
 def show_groups_page():
     """Página de grupos de estudio"""
@@ -1,22 +1,8 @@
-from langchain.output_parsers.regex import RegexParser
-
-def transform(input_list):
-    new_list = []
-    for key in input_list:
-        if 'question1' in key or 'question2' in key:
-            question_dict = {}
-            question_num = key[-1]
-            question_dict[f'question'] = input_list[key]
-            question_dict[f'A'] = input_list[f'A_{question_num}']
-            question_dict[f'B'] = input_list[f'B_{question_num}']
-            question_dict[f'C'] = input_list[f'C_{question_num}']
-            question_dict[f'D'] = input_list[f'D_{question_num}']
-            question_dict[f'reponse'] = input_list[f'reponse{question_num}']
-            new_list.append(question_dict)
-    return new_list
-
-# Define input string to parse
-input_string = '''Pregunta: ¿Cuál es la principal contribución del artículo?
+from qcm_chain import BatchOutputParser, QCMOutputParser
+
+parser = QCMOutputParser()
+
+SAMPLE = '''Pregunta: ¿Cuál es la principal contribución del artículo?
 OPCION_A: Introducir una arquitectura híbrida que combina capas de deep learning con una capa final de razonamiento basada en un modelo gráfico discreto NP-hard
 OPCION_B: Proponer una nueva función de pérdida que gestiona de forma eficiente la información lógica
 OPCION_C: Usar modelos gráficos discretos como lenguaje de razonamiento
@@ -31,15 +17,99 @@ OPCION_D: Problemas de razonamiento NP-hard expresados como modelos gráficos di
 Respuesta: D
 '''
 
-output_parser = RegexParser(
-    regex=r"Pregunta:\s?(.*?)\nOPCION_A:\s?(.*?)\nOPCION_B:\s?(.*?)\nOPCION_C:\s?(.*?)\nOPCION_D:\s?(.*?)\nRespuesta:\s?(.*?)\n\nPregunta:\s?(.*?)\nOPCION_A:\s?(.*?)\nOPCION_B:\s?(.*?)\nOPCION_C:\s?(.*?)\nOPCION_D:\s?(.*?)\nRespuesta:\s?(.*)",
-    output_keys=["question1", "A_1", "B_1", "C_1", "D_1", "reponse1", "question2", "A_2", "B_2", "C_2", "D_2", "reponse2"]
-)
-# Use the RegexParser to parse the input string
-output_dict = transform(output_parser.parse(input_string))
+
+def test_parses_the_two_question_format():
+    parsed = parser.parse(SAMPLE)
+
+    assert parsed["errors"] == []
+    assert len(parsed["questions"]) == 2
+    first = parsed["questions"][0]
+    assert first["question"] == "¿Cuál es la principal contribución del artículo?"
+    assert first["C"] == "Usar modelos gráficos discretos como lenguaje de razonamiento"
+    assert first["D"] == "Todas las anteriores"
+    assert first["reponse"] == "D"
+    assert parsed["questions"][1]["A"] == "Solo problemas visuales"
+
+
+def test_any_number_of_questions():
+    block = "Pregunta: ¿{n}?\nOPCION_A: a\nOPCION_B: b\nOPCION_C: c\nOPCION_D: d\nRespuesta: B\n"
+
+    parsed = parser.parse("\n".join(block.format(n=n) for n in range(5)))
+
+    assert [question["question"] for question in parsed["questions"]] == [f"¿{n}?" for n in range(5)]
+
+
+def test_tolerates_blank_lines_casing_numbering_and_markdown():
+    text = """Aquí tienes las preguntas:
+
+**1. Pregunta 1:** ¿Qué orgánulo produce energía?
+
+opción a) Ribosoma
+Opcion_B: **Mitocondria**
+
+
+OPCION C. Núcleo
+D) Aparato de Golgi
+**Respuesta correcta:** b"""
+
+    parsed = parser.parse(text)
+
+    assert parsed["errors"] == []
+    assert parsed["questions"] == [{
+        "question": "¿Qué orgánulo produce energía?",
+        "A": "Ribosoma",
+        "B": "Mitocondria",
+        "C": "Núcleo",
+        "D": "Aparato de Golgi",
+        "reponse": "B",
+    }]
+
+
+def test_multi_line_fields_are_joined():
+    text = """Pregunta: ¿Cuál de estas afirmaciones
+sobre la fotosíntesis es correcta?
+OPCION_A: Ocurre en las mitocondrias
+OPCION_B: Libera oxígeno
+como producto secundario
+OPCION_C: Consume oxígeno
+OPCION_D: Ninguna
+Respuesta: B"""
+
+    question = parser.parse(text)["questions"][0]
+
+    assert question["question"] == "¿Cuál de estas afirmaciones sobre la fotosíntesis es correcta?"
+    assert question["B"] == "Libera oxígeno como producto secundario"
+
+
+def test_incomplete_block_is_reported_without_losing_the_others():
+    text = SAMPLE.replace("OPCION_C: Solo problemas de optimización de energía\n", "").replace(
+        "Respuesta: D\n", "", 1
+    )
+
+    parsed = parser.parse(text)
+
+    # The first block lost its answer, the second its option C
+    assert parsed["questions"] == []
+    assert [error["block"] for error in parsed["errors"]] == [1, 2]
+    assert "reponse" in parsed["errors"][0]["error"]
+    assert "C" in parsed["errors"][1]["error"]
+
+    parsed = parser.parse(SAMPLE + "\nPregunta: ¿Sin opciones?\n")
+    assert len(parsed["questions"]) == 2
+    assert parsed["errors"] == [{"block": 3, "error": "faltan campos: A, B, C, D, reponse", "text": "¿Sin opciones?"}]
+
+
+def test_text_without_questions():
+    assert parser.parse("Lo siento, no puedo generar preguntas.") == {"questions": [], "errors": []}
 
 
+def test_batch_output_is_split_by_document():
+    batch = BatchOutputParser(section_parser=parser)
+    first, second = SAMPLE.split("\n\n")
 
-# Print the parsed output
-print(output_dict)
+    sections = batch.parse(f"### Documento 1\n{first}\n\n### Documento 2\nNo hay preguntas.\n\n## Documento 3:\n{second}")
 
+    assert sorted(sections) == [1, 2, 3]
+    assert len(sections[1]["questions"]) == 1
+    assert sections[2] is None
+    assert sections[3]["questions"][0]["A"] == "Solo problemas visuales"
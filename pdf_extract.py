@@ -0,0 +1,95 @@
+"""Parallel PDF text extraction: page ranges fanned out to a process pool, pages streamed back in order."""
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator, List
+
+EXTRACT_WORKERS = int(os.environ.get("EDUPLAY_EXTRACT_WORKERS", str(min(4, os.cpu_count() or 1))))
+PAGES_PER_TASK = 16
+# Ranges submitted ahead of the one being consumed, per worker: bounds the
+# extracted text held in memory however long the document is
+TASKS_IN_FLIGHT_PER_WORKER = 2
+# Below this many pages starting the pool costs more than it saves
+INLINE_BELOW_PAGES = 2 * PAGES_PER_TASK
+
+_reader = (None, None)
+
+def open_pdf(pdf_file_name: str):
+    """
+    PdfReader for the file, reused by the next ranges of the same file. Only
+    the last file is kept, so each pool process holds at most one document.
+    """
+    global _reader
+    from pypdf import PdfReader
+    stat = os.stat(pdf_file_name)
+    key = (os.path.abspath(pdf_file_name), stat.st_mtime_ns, stat.st_size)
+    if _reader[0] != key:
+        _reader = (key, PdfReader(pdf_file_name))
+    return _reader[1]
+
+def count_pdf_pages(source: Any) -> int:
+    """Number of pages, from the page tree alone: no page's text is extracted."""
+    from pypdf import PdfReader
+    return len(PdfReader(source).pages)
+
+def extract_range(pdf_file_name: str, start: int, stop: int) -> List[str]:
+    """Text of pages [start, stop); runs in a pool process, which opens the PDF on its own."""
+    reader = open_pdf(pdf_file_name)
+    return [reader.pages[i].extract_text() for i in range(start, min(stop, len(reader.pages)))]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_extract_pool(workers: int = EXTRACT_WORKERS) -> ProcessPoolExecutor:
+    """
+    Returns the process-wide extraction pool. Workers are spawned rather than
+    forked: the app process runs event loop and worker threads that a fork
+    would copy in an arbitrary state.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def iter_pdf_pages(source: Any, workers: int = EXTRACT_WORKERS, pages_per_task: int = PAGES_PER_TASK) -> Iterator[str]:
+    """
+    Yields the text of every page in order. Ranges of `pages_per_task` pages
+    are extracted in parallel by the pool, at most TASKS_IN_FLIGHT_PER_WORKER
+    ranges per worker ahead of the consumer, so pages are available as soon as
+    their range is done and memory stays bounded for very long documents.
+
+    `source` is a path, or a binary file object (an upload's BytesIO) that is
+    read in place; pool processes need a path, so a file object is extracted inline.
+    """
+    from pypdf import PdfReader
+    reader = PdfReader(source)
+    total_pages = len(reader.pages)
+    if workers <= 1 or total_pages < INLINE_BELOW_PAGES or not isinstance(source, (str, os.PathLike)):
+        for page in reader.pages:
+            yield page.extract_text()
+        return
+
+    del reader  # the pool processes open their own
+    pool = get_extract_pool(workers)
+    starts = iter(range(0, total_pages, pages_per_task))
+    in_flight = deque()
+
+    def submit_next() -> None:
+        start = next(starts, None)
+        if start is not None:
+            in_flight.append(pool.submit(extract_range, source, start, start + pages_per_task))
+
+    for _ in range(workers * TASKS_IN_FLIGHT_PER_WORKER):
+        submit_next()
+    try:
+        while in_flight:
+            pages = in_flight.popleft().result()
+            submit_next()
+            yield from pages
+    finally:
+        # The consumer stopped early: drop the ranges nobody will read
+        for future in in_flight:
+            future.cancel()
@@ -1,31 +1,329 @@
 import asyncio
-from langchain.document_loaders import PyPDFLoader
-from quizz_generator import generate_quizz
-from ui_utils import transform
+import logging
+import random
+import threading
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+from chunking import chunk_pages, count_tokens, iter_chunks
+from dedup import QuestionDeduplicator
+from extractors import count_segments, iter_segments
+from metrics import get_metrics, new_upload_id, upload_id as current_upload_id
+from qa_llm import DEFAULT_MODEL
+from qcm_chain import DEFAULT_DIFFICULTY, MAX_DOCS_PER_CALL, QUESTIONS_PER_DOC
+from question_budget import estimate_cost, plan_questions, plan_within_budget
+from quizz_generator import generate_quizz_stream
+from usage import BudgetExceededError, get_usage_tracker
 
-async def pdf_to_quizz(pdf_file_name):
+logger = logging.getLogger(__name__)
 
+# Pages whose generation failed are retried on their own, after a jittered
+# exponential backoff, until each has been attempted PAGE_ATTEMPTS times
+PAGE_ATTEMPTS = 3
+PAGE_RETRY_BASE_SECONDS = 2.0
+# Chunks extracted ahead of generation when a document is streamed: bounds
+# the text held in memory when extraction is faster than the LLM
+STREAM_AHEAD_CHUNKS = 32
+# While streaming, chunks are planned, reserved and sent to the LLM in waves
+# of at most STREAM_WAVE_CHUNKS, each waiting at most STREAM_WAVE_SECONDS for
+# its chunks: calls keep carrying several pages when extraction is slow
+STREAM_WAVE_CHUNKS = 4 * MAX_DOCS_PER_CALL
+STREAM_WAVE_SECONDS = 0.5
 
-    loader = PyPDFLoader(pdf_file_name)
-    pages = loader.load_and_split()
+def load_pages(pdf_file_name) -> List[str]:
+    """
+    Extracts the document's text segments (PDF pages, docx sections, pptx
+    slides, text paragraphs; see extractors) and chunks them by tokens as they
+    arrive: boilerplate pages are dropped, small pages merged and oversized
+    ones split. `pdf_file_name` may also be a binary file object with a name,
+    such as an upload's BytesIO, which is read in place.
+    """
+    return chunk_pages(iter_segments(pdf_file_name))
 
-    sem = asyncio.Semaphore(10)  # Set the maximum number of parallel tasks
+async def aload_pages(pdf_file_name) -> List[str]:
+    """
+    load_pages without blocking the event loop. Only for a question budget
+    over a document whose length is unknown until it is read (see
+    count_segments), which needs every page before the first call, and for
+    resumed jobs; aiter_pages streams the pages otherwise.
+    """
+    return await asyncio.to_thread(load_pages, pdf_file_name)
 
-    async def process_page(page):
-        async with sem:
-            return await generate_quizz(page.page_content)
+async def aiter_pages(pdf_file_name) -> AsyncIterator[Tuple[str, int]]:
+    """
+    Yields the chunks of load_pages as they are extracted, by a thread, so
+    generation starts with the first pages while the rest are still being
+    read. Each chunk comes with the number of segments read up to it, which
+    tells how far into the document it is (see count_segments). At most
+    STREAM_AHEAD_CHUNKS chunks wait to be consumed.
+    """
+    loop = asyncio.get_running_loop()
+    chunks: asyncio.Queue = asyncio.Queue()
+    room = threading.Semaphore(STREAM_AHEAD_CHUNKS)
+    stopped = threading.Event()
+    end = object()
 
+    def put(item) -> bool:
+        # Waits for room, unless the consumer went away meanwhile
+        while not room.acquire(timeout=0.5):
+            if stopped.is_set() or loop.is_closed():
+                return False
+        if stopped.is_set():
+            return False
+        try:
+            loop.call_soon_threadsafe(chunks.put_nowait, item)
+        except RuntimeError:
+            # The consumer's loop is closed
+            return False
+        return True
+
+    def extract() -> None:
+        read = 0
+
+        def on_read() -> None:
+            nonlocal read
+            read += 1
+
+        try:
+            # A chunk is yielded once every segment it is made of was read
+            for chunk in iter_chunks(iter_segments(pdf_file_name, on_read=on_read)):
+                if not put(((chunk, read), None)):
+                    return
+            put((end, None))
+        except Exception as e:
+            put((end, e))
+
+    threading.Thread(target=extract, name="document-extract", daemon=True).start()
+    try:
+        while True:
+            item, error = await chunks.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            room.release()
+            yield item
+    finally:
+        stopped.set()
+
+async def _generate(pages: List[str], plans: List[List[str]], indexes: List[int], output_format: str,
+                    model_name: str, dedup: QuestionDeduplicator, failed: List[int]):
+    """One attempt at the pages in `indexes`: yields (page_index, questions), adds the pages that failed to `failed`."""
+    async for j, result in generate_quizz_stream([pages[i] for i in indexes], model_name, output_format,
+                                                 plans=[plans[i] for i in indexes]):
+        if result is None:
+            failed.append(indexes[j])
+            continue
+        questions = dedup.filter(result["questions"])
+        if len(questions) < len(result["questions"]):
+            get_metrics().inc("questions_deduplicated_total", len(result["questions"]) - len(questions))
+        yield indexes[j], questions
+
+async def _retry_failed(pages: List[str], plans: List[List[str]], failed: List[int], output_format: str,
+                        model_name: str, dedup: QuestionDeduplicator):
+    """Retries the failed pages together with backoff; yields with None questions those that never succeed."""
+    pending = sorted(failed)
+    for attempt in range(1, PAGE_ATTEMPTS):
+        if not pending:
+            break
+        get_metrics().inc("page_retries_total", len(pending))
+        await asyncio.sleep(PAGE_RETRY_BASE_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        failed = []
+        async for item in _generate(pages, plans, pending, output_format, model_name, dedup, failed):
+            yield item
+        pending = sorted(failed)
+    for i in pending:
+        get_metrics().inc("pages_failed_total")
+        yield i, None
+
+async def pages_to_quizz_stream(pages: List[str], output_format: str = "text", num_questions: Optional[int] = None,
+                                difficulty: str = DEFAULT_DIFFICULTY, upload_id: Optional[str] = None,
+                                user_id: Optional[int] = None, plans: Optional[List[List[str]]] = None,
+                                dedup: Optional[QuestionDeduplicator] = None, model_name: str = DEFAULT_MODEL):
+    """
+    Yields (page_index, questions) as soon as each page is generated, in completion order.
+    A failed page does not stop the others: failed pages are retried together with
+    backoff once the rest is done, and yielded with None questions if they never succeed.
+    `num_questions` is the budget for the whole document, spread across pages by
+    content density; pages that get no question are never sent to the LLM.
+
+    The quiz is reduced, or rejected with BudgetExceededError, before any call
+    when its estimated cost does not fit the user's and the day's budgets; the
+    check and the reservation of that cost are one transaction. `plans` skips
+    that step with an already approved and reserved plan (see job_queue).
+
+    Questions that nearly duplicate one already yielded (overlapping pages,
+    repeated headers) are dropped; `dedup` carries what an earlier run yielded.
+    Every LLM call is tagged with `upload_id` in metrics, logs and usage accounting.
+    """
+    upload_id = upload_id or new_upload_id()
+    current_upload_id.set(upload_id)
+    dedup = dedup or QuestionDeduplicator()
+    tracker = get_usage_tracker()
+    if plans is None:
+        plans, _ = plan_within_budget(pages, num_questions, difficulty, user_id, model_name, upload_id)
+    else:
+        estimate = estimate_cost([count_tokens(page, model_name) for page in pages], plans, model_name)
+        tracker.begin(upload_id, user_id, model_name, len(pages), sum(map(len, plans)), estimate)
+    status = "failed"
+    try:
+        failed = []
+        async for item in _generate(pages, plans, list(range(len(pages))), output_format, model_name, dedup, failed):
+            yield item
+        async for item in _retry_failed(pages, plans, failed, output_format, model_name, dedup):
+            yield item
+        status = "done"
+    finally:
+        tracker.finish(upload_id, status)
+
+async def stream_pages_to_quizz(chunks: AsyncIterator[Tuple[str, int]], output_format: str = "text",
+                                num_questions: Optional[int] = None, difficulty: str = DEFAULT_DIFFICULTY,
+                                upload_id: Optional[str] = None, user_id: Optional[int] = None,
+                                dedup: Optional[QuestionDeduplicator] = None, model_name: str = DEFAULT_MODEL,
+                                on_planned: Optional[Callable[[int, List[List[str]]], None]] = None,
+                                total_segments: Optional[int] = None):
+    """
+    pages_to_quizz_stream over (chunk, segments read) pairs that arrive while
+    the document is being extracted (see aiter_pages): the first pages are
+    generated while the next ones are still being read.
+
+    Chunks are planned, and their cost reserved, in waves as they arrive (see
+    STREAM_WAVE_CHUNKS). Without `num_questions` every chunk gets
+    QUESTIONS_PER_DOC questions. With it, each wave gets the share of the
+    budget of the segments it completes out of `total_segments`, spread
+    across its chunks by content density, and the last wave what is left.
+    When the money budget runs out the rest of the document is not read;
+    BudgetExceededError is raised only if not even one question fits.
+    `on_planned(first_page_index, plans)` gets each wave's plans before it is
+    generated.
+    """
+    if num_questions is not None and not total_segments:
+        raise ValueError("A question budget needs the document's total_segments")
+    upload_id = upload_id or new_upload_id()
+    current_upload_id.set(upload_id)
+    dedup = dedup or QuestionDeduplicator()
+    tracker = get_usage_tracker()
+    pages: List[str] = []
+    plans: List[List[str]] = []
+    failed: List[int] = []
+    arrived: asyncio.Queue = asyncio.Queue()
+    results: asyncio.Queue = asyncio.Queue()
+    end = object()
     tasks = []
-    for page in pages:
-        task = process_page(page)
-        tasks.append(task)
+
+    async def pump() -> None:
+        try:
+            async for chunk in chunks:
+                arrived.put_nowait(chunk)
+            arrived.put_nowait(end)
+        except Exception as e:
+            arrived.put_nowait(e)
+
+    async def generate_wave(indexes: List[int]) -> None:
+        try:
+            async for item in _generate(pages, plans, indexes, output_format, model_name, dedup, failed):
+                results.put_nowait(item)
+        except Exception as e:
+            results.put_nowait(e)
+
+    def wave_budget(segments_read: int, last: bool) -> Optional[int]:
+        """Questions for the next wave: the budget's share up to `segments_read`, minus those planned."""
+        if num_questions is None:
+            return None
+        share = num_questions if last else round(num_questions * min(1.0, segments_read / total_segments))
+        return max(0, share - sum(map(len, plans)))
+
+    def plan_wave(wave: List[str], budget: Optional[int]) -> bool:
+        """Plans and reserves a wave and starts generating it; False once the budget is spent."""
+        planned = sum(map(len, plans))
+        try:
+            wave_plans, _ = plan_within_budget(wave, budget, difficulty, user_id, model_name, upload_id,
+                                               first_question=planned)
+        except BudgetExceededError:
+            if not planned:
+                raise
+            logger.info("upload %s reached its budget after %d pages", upload_id, len(pages))
+            get_metrics().inc("uploads_truncated_total")
+            return False
+        first = len(pages)
+        pages.extend(wave)
+        plans.extend(wave_plans)
+        if on_planned is not None:
+            on_planned(first, wave_plans)
+        tasks.append(asyncio.ensure_future(generate_wave(list(range(first, len(pages))))))
+        # A reduced wave means the budget is spent
+        return sum(map(len, wave_plans)) == sum(map(len, plan_questions(wave, budget, difficulty)))
+
+    async def read() -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            item = None
+            while item is not end:
+                wave, segments_read, item = [], 0, await arrived.get()
+                # The first wave is the first chunk alone, so the first questions come quickly
+                limit = STREAM_WAVE_CHUNKS if pages else 1
+                deadline = loop.time() + STREAM_WAVE_SECONDS
+                while item is not end:
+                    if isinstance(item, Exception):
+                        raise item
+                    chunk, segments_read = item
+                    wave.append(chunk)
+                    if len(wave) >= limit:
+                        break
+                    try:
+                        item = await asyncio.wait_for(arrived.get(), max(0.0, deadline - loop.time()))
+                    except asyncio.TimeoutError:
+                        break
+                if wave and not plan_wave(wave, wave_budget(segments_read, item is end)):
+                    break
+            await asyncio.gather(*tasks)
+            results.put_nowait(end)
+        except Exception as e:
+            results.put_nowait(e)
+
+    tasks.append(asyncio.ensure_future(pump()))
+    reader = asyncio.ensure_future(read())
+    status = "failed"
+    try:
+        while True:
+            item = await results.get()
+            if item is end:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+        async for item in _retry_failed(pages, plans, failed, output_format, model_name, dedup):
+            yield item
+        status = "done"
+    finally:
+        reader.cancel()
+        for task in tasks:
+            task.cancel()
+        tracker.finish(upload_id, status)
+
+async def pdf_to_quizz_stream(pdf_file_name, output_format: str = "text", num_questions: Optional[int] = None,
+                              difficulty: str = DEFAULT_DIFFICULTY, user_id: Optional[int] = None):
+    total_segments = count_segments(pdf_file_name) if num_questions is not None else None
+    if num_questions is None or total_segments:
+        # Generate while extracting; a question budget is shared out as the pages are read
+        async for item in stream_pages_to_quizz(aiter_pages(pdf_file_name), output_format, num_questions,
+                                                difficulty, user_id=user_id, total_segments=total_segments):
+            yield item
+        return
+    # Formats whose length is only known once read (docx, txt) spread the budget over every page
+    pages = await aload_pages(pdf_file_name)
+    async for item in pages_to_quizz_stream(pages, output_format, num_questions, difficulty, user_id=user_id):
+        yield item
+
+async def pdf_to_quizz(pdf_file_name, output_format: str = "text", num_questions: Optional[int] = None,
+                       difficulty: str = DEFAULT_DIFFICULTY, user_id: Optional[int] = None):
+
+    questions_by_page = {}
+    async for i, questions in pdf_to_quizz_stream(pdf_file_name, output_format, num_questions, difficulty, user_id):
+        if questions is not None:
+            questions_by_page[i] = questions
 
     all_questions = []
 
-    questions = await asyncio.gather(*tasks)    
-    
-    for question in questions:
-        all_questions.extend(transform(question[0]))
+    for i in sorted(questions_by_page):
+        all_questions.extend(questions_by_page[i])
 
     return all_questions
-  
@@ -0,0 +1,205 @@
+import asyncio
+
+import pytest
+
+import adaptive_limiter
+import pdf_to_quizz
+from pdf_to_quizz import PAGE_ATTEMPTS, pages_to_quizz_stream, stream_pages_to_quizz
+from qa_llm import get_engine
+from usage import BudgetExceededError, get_usage_tracker
+
+
+def page(i):
+    return (f"Página {i}: la fotosíntesis número {i} transforma la energía luminosa en energía química "
+            f"dentro de los cloroplastos {i} de las células vegetales, produciendo glucosa y oxígeno {i}.")
+
+
+async def slow_chunks(events, count, delay=0.02):
+    for i in range(count):
+        await asyncio.sleep(delay)
+        events.append(("chunk", i))
+        # One segment per chunk
+        yield page(i), i + 1
+
+
+def test_generation_starts_before_the_document_is_read():
+    events = []
+
+    async def run():
+        async for i, questions in stream_pages_to_quizz(slow_chunks(events, 30), upload_id="stream-overlap"):
+            events.append(("page", i, questions))
+
+    asyncio.run(run())
+
+    pages = [event for event in events if event[0] == "page"]
+    assert sorted(event[1] for event in pages) == list(range(30))
+    assert all(event[2] is not None for event in pages)
+    first_page = next(n for n, event in enumerate(events) if event[0] == "page")
+    assert first_page < events.index(("chunk", 29))
+
+
+def test_planned_waves_cover_every_chunk_once():
+    planned = []
+
+    async def run():
+        return [i async for i, _ in stream_pages_to_quizz(
+            slow_chunks([], 25, delay=0), difficulty="Mixta", upload_id="stream-waves",
+            on_planned=lambda first, plans: planned.append((first, plans)),
+        )]
+
+    indexes = asyncio.run(run())
+
+    assert sorted(indexes) == list(range(25))
+    firsts = [first for first, _ in planned]
+    sizes = [len(plans) for _, plans in planned]
+    assert firsts == [sum(sizes[:n]) for n in range(len(sizes))]
+    assert sizes[0] == 1
+    # Mixed difficulty keeps cycling across waves
+    difficulties = [level for _, plans in planned for plan in plans for level in plan]
+    assert difficulties[:6] == ["Fácil", "Medio", "Difícil", "Fácil", "Medio", "Difícil"]
+
+
+def test_question_budget_is_shared_out_as_pages_arrive():
+    events = []
+    planned = []
+
+    async def run():
+        async for i, questions in stream_pages_to_quizz(
+            slow_chunks(events, 30), num_questions=12, difficulty="Mixta", upload_id="stream-questions",
+            on_planned=lambda first, plans: planned.append((first, plans)), total_segments=30,
+        ):
+            events.append(("page", i, questions))
+
+    asyncio.run(run())
+
+    plans = [plan for _, wave in planned for plan in wave]
+    assert len(plans) == 30
+    assert sum(map(len, plans)) == 12
+    # Each wave got the share of the budget of the pages read up to it
+    planned_so_far = 0
+    for first, wave in planned[:-1]:
+        planned_so_far += sum(map(len, wave))
+        assert planned_so_far == round(12 * (first + len(wave)) / 30)
+    difficulties = [level for plan in plans for level in plan]
+    assert difficulties[:3] == ["Fácil", "Medio", "Difícil"]
+    # and generation still overlaps extraction
+    first_question = next(n for n, event in enumerate(events) if event[0] == "page" and event[2])
+    assert first_question < events.index(("chunk", 29))
+
+
+def test_a_question_budget_needs_the_document_length():
+    async def run():
+        return [item async for item in stream_pages_to_quizz(slow_chunks([], 3, delay=0), num_questions=5)]
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+def test_reading_stops_when_the_budget_runs_out(monkeypatch):
+    tracker = get_usage_tracker()
+    monkeypatch.setattr(tracker, "max_upload_cost", 0.0006)
+    events = []
+
+    async def run():
+        return [i async for i, _ in stream_pages_to_quizz(slow_chunks(events, 60, delay=0), upload_id="stream-budget")]
+
+    indexes = asyncio.run(run())
+
+    assert 0 < len(indexes) < 60
+    usage = tracker.upload_usage("stream-budget")
+    assert usage["estimated_cost_usd"] <= 0.0006
+    assert usage["pages"] == len(indexes)
+
+
+def test_nothing_fits_the_budget(monkeypatch):
+    monkeypatch.setattr(get_usage_tracker(), "max_upload_cost", 0.0)
+
+    async def run():
+        return [item async for item in stream_pages_to_quizz(slow_chunks([], 3, delay=0), upload_id="stream-none")]
+
+    with pytest.raises(BudgetExceededError):
+        asyncio.run(run())
+
+
+@pytest.fixture
+def failing(monkeypatch):
+    """A mock model whose calls all fail, and the pages of each generation attempt."""
+    monkeypatch.setenv("EDUPLAY_MOCK_ERRORS", "server_error=1.0")
+    monkeypatch.setattr(pdf_to_quizz, "PAGE_RETRY_BASE_SECONDS", 0)
+    monkeypatch.setattr(adaptive_limiter, "BACKOFF_BASE_SECONDS", 0)
+    attempts = []
+    generate = pdf_to_quizz._generate
+
+    def recording(pages, plans, indexes, *args):
+        attempts.append(list(indexes))
+        return generate(pages, plans, indexes, *args)
+
+    monkeypatch.setattr(pdf_to_quizz, "_generate", recording)
+
+    def llm(model_name):
+        # A model name of its own: the mock reads EDUPLAY_MOCK_ERRORS when it is created
+        return get_engine().get_qa_llm(model_name).get_llm()
+
+    return llm, attempts
+
+
+def generate_pages(count, model_name):
+    async def run():
+        return dict([item async for item in pages_to_quizz_stream(
+            [page(i) for i in range(count)], plans=[["Medio"]] * count, model_name=model_name,
+        )])
+
+    return asyncio.run(run())
+
+
+def test_failed_pages_are_retried_together(failing, monkeypatch):
+    llm, attempts = failing
+    responder = llm("mock-retried").responder
+    generate = pdf_to_quizz._generate
+
+    def recovering(pages, plans, indexes, *args):
+        # The provider is back by the time of the retry
+        if attempts:
+            responder.error_rates = {}
+        return generate(pages, plans, indexes, *args)
+
+    monkeypatch.setattr(pdf_to_quizz, "_generate", recovering)
+    results = generate_pages(4, "mock-retried")
+
+    assert attempts == [[0, 1, 2, 3], [0, 1, 2, 3]]
+    assert sorted(results) == [0, 1, 2, 3]
+    assert all(len(questions) == 1 for questions in results.values())
+
+
+def test_pages_that_never_succeed_are_yielded_without_questions(failing):
+    llm, attempts = failing
+    llm("mock-down")
+
+    results = generate_pages(3, "mock-down")
+
+    assert results == {0: None, 1: None, 2: None}
+    assert len(attempts) == PAGE_ATTEMPTS
+    assert all(indexes == [0, 1, 2] for indexes in attempts)
+
+
+def test_a_failed_call_is_split_into_single_document_calls(failing, monkeypatch):
+    llm, attempts = failing
+    responder = llm("mock-split").responder
+    prompts = []
+    sample = responder.sample
+
+    def recording(prompt):
+        prompts.append(prompt)
+        return sample(prompt)
+
+    monkeypatch.setattr(responder, "sample", recording)
+    monkeypatch.setattr(pdf_to_quizz, "PAGE_ATTEMPTS", 1)
+
+    generate_pages(4, "mock-split")
+
+    batched = [prompt for prompt in prompts if "<Begin Document 2>" in prompt]
+    single = [prompt for prompt in prompts if "<Begin Document>" in prompt]
+    assert batched
+    # Every page of the failed multi-document call was asked for again on its own
+    assert all(any(page(i) in prompt for prompt in single) for i in range(4))
+    assert prompts.index(batched[0]) < max(prompts.index(prompt) for prompt in single)
@@ -1,12 +1,190 @@
+import asyncio
+import atexit
+import os
+import threading
+from typing import Callable, Dict
+
+import aiohttp
+import openai
 from langchain.llms import OpenAI
-from callback import MyCallbackHandler
+from langchain.llms.base import BaseLLM
+from adaptive_limiter import AdaptiveLimiter
+from callback import MetricsCallbackHandler
 from langchain.callbacks.base import BaseCallbackManager
+from mock_llm import MockLLM, ReplayStore, responder_from_env
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+# Connection pool shared by every generation request of the process
+HTTP_POOL_SIZE = 100
+HTTP_KEEPALIVE_SECONDS = 60
+REQUEST_TIMEOUT_SECONDS = 60
+# Retries are done by the engine's AdaptiveLimiter, which needs to see every 429
+LLM_MAX_RETRIES = 1
+
+# "openai" (default), or an offline backend from mock_llm: "mock", "replay", "record"
+LLM_BACKEND = os.environ.get("EDUPLAY_LLM_BACKEND", "openai")
+LLM_REPLAY_PATH = os.environ.get("EDUPLAY_LLM_REPLAY_PATH", "data/llm_replay.jsonl")
+
+def openai_backend(model_name: str, temperature: float, callback_manager: BaseCallbackManager) -> BaseLLM:
+    # Set OPENAI_API_BASE to point this at mock_llm's fake completions server
+    return OpenAI(temperature=temperature, callback_manager=callback_manager, model_name=model_name,
+                  max_retries=LLM_MAX_RETRIES, request_timeout=REQUEST_TIMEOUT_SECONDS)
+
+def mock_backend(model_name: str, temperature: float, callback_manager: BaseCallbackManager) -> BaseLLM:
+    return MockLLM(responder=responder_from_env(), model_name=model_name, callback_manager=callback_manager)
+
+def replay_backend(model_name: str, temperature: float, callback_manager: BaseCallbackManager) -> BaseLLM:
+    """Recorded answers, synthetic ones for prompts that were never recorded."""
+    return MockLLM(responder=responder_from_env(), replay=ReplayStore(LLM_REPLAY_PATH), model_name=model_name,
+                   callback_manager=callback_manager)
+
+def record_backend(model_name: str, temperature: float, callback_manager: BaseCallbackManager) -> BaseLLM:
+    """Recorded answers, the real API (recorded for next time) for the others."""
+    fallback = openai_backend(model_name, temperature, BaseCallbackManager([]))
+    return MockLLM(responder=responder_from_env(), replay=ReplayStore(LLM_REPLAY_PATH, fallback=fallback),
+                   model_name=model_name, callback_manager=callback_manager)
+
+LLM_BACKENDS: Dict[str, Callable[[str, float, BaseCallbackManager], BaseLLM]] = {
+    "openai": openai_backend,
+    "mock": mock_backend,
+    "replay": replay_backend,
+    "record": record_backend,
+}
+
+def register_backend(name: str, factory: Callable[[str, float, BaseCallbackManager], BaseLLM]) -> None:
+    """
+    Adds or replaces a backend. Must happen before the first generation, since
+    the engine keeps the LLMs it builds for the life of the process.
+    """
+    LLM_BACKENDS[name] = factory
 
 class QaLlm():
 
-    def __init__(self) -> None:
-        manager = BaseCallbackManager([MyCallbackHandler()])
-        self.llm = OpenAI(temperature=0, callback_manager=manager, model_name="gpt-4o-mini")
+    def __init__(self, model_name: str = DEFAULT_MODEL, temperature: float = 0, backend: str = None) -> None:
+        backend = backend or LLM_BACKEND
+        if backend not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend: {backend}")
+        manager = BaseCallbackManager([MetricsCallbackHandler(model_name)])
+        self.llm = LLM_BACKENDS[backend](model_name, temperature, manager)
 
     def get_llm(self):
         return self.llm
+
+
+class LlmEngine():
+    """
+    Process-wide generation engine.
+
+    Owns a background event loop with a single pooled keep-alive aiohttp
+    session, and one QaLlm and AdaptiveLimiter per model. Coroutines submitted from
+    any Streamlit session (each with its own `asyncio.run` loop) run on the
+    engine loop, so the session and the LLM clients are built once.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._llms = {}
+        self._limiters = {}
+        self._loop = None
+        self._session = None
+
+    def get_qa_llm(self, model_name: str = DEFAULT_MODEL, temperature: float = 0) -> QaLlm:
+        """Returns the shared QaLlm for this model configuration."""
+        key = (model_name, temperature)
+        with self._lock:
+            qa_llm = self._llms.get(key)
+            if qa_llm is None:
+                qa_llm = QaLlm(model_name=model_name, temperature=temperature)
+                self._llms[key] = qa_llm
+        return qa_llm
+
+    def get_limiter(self, model_name: str = DEFAULT_MODEL) -> AdaptiveLimiter:
+        """
+        Returns the concurrency limiter shared by every call to `model_name`,
+        whatever the session it comes from. Only usable on the engine loop.
+        """
+        with self._lock:
+            limiter = self._limiters.get(model_name)
+            if limiter is None:
+                limiter = AdaptiveLimiter()
+                self._limiters[model_name] = limiter
+        return limiter
+
+    def limiter_stats(self):
+        """Current window and counters of each model's limiter."""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {model_name: limiter.snapshot() for model_name, limiter in limiters.items()}
+
+    def _get_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="llm-engine", daemon=True)
+                thread.start()
+                self._loop = loop
+        return self._loop
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Only called from the engine loop, so no locking is needed here
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, keepalive_timeout=HTTP_KEEPALIVE_SECONDS)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _run_with_session(self, coro):
+        openai.aiosession.set(self._get_session())
+        return await coro
+
+    def submit(self, coro):
+        """Schedules `coro` on the engine loop and returns a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(self._run_with_session(coro), self._get_loop())
+
+    async def run(self, coro):
+        """Runs `coro` on the engine loop and awaits its result from the caller's loop."""
+        return await asyncio.wrap_future(self.submit(coro))
+
+    async def stream(self, agen):
+        """Iterates an async generator on the engine loop, yielding its items on the caller's loop."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        end = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    loop.call_soon_threadsafe(queue.put_nowait, (item, None))
+            except Exception as e:
+                loop.call_soon_threadsafe(queue.put_nowait, (end, e))
+            else:
+                loop.call_soon_threadsafe(queue.put_nowait, (end, None))
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is end:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            future.cancel()
+
+    def close(self) -> None:
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is None:
+            return
+        if self._session is not None:
+            asyncio.run_coroutine_threadsafe(self._session.close(), loop).result(timeout=5)
+            self._session = None
+        loop.call_soon_threadsafe(loop.stop)
+
+
+_engine = LlmEngine()
+atexit.register(_engine.close)
+
+def get_engine() -> LlmEngine:
+    return _engine
@@ -1,17 +1,29 @@
 """LLM Chain specifically for generating examples for QCM (Question Choix Multiples) answering."""
 from __future__ import annotations
 
-from typing import Any
+import asyncio
+import json
+import re
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
 
+from jsonschema import Draft7Validator
 from langchain.chains.llm import LLMChain
 from langchain.llms.base import BaseLLM
-from langchain.output_parsers.regex import RegexParser
+from langchain.schema import BaseOutputParser
 
 from langchain.prompts import PromptTemplate
 
+from adaptive_limiter import AdaptiveLimiter
+from metrics import page_ids
+
+# Bump whenever the templates or the parser change, so cached questions are regenerated
+PROMPT_VERSION = "3"
+
 template = """Eres un profesor creando preguntas para un cuestionario.
-Dado el siguiente documento, genera exactamente 2 preguntas de opción múltiple (MCQ),
+Dado el siguiente documento, genera exactamente {num_questions} preguntas de opción múltiple (MCQ),
 cada una con 4 opciones (OPCION_A, OPCION_B, OPCION_C, OPCION_D) y la letra de la respuesta correcta.
+La dificultad de cada pregunta, en orden, debe ser: {difficulties}.
+Fácil: recordar un dato explícito. Medio: comprender o relacionar ideas. Difícil: aplicar o inferir a partir de varias ideas.
 
 Usa el siguiente formato:
 
@@ -28,20 +40,465 @@ Las preguntas deben ser detalladas, claras y basadas únicamente en la informaci
 {doc}
 <End Document>"""
 
+batch_template = """Eres un profesor creando preguntas para un cuestionario.
+Se te dan {num_docs} documentos numerados. Para CADA documento, genera exactamente las preguntas de opción múltiple (MCQ)
+indicadas abajo, en ese orden y con esa dificultad, cada una con 4 opciones (OPCION_A, OPCION_B, OPCION_C, OPCION_D)
+y la letra de la respuesta correcta.
+Fácil: recordar un dato explícito. Medio: comprender o relacionar ideas. Difícil: aplicar o inferir a partir de varias ideas.
+
+{plans}
+
+Empieza las preguntas de cada documento con la línea "### Documento <número>" y usa el siguiente formato:
+
+### Documento 1
+Pregunta: <escribe la pregunta aquí>
+OPCION_A: <primera opción>
+OPCION_B: <segunda opción>
+OPCION_C: <tercera opción>
+OPCION_D: <cuarta opción>
+Respuesta: <A o B o C o D>
+
+Las preguntas deben ser detalladas, claras y basadas únicamente en la información proporcionada en cada documento.
+
+{docs}"""
+
+json_template = """Eres un profesor creando preguntas para un cuestionario.
+Se te dan {num_docs} documentos numerados. Para CADA documento, genera exactamente las preguntas de opción múltiple (MCQ)
+indicadas abajo, en ese orden y con esa dificultad, cada una con 4 opciones (A, B, C, D) y la letra de la respuesta correcta.
+Fácil: recordar un dato explícito. Medio: comprender o relacionar ideas. Difícil: aplicar o inferir a partir de varias ideas.
+
+{plans}
+
+Responde únicamente con un arreglo JSON, sin texto adicional, donde cada pregunta tenga esta forma:
+{{"documento": <número del documento>, "question": "<pregunta>", "A": "<opción A>", "B": "<opción B>", "C": "<opción C>", "D": "<opción D>", "reponse": "<A, B, C o D>"}}
+
+Las preguntas deben ser detalladas, claras y basadas únicamente en la información proporcionada en cada documento.
+
+{docs}"""
+
+OUTPUT_FORMATS = ("text", "json")
+QUESTIONS_PER_DOC = 2
+DIFFICULTY_LEVELS = ("Fácil", "Medio", "Difícil")
+# Requested for a whole quiz only: its questions cycle through DIFFICULTY_LEVELS
+MIXED_DIFFICULTY = "Mixta"
+DEFAULT_DIFFICULTY = "Medio"
+
+# Packing limits for multi-document calls: enough to amortize the template
+# without making a single response slow to stream back.
+MAX_DOCS_PER_CALL = 5
+MAX_CHARS_PER_CALL = 12000
+# The first call carries a single document so streaming callers get their
+# first questions after one page's latency rather than one batch's.
+FIRST_BATCH_DOCS = 1
 
-output_parser = RegexParser(
-    regex=r"Pregunta:\s?\n?(.*?)\nOPCION_A:\s?(.*?)\nOPCION_B:\s?(.*?)\nOPCION_C:\s?(.*?)\nOPCION_D:\s?(.*?)\nRespuesta:\s?(.*?)\n\nPregunta:\s?\n?(.*?)\nOPCION_A:\s?(.*?)\nOPCION_B:\s?(.*?)\nOPCION_C:\s?(.*?)\nOPCION_D:\s?(.*?)\nRespuesta:\s?(.*)",
-    output_keys=["question1", "A_1", "B_1", "C_1", "D_1", "reponse1", "question2", "A_2", "B_2", "C_2", "D_2", "reponse2"]
+
+QUESTION_LINE = re.compile(
+    r"^(?:\d+\s*[.)-]\s*)?(?:pregunta|question)(?:\s*(?:n[º°o.]\s*)?\d+)?\s*[:.)-]\s*(.*)$", re.IGNORECASE
+)
+OPTION_LINE = re.compile(r"^(?:opci[oó]n[\s_-]*|option[\s_-]*)?\(?([A-D])\s*[:.)-]\s*(.*)$", re.IGNORECASE)
+ANSWER_LINE = re.compile(
+    r"^(?:respuesta(?:\s+correcta)?|answer)\s*[:.-]?\s*(?:opci[oó]n[\s_-]*)?\(?([A-D])\b.*$", re.IGNORECASE
 )
 
+
+class QCMOutputParser(BaseOutputParser):
+    """
+    Line-oriented parser for any number of Pregunta/OPCION_A..D/Respuesta blocks.
+
+    Runs in linear time over the output and tolerates blank lines, casing,
+    markdown emphasis, numbering ("1. Pregunta 1:") and multi-line fields.
+    Incomplete blocks are reported in "errors" instead of failing the page.
+    """
+
+    @property
+    def _type(self) -> str:
+        """Return the type key."""
+        return "qcm_parser"
+
+    @staticmethod
+    def _clean(line: str) -> str:
+        return line.replace("**", "").strip().strip("*_#>` ").strip()
+
+    @staticmethod
+    def _finish(block: Dict[str, str], number: int, questions: List[Dict[str, str]], errors: List[Dict[str, Any]]) -> None:
+        question = {key: value.strip() for key, value in block.items()}
+        missing = [key for key in ("question", "A", "B", "C", "D", "reponse") if not question.get(key)]
+        if missing:
+            errors.append({
+                "block": number,
+                "error": f"faltan campos: {', '.join(missing)}",
+                "text": question.get("question", ""),
+            })
+        else:
+            questions.append(question)
+
+    def parse(self, text: str) -> Dict[str, List[Dict[str, Any]]]:
+        """Returns {"questions": [...], "errors": [...]} with one entry per block found."""
+        questions: List[Dict[str, str]] = []
+        errors: List[Dict[str, Any]] = []
+        block: Optional[Dict[str, Any]] = None
+        field = None
+        number = 0
+
+        for raw_line in text.splitlines():
+            line = self._clean(raw_line)
+            if not line:
+                continue
+
+            match = QUESTION_LINE.match(line)
+            if match:
+                if block is not None:
+                    self._finish(block, number, questions, errors)
+                number += 1
+                block, field = {"question": self._clean(match.group(1))}, "question"
+                continue
+            if block is None:
+                continue
+
+            match = ANSWER_LINE.match(line)
+            if match:
+                block["reponse"], field = match.group(1).upper(), None
+                continue
+
+            match = OPTION_LINE.match(line)
+            if match:
+                letter = match.group(1).upper()
+                block[letter], field = self._clean(match.group(2)), letter
+                continue
+
+            # Continuation of a multi-line question or option
+            if field is not None:
+                block[field] = f"{block[field]} {line}".strip()
+
+        if block is not None:
+            self._finish(block, number, questions, errors)
+        return {"questions": questions, "errors": errors}
+
+
+output_parser = QCMOutputParser()
+
+
+class BatchOutputParser(BaseOutputParser):
+    """Splits a multi-document answer on its "### Documento <n>" headers and parses each section."""
+
+    section_parser: BaseOutputParser
+
+    @property
+    def _type(self) -> str:
+        """Return the type key."""
+        return "qcm_batch_parser"
+
+    def parse(self, text: str) -> Dict[int, Optional[Dict[str, Any]]]:
+        """Returns the parsed section of each document number, None if a section has no valid question."""
+        parts = re.split(r"^\s*#{2,}\s*Documento\s+(\d+)\s*:?\s*$", text, flags=re.MULTILINE | re.IGNORECASE)
+        sections = {}
+        for number, body in zip(parts[1::2], parts[2::2]):
+            parsed = self.section_parser.parse(body.strip())
+            sections[int(number)] = parsed if parsed["questions"] else None
+        return sections
+
+
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question": {"type": "string", "minLength": 1},
+        "A": {"type": "string", "minLength": 1},
+        "B": {"type": "string", "minLength": 1},
+        "C": {"type": "string", "minLength": 1},
+        "D": {"type": "string", "minLength": 1},
+        "reponse": {"enum": ["A", "B", "C", "D"]},
+    },
+    "required": ["question", "A", "B", "C", "D", "reponse"],
+}
+
+QUESTION_ALIASES = {
+    "question": ("question", "pregunta"),
+    "reponse": ("reponse", "respuesta", "answer", "respuesta_correcta"),
+}
+
+
+class QCMJsonOutputParser(BaseOutputParser):
+    """
+    Parses a JSON array of questions tagged with their "documento" number.
+
+    Valid items are salvaged from malformed or truncated arrays, common
+    deviations (aliases, options as a list, "Respuesta: b") are repaired, and
+    each item is validated against QUESTION_SCHEMA on its own, so a bad item
+    never discards the rest of the page.
+    """
+
+    @property
+    def _type(self) -> str:
+        """Return the type key."""
+        return "qcm_json_parser"
+
+    @staticmethod
+    def _load_items(text: str) -> List[Any]:
+        text = re.sub(r"^\s*```(?:json)?|```\s*$", "", text.strip(), flags=re.IGNORECASE).strip()
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            data = next((value for value in data.values() if isinstance(value, list)), [data])
+        if isinstance(data, list):
+            return data
+
+        # Salvage every complete object from a truncated or malformed array
+        decoder = json.JSONDecoder()
+        items, position = [], text.find("{")
+        while position != -1:
+            try:
+                item, end = decoder.raw_decode(text, position)
+            except ValueError:
+                position = text.find("{", position + 1)
+                continue
+            items.append(item)
+            position = text.find("{", end)
+        return items
+
+    @staticmethod
+    def repair(item: Dict[str, Any]) -> Dict[str, str]:
+        """Maps an item onto the question/A..D/reponse shape used everywhere else."""
+        lowered = {str(key).strip().lower(): value for key, value in item.items()}
+        question = {}
+        for key, aliases in QUESTION_ALIASES.items():
+            question[key] = next((lowered[alias] for alias in aliases if alias in lowered), "")
+
+        options = lowered.get("opciones", lowered.get("options"))
+        for position, letter in enumerate("ABCD"):
+            value = lowered.get(letter.lower(), lowered.get(f"opcion_{letter.lower()}", ""))
+            if not value and isinstance(options, dict):
+                value = options.get(letter, options.get(letter.lower(), ""))
+            elif not value and isinstance(options, list) and position < len(options):
+                value = options[position]
+            question[letter] = value
+
+        question = {key: str(value).strip() for key, value in question.items()}
+        match = re.search(r"\b([A-D])\b", question["reponse"].upper().replace("RESPUESTA", ""))
+        question["reponse"] = match.group(1) if match else question["reponse"]
+        return question
+
+    def parse(self, text: str) -> Dict[int, Dict[str, List[Dict[str, Any]]]]:
+        """Returns {document number: {"questions": [...], "errors": [...]}}."""
+        sections: Dict[int, Dict[str, List[Dict[str, Any]]]] = {}
+        for block, item in enumerate(self._load_items(text), 1):
+            if not isinstance(item, dict):
+                continue
+            try:
+                number = int(item.get("documento", item.get("document", 1)))
+            except (TypeError, ValueError):
+                number = 1
+            section = sections.setdefault(number, {"questions": [], "errors": []})
+
+            question = self.repair(item)
+            error = next(iter(QUESTION_VALIDATOR.iter_errors(question)), None)
+            if error is None:
+                section["questions"].append(question)
+            else:
+                section["errors"].append({"block": block, "error": error.message, "text": question["question"]})
+        return sections
+
+
+QUESTION_VALIDATOR = Draft7Validator(QUESTION_SCHEMA)
+
+
 PROMPT = PromptTemplate(
-    input_variables=["doc"], template=template, output_parser=output_parser
+    input_variables=["doc", "num_questions", "difficulties"], template=template, output_parser=output_parser
 )
 
+BATCH_PROMPT = PromptTemplate(
+    input_variables=["num_docs", "plans", "docs"], template=batch_template,
+    output_parser=BatchOutputParser(section_parser=output_parser)
+)
+
+JSON_PROMPT = PromptTemplate(
+    input_variables=["num_docs", "plans", "docs"], template=json_template,
+    output_parser=QCMJsonOutputParser()
+)
+
+def format_documents(docs: List[str]) -> str:
+    """Formats documents as numbered blocks for BATCH_PROMPT."""
+    return "\n\n".join(
+        f"<Begin Document {i}>\n{doc}\n<End Document {i}>" for i, doc in enumerate(docs, 1)
+    )
+
+def format_plans(plans: List[List[str]]) -> str:
+    """Lists the number and difficulty of the questions requested for each numbered document."""
+    return "\n".join(
+        f"Documento {i}: {len(plan)} preguntas ({', '.join(plan)})" for i, plan in enumerate(plans, 1)
+    )
+
+def attach_difficulties(parsed: Optional[Dict[str, Any]], difficulties: List[str]) -> Optional[Dict[str, Any]]:
+    """Keeps the requested number of questions and tags each one with the difficulty it was asked for."""
+    if parsed is None:
+        return None
+    parsed["questions"] = parsed["questions"][:len(difficulties)]
+    for question, difficulty in zip(parsed["questions"], difficulties):
+        question["difficulty"] = difficulty
+    return parsed
+
+def pack_documents(docs: List[str], max_docs: int = MAX_DOCS_PER_CALL, max_chars: int = MAX_CHARS_PER_CALL,
+                   first_batch_docs: Optional[int] = None) -> List[List[int]]:
+    """Groups consecutive document indexes into batches bounded by count and size."""
+    batches = []
+    current, size = [], 0
+    for i, doc in enumerate(docs):
+        limit = first_batch_docs if first_batch_docs and not batches else max_docs
+        if current and (len(current) >= limit or size + len(doc) > max_chars):
+            batches.append(current)
+            current, size = [], 0
+        current.append(i)
+        size += len(doc)
+    if current:
+        batches.append(current)
+    return batches
+
+
 class QCMGenerateChain(LLMChain):
     """LLM Chain specifically for generating examples for QCM answering."""
 
     @classmethod
-    def from_llm(cls, llm: BaseLLM, **kwargs: Any) -> QCMGenerateChain:
+    def from_llm(cls, llm: BaseLLM, prompt: PromptTemplate = PROMPT, **kwargs: Any) -> QCMGenerateChain:
         """Load QA Generate Chain from LLM."""
-        return cls(llm=llm, prompt=PROMPT, **kwargs)
+        return cls(llm=llm, prompt=prompt, **kwargs)
+
+    async def _aparse_single(self, doc: str, difficulties: List[str]) -> Optional[Dict[str, Any]]:
+        inputs = {"doc": doc, "num_questions": len(difficulties), "difficulties": ", ".join(difficulties)}
+        parsed = (await self.aapply_and_parse([inputs]))[0]
+        return attach_difficulties(parsed, difficulties) if parsed["questions"] else None
+
+    async def _aparse_batch(self, docs: List[str], plans: List[List[str]]) -> List[Optional[Dict[str, Any]]]:
+        prompt = BATCH_PROMPT.format(num_docs=len(docs), plans=format_plans(plans), docs=format_documents(docs))
+        result = await self.llm.agenerate([prompt])
+        sections = BATCH_PROMPT.output_parser.parse(result.generations[0][0].text)
+        return [attach_difficulties(sections.get(i), plan) for i, plan in enumerate(plans, 1)]
+
+    async def _aparse_json(self, docs: List[str], plans: List[List[str]]) -> List[Optional[Dict[str, Any]]]:
+        prompt = JSON_PROMPT.format(num_docs=len(docs), plans=format_plans(plans), docs=format_documents(docs))
+        result = await self.llm.agenerate([prompt])
+        sections = JSON_PROMPT.output_parser.parse(result.generations[0][0].text)
+        return [attach_difficulties(sections.get(i), plan) for i, plan in enumerate(plans, 1)]
+
+    async def aiter_apply_and_parse(
+        self,
+        docs: List[str],
+        max_docs_per_call: int = MAX_DOCS_PER_CALL,
+        max_chars_per_call: int = MAX_CHARS_PER_CALL,
+        limiter: Optional[AdaptiveLimiter] = None,
+        output_format: str = "text",
+        num_questions: int = QUESTIONS_PER_DOC,
+        plans: Optional[List[List[str]]] = None,
+        doc_ids: Optional[List[int]] = None,
+    ) -> AsyncIterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """
+        Generates questions for a whole list of documents, packing several
+        documents into each LLM call, and yields (index, parsed) pairs as soon
+        as each document is done. `parsed` is {"questions": [...], "errors": [...]},
+        or None for documents without any valid question or whose calls failed;
+        a failed call never stops the other documents.
+
+        `plans` gives the difficulty of each question to generate per document
+        (see question_budget.plan_questions); by default every document gets
+        `num_questions` questions of DEFAULT_DIFFICULTY. Documents with an empty
+        plan are not sent to the LLM. `doc_ids` are the page numbers reported
+        in metrics and logs, the document indexes by default.
+
+        With output_format="text" the regex-era prompt is used and documents
+        missing from a batch answer are regenerated on their own. With "json"
+        only the missing or malformed questions of a document are requested
+        again. Calls go through `limiter`, which bounds concurrency and retries
+        rate limits and timeouts.
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
+        if plans is None:
+            plans = [[DEFAULT_DIFFICULTY] * num_questions for _ in docs]
+        queue: asyncio.Queue = asyncio.Queue()
+        if limiter is None:
+            limiter = AdaptiveLimiter()
+
+        async def generate(indexes: List[int], batch_plans: List[List[str]]) -> List[Optional[Dict[str, Any]]]:
+            batch = [docs[i] for i in indexes]
+            # Each call runs in its own task, so this only tags this call's metrics
+            page_ids.set(tuple(doc_ids[i] if doc_ids else i for i in indexes))
+            if output_format == "json":
+                return await limiter.call(lambda: self._aparse_json(batch, batch_plans))
+            if len(batch) == 1:
+                return [await limiter.call(lambda: self._aparse_single(batch[0], batch_plans[0]))]
+            return await limiter.call(lambda: self._aparse_batch(batch, batch_plans))
+
+        async def complete_json(i: int, partial: Optional[Dict[str, Any]]) -> None:
+            partial = partial or {"questions": [], "errors": []}
+            missing = plans[i][len(partial["questions"]):]
+            try:
+                extra = (await generate([i], [missing]))[0]
+            except Exception:
+                extra = None
+            extra = extra or {"questions": [], "errors": []}
+            merged = {
+                "questions": partial["questions"] + extra["questions"],
+                "errors": partial["errors"] + extra["errors"],
+            }
+            queue.put_nowait((i, merged if merged["questions"] else None))
+
+        async def run_batch(indexes: List[int]) -> None:
+            try:
+                try:
+                    parsed = await generate(indexes, [plans[i] for i in indexes])
+                except Exception:
+                    # The callback handler already logged it; only this call's documents fail,
+                    # and those of a multi-document call are retried one by one
+                    parsed = [None] * len(indexes)
+                retry = []
+                for i, result in zip(indexes, parsed):
+                    if output_format == "json":
+                        if result is not None and len(result["questions"]) >= len(plans[i]):
+                            queue.put_nowait((i, result))
+                        else:
+                            retry.append(complete_json(i, result))
+                    elif result is None and len(indexes) > 1:
+                        retry.append(run_batch([i]))
+                    else:
+                        queue.put_nowait((i, result))
+                if retry:
+                    await asyncio.gather(*retry)
+            except Exception as e:
+                queue.put_nowait(e)
+
+        wanted = [i for i, plan in enumerate(plans) if plan]
+        for i in range(len(docs)):
+            if not plans[i]:
+                queue.put_nowait((i, {"questions": [], "errors": []}))
+        batches = pack_documents([docs[i] for i in wanted], max_docs_per_call, max_chars_per_call, FIRST_BATCH_DOCS)
+        tasks = [asyncio.ensure_future(run_batch([wanted[j] for j in batch])) for batch in batches]
+        try:
+            for _ in range(len(docs)):
+                item = await queue.get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def abatch_apply_and_parse(
+        self,
+        docs: List[str],
+        max_docs_per_call: int = MAX_DOCS_PER_CALL,
+        max_chars_per_call: int = MAX_CHARS_PER_CALL,
+        limiter: Optional[AdaptiveLimiter] = None,
+        output_format: str = "text",
+        num_questions: int = QUESTIONS_PER_DOC,
+        plans: Optional[List[List[str]]] = None,
+    ) -> List[Optional[Dict[str, Any]]]:
+        """
+        Batch version of aiter_apply_and_parse: returns one parsed result per
+        document, in order, or None for documents without any valid question.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(docs)
+        async for i, result in self.aiter_apply_and_parse(
+            docs, max_docs_per_call, max_chars_per_call, limiter, output_format, num_questions, plans
+        ):
+            results[i] = result
+        return results
@@ -0,0 +1,119 @@
+import asyncio
+import json
+from typing import Any, List, Optional
+
+from langchain.llms.base import BaseLLM
+from langchain.schema import Generation, LLMResult
+
+from adaptive_limiter import AdaptiveLimiter
+from qcm_chain import QCMGenerateChain, QCMJsonOutputParser
+
+parser = QCMJsonOutputParser()
+
+
+def item(documento, question, reponse="A"):
+    return {"documento": documento, "question": question, "A": "a", "B": "b", "C": "c", "D": "d", "reponse": reponse}
+
+
+class ScriptedLLM(BaseLLM):
+    """Answers each call with the next scripted text and keeps the prompts it was sent."""
+
+    responses: List[str]
+    prompts: List[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None, run_manager: Any = None) -> LLMResult:
+        generations = []
+        for prompt in prompts:
+            self.prompts.append(prompt)
+            generations.append([Generation(text=self.responses.pop(0))])
+        return LLMResult(generations=generations)
+
+    async def _agenerate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                         run_manager: Any = None) -> LLMResult:
+        return self._generate(prompts, stop)
+
+
+def test_parses_a_fenced_array_by_document():
+    text = "```json\n" + json.dumps([item(1, "¿Uno?"), item(2, "¿Dos?", "C"), item(2, "¿Tres?")]) + "\n```"
+
+    sections = parser.parse(text)
+
+    assert sorted(sections) == [1, 2]
+    assert [question["question"] for question in sections[2]["questions"]] == ["¿Dos?", "¿Tres?"]
+    assert sections[2]["questions"][0] == {"question": "¿Dos?", "A": "a", "B": "b", "C": "c", "D": "d", "reponse": "C"}
+
+
+def test_array_wrapped_in_an_object():
+    sections = parser.parse(json.dumps({"preguntas": [item(1, "¿Uno?")]}))
+
+    assert len(sections[1]["questions"]) == 1
+
+
+def test_complete_items_are_salvaged_from_a_truncated_array():
+    text = json.dumps([item(1, "¿Uno?"), item(1, "¿Dos?")])
+    truncated = text[:-40]
+
+    sections = parser.parse(truncated)
+
+    assert [question["question"] for question in sections[1]["questions"]] == ["¿Uno?"]
+
+
+def test_common_deviations_are_repaired():
+    repaired = parser.repair({
+        "Pregunta": " ¿Qué orgánulo produce energía? ",
+        "opciones": ["Ribosoma", "Mitocondria", "Núcleo", "Golgi"],
+        "Respuesta": "Respuesta: b",
+    })
+
+    assert repaired == {
+        "question": "¿Qué orgánulo produce energía?",
+        "A": "Ribosoma",
+        "B": "Mitocondria",
+        "C": "Núcleo",
+        "D": "Golgi",
+        "reponse": "B",
+    }
+    repaired = parser.repair({"question": "¿x?", "options": {"a": "1", "b": "2", "c": "3", "d": "4"}, "answer": "d)"})
+    assert [repaired[letter] for letter in "ABCD"] == ["1", "2", "3", "4"]
+    assert repaired["reponse"] == "D"
+
+
+def test_a_malformed_item_does_not_discard_the_others():
+    bad = item(1, "¿Sin opción D?")
+    del bad["D"]
+    wrong_answer = item(1, "¿Respuesta E?", "E")
+
+    sections = parser.parse(json.dumps([item(1, "¿Válida?"), bad, wrong_answer, "texto suelto"]))
+
+    assert [question["question"] for question in sections[1]["questions"]] == ["¿Válida?"]
+    assert [error["block"] for error in sections[1]["errors"]] == [2, 3]
+    assert [error["text"] for error in sections[1]["errors"]] == ["¿Sin opción D?", "¿Respuesta E?"]
+
+
+def test_json_mode_requests_only_the_missing_questions():
+    llm = ScriptedLLM(responses=[
+        json.dumps([item(1, "¿Página 1?")]),
+        # Document 2 comes back with one of its two questions, the other is invalid
+        json.dumps([item(1, "¿Página 2, primera?"), item(2, "¿Página 3?"), item(2, "¿Página 3 otra?"),
+                    {**item(1, "¿Incompleta?"), "A": ""}]),
+        json.dumps([item(1, "¿Página 2, segunda?")]),
+    ], prompts=[])
+    chain = QCMGenerateChain.from_llm(llm)
+    plans = [["Fácil"], ["Fácil", "Difícil"], ["Medio", "Medio"]]
+
+    results = asyncio.run(chain.abatch_apply_and_parse(
+        ["página uno", "página dos", "página tres"], limiter=AdaptiveLimiter(), output_format="json", plans=plans
+    ))
+
+    assert len(llm.prompts) == 3
+    assert "Documento 1: 1 preguntas (Difícil)" in llm.prompts[2]
+    assert "página dos" in llm.prompts[2] and "página tres" not in llm.prompts[2]
+    assert [question["question"] for question in results[1]["questions"]] == ["¿Página 2, primera?",
+                                                                              "¿Página 2, segunda?"]
+    assert [question["difficulty"] for question in results[1]["questions"]] == ["Fácil", "Difícil"]
+    assert len(results[1]["errors"]) == 1
+    assert len(results[2]["questions"]) == 2
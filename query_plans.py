@@ -0,0 +1,113 @@
+"""
+Revisión de los planes de consulta de eduplay.db
+
+Ejecuta EXPLAIN QUERY PLAN sobre las consultas de la aplicación y marca las
+que recorren una tabla completa. Uso:
+
+    python query_plans.py [ruta de la base] [--all]
+
+Sin --all solo se muestran los planes marcados. Retorna 1 si hay alguno,
+así que puede correr en CI después de agregar una consulta o una migración.
+"""
+import re
+import sys
+from typing import Any, Dict, List, Tuple
+
+from database import DB_PATH, get_connection
+from game_repository import LIST_GAMES, SELECT_GAME, SELECT_QUESTIONS
+from job_queue import CLAIM_JOB
+from results_recorder import INSERT_SUBMISSION
+from usage import SPENT_TODAY
+from user_progress import RECORD_GAMES, SELECT_ACHIEVEMENTS, SELECT_PROGRESS
+
+# Consultas frecuentes con parámetros de ejemplo; al agregar una consulta a la
+# aplicación, agregarla aquí
+APP_QUERIES: Dict[str, Tuple[str, Any]] = {
+    "games.list": (LIST_GAMES, (1, 20, 0)),
+    "games.get": (SELECT_GAME, (1,)),
+    "games.questions": (SELECT_QUESTIONS, (1,)),
+    "users.progress": (SELECT_PROGRESS, (1,)),
+    "users.achievements": (SELECT_ACHIEVEMENTS, (1,)),
+    "users.record_games": (RECORD_GAMES, (10, 10, 1, 1, 1, 1)),
+    "usage.spent_today": (SPENT_TODAY, ()),
+    "usage.spent_today_user": (f"{SPENT_TODAY} AND user_id = ?", (1,)),
+    "jobs.claim": (CLAIM_JOB, ("worker", 0, 0)),
+    "jobs.pages": (
+        "SELECT page_index, questions, seq FROM generation_job_pages WHERE job_id = ? AND seq > ? ORDER BY seq",
+        ("job", 0),
+    ),
+    "jobs.stale": ("UPDATE generation_jobs SET status = 'queued', worker = NULL "
+                   "WHERE status = 'running' AND heartbeat_at < ?", (0,)),
+    "leaderboards.board": ("SELECT user_id, points FROM leaderboard_scores WHERE board = ?", ("global",)),
+    "leaderboards.top": (
+        "SELECT user_id, points FROM leaderboard_scores WHERE board = ? ORDER BY points DESC, user_id LIMIT ?",
+        ("global", 10),
+    ),
+    "results.submission": (INSERT_SUBMISSION, {"assignment_id": 1, "result_key": "key"}),
+    "results.by_user": (
+        "SELECT game_id, score, accuracy, completed_at FROM game_results "
+        "WHERE user_id = ? ORDER BY completed_at DESC LIMIT 50",
+        (1,),
+    ),
+    "results.by_game_and_date": (
+        "SELECT user_id, score, accuracy, questions_correct, total_questions FROM game_results "
+        "WHERE game_id = ? AND completed_at >= ?",
+        (1, "2024-01-01"),
+    ),
+    "results.game_summary": (
+        "SELECT COUNT(*), AVG(score), AVG(accuracy) FROM game_results WHERE game_id = ? AND completed_at >= ?",
+        (1, "2024-01-01"),
+    ),
+    "submissions.by_assignment": (
+        "SELECT student_id, points_earned, is_late, submitted_at FROM assignment_submissions "
+        "WHERE assignment_id = ? ORDER BY submitted_at",
+        (1,),
+    ),
+    "submissions.by_student": (
+        "SELECT assignment_id, points_earned FROM assignment_submissions WHERE student_id = ? ORDER BY submitted_at DESC",
+        (1,),
+    ),
+    "members.by_group": (
+        "SELECT user_id, role FROM group_members WHERE group_id = ? AND is_active",
+        (1,),
+    ),
+    "members.groups_of_user": (
+        "SELECT group_id FROM group_members WHERE user_id = ? AND is_active",
+        (1,),
+    ),
+}
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)")
+
+def explain(conn, sql: str, params: Any) -> List[str]:
+    return [row["detail"] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+def full_scans(conn, plan: List[str]) -> List[str]:
+    """Pasos del plan que recorren una tabla entera (no un subquery ni una fila constante)"""
+    tables = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return [step for step in plan if (match := FULL_SCAN.match(step)) and match.group(1) in tables]
+
+def review(db_path: str = DB_PATH) -> Dict[str, Tuple[List[str], List[str]]]:
+    """Plan y recorridos completos de cada consulta de APP_QUERIES"""
+    conn = get_connection(db_path)
+    # Con estadísticas actualizadas el planificador elige como lo hará en producción
+    conn.execute("ANALYZE")
+    results = {}
+    for name, (sql, params) in APP_QUERIES.items():
+        plan = explain(conn, sql, params)
+        results[name] = (plan, full_scans(conn, plan))
+    return results
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    show_all = "--all" in sys.argv
+    flagged = 0
+    for name, (plan, scans) in review(args[0] if args else DB_PATH).items():
+        if scans:
+            flagged += 1
+        if scans or show_all:
+            print(f"{'⚠️ ' if scans else '✅'} {name}")
+            for step in plan:
+                print(f"      {'>> ' if step in scans else '   '}{step}")
+    print(f"{flagged} de {len(APP_QUERIES)} consultas recorren tablas completas")
+    sys.exit(1 if flagged else 0)
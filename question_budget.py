@@ -0,0 +1,127 @@
+"""Spreads a quiz's question budget across pages and assigns each question a difficulty."""
+import heapq
+import re
+from typing import List, Optional, Tuple
+
+from chunking import count_tokens
+from metrics import cost_usd
+from qa_llm import DEFAULT_MODEL
+from qcm_chain import (
+    DEFAULT_DIFFICULTY, DIFFICULTY_LEVELS, MAX_DOCS_PER_CALL, MIXED_DIFFICULTY, QUESTIONS_PER_DOC
+)
+from usage import BudgetExceededError, get_usage_tracker
+
+# No page gets more than this many questions, however dense it is
+MAX_QUESTIONS_PER_PAGE = 5
+# Rough size of the prompt template per call and of one generated question
+PROMPT_OVERHEAD_TOKENS = 350
+COMPLETION_TOKENS_PER_QUESTION = 120
+
+CONTENT_WORD = re.compile(r"[^\W\d_]{4,}")
+
+def content_density(text: str) -> int:
+    """
+    Number of distinct content words on a page: repeated headers, filler and
+    short function words add nothing, so dense pages weigh more than long ones.
+    """
+    return len({word.lower() for word in CONTENT_WORD.findall(text)})
+
+def allocate_questions(pages: List[str], budget: int, max_per_page: int = MAX_QUESTIONS_PER_PAGE) -> List[int]:
+    """
+    Splits `budget` questions across pages proportionally to their content
+    density (Sainte-Laguë highest averages), capped at `max_per_page`. Pages
+    left with 0 questions are not sent to the LLM at all.
+    """
+    weights = [content_density(page) for page in pages]
+    counts = [0] * len(pages)
+    heap = [(-weight, i) for i, weight in enumerate(weights) if weight > 0]
+    heapq.heapify(heap)
+    for _ in range(budget):
+        if not heap:
+            break
+        _, i = heapq.heappop(heap)
+        counts[i] += 1
+        if counts[i] < max_per_page:
+            heapq.heappush(heap, (-weights[i] / (2 * counts[i] + 1), i))
+    return counts
+
+def difficulty_sequence(total: int, difficulty: str = DEFAULT_DIFFICULTY, first_question: int = 0) -> List[str]:
+    """
+    Requested difficulty of each of `total` questions; a mixed quiz cycles
+    through the levels, from its `first_question`-th question when it is
+    planned in several parts.
+    """
+    if difficulty == MIXED_DIFFICULTY:
+        return [DIFFICULTY_LEVELS[(first_question + k) % len(DIFFICULTY_LEVELS)] for k in range(total)]
+    if difficulty not in DIFFICULTY_LEVELS:
+        raise ValueError(f"Unknown difficulty: {difficulty}")
+    return [difficulty] * total
+
+def plan_questions(pages: List[str], budget: Optional[int] = None, difficulty: str = DEFAULT_DIFFICULTY,
+                   max_per_page: int = MAX_QUESTIONS_PER_PAGE, first_question: int = 0) -> List[List[str]]:
+    """
+    Returns, for each page, the difficulty of every question to generate from it.
+    Without a budget every page gets QUESTIONS_PER_DOC questions.
+    """
+    if budget is None:
+        counts = [QUESTIONS_PER_DOC] * len(pages)
+    else:
+        counts = allocate_questions(pages, budget, max_per_page)
+    difficulties = iter(difficulty_sequence(sum(counts), difficulty, first_question))
+    return [[next(difficulties) for _ in range(count)] for count in counts]
+
+def estimate_cost(page_tokens: List[int], plans: List[List[str]], model_name: str = DEFAULT_MODEL) -> float:
+    """USD a plan should cost: only pages with questions are sent, MAX_DOCS_PER_CALL per call."""
+    sent = [tokens for tokens, plan in zip(page_tokens, plans) if plan]
+    calls = -(-len(sent) // MAX_DOCS_PER_CALL)
+    prompt_tokens = sum(sent) + calls * PROMPT_OVERHEAD_TOKENS
+    return cost_usd(model_name, prompt_tokens, sum(map(len, plans)) * COMPLETION_TOKENS_PER_QUESTION)
+
+def fit_to_budget(pages: List[str], page_tokens: List[int], budget: Optional[int], difficulty: str, remaining: float,
+                  model_name: str = DEFAULT_MODEL, first_question: int = 0) -> Tuple[List[List[str]], float]:
+    """
+    Plans the quiz like plan_questions and returns (plans, estimated cost).
+    When the estimate exceeds `remaining` USD the quiz is downgraded to the
+    most questions that fit, which also sends fewer pages. Raises
+    BudgetExceededError when not even one question fits.
+    """
+    plans = plan_questions(pages, budget, difficulty, first_question=first_question)
+    estimate = estimate_cost(page_tokens, plans, model_name)
+    if estimate <= remaining:
+        return plans, estimate
+
+    best = None
+    low, high = 1, sum(map(len, plans)) - 1
+    while low <= high:
+        middle = (low + high) // 2
+        candidate = plan_questions(pages, middle, difficulty, first_question=first_question)
+        candidate_estimate = estimate_cost(page_tokens, candidate, model_name)
+        if candidate_estimate <= remaining:
+            best, low = (candidate, candidate_estimate), middle + 1
+        else:
+            high = middle - 1
+    if best is None:
+        raise BudgetExceededError(
+            f"El presupuesto disponible (${remaining:.2f}) no alcanza para generar preguntas de este documento"
+        )
+    return best
+
+def plan_within_budget(pages: List[str], budget: Optional[int] = None, difficulty: str = DEFAULT_DIFFICULTY,
+                       user_id: Optional[int] = None, model_name: str = DEFAULT_MODEL,
+                       upload_id: Optional[str] = None, first_question: int = 0) -> Tuple[List[List[str]], float]:
+    """
+    Plans the quiz within what may still be spent (see fit_to_budget and
+    UsageTracker.remaining_budget). With `upload_id` the upload's cost is
+    also reserved, atomically with the budget check (see UsageTracker.reserve).
+    A document planned in parts, as its pages arrive, passes the number of
+    questions already planned as `first_question`.
+    """
+    page_tokens = [count_tokens(page, model_name) for page in pages]
+    tracker = get_usage_tracker()
+
+    def plan(remaining: float) -> Tuple[List[List[str]], float]:
+        return fit_to_budget(pages, page_tokens, budget, difficulty, remaining, model_name, first_question)
+
+    if upload_id is None:
+        return plan(tracker.remaining_budget(user_id))
+    return tracker.reserve(upload_id, user_id, model_name, len(pages), plan)
@@ -0,0 +1,89 @@
+import itertools
+
+import pytest
+
+from chunking import count_tokens
+from qcm_chain import QUESTIONS_PER_DOC
+from question_budget import (
+    MAX_QUESTIONS_PER_PAGE, allocate_questions, content_density, difficulty_sequence, estimate_cost,
+    plan_questions, plan_within_budget,
+)
+from usage import BudgetExceededError, get_usage_tracker
+
+WORDS = ["".join(letters) for letters in itertools.product("bcdfgl", repeat=4)]
+
+
+def page(words):
+    """A page with `words` distinct content words, each repeated to show repetition does not count."""
+    return " ".join(WORDS[:words] * 2)
+
+
+def test_density_counts_distinct_content_words():
+    assert content_density(page(12)) == 12
+    assert content_density("Tabla 1.2 de la p. 34 — 56 78") == 1
+
+
+def test_sainte_lague_splits_the_budget_by_density():
+    assert allocate_questions([page(30), page(10)], 4) == [3, 1]
+    assert allocate_questions([page(10), page(10), page(10)], 3) == [1, 1, 1]
+
+
+@pytest.mark.parametrize("budget", [1, 7, 20, 30])
+def test_allocation_spends_exactly_the_budget(budget):
+    pages = [page(words) for words in (5, 40, 12, 0, 80, 3, 21)]
+
+    counts = allocate_questions(pages, budget)
+
+    assert sum(counts) == budget
+    assert max(counts) <= MAX_QUESTIONS_PER_PAGE
+
+
+def test_pages_without_content_get_no_questions():
+    pages = [page(20), "", "123 456 — 7.8", page(5)]
+
+    counts = allocate_questions(pages, 6)
+
+    assert counts[1] == counts[2] == 0
+    assert sum(counts) == 6
+
+
+def test_allocation_stops_at_the_per_page_cap():
+    assert allocate_questions([page(10), page(50)], 20, max_per_page=3) == [3, 3]
+
+
+def test_difficulty_sequence():
+    assert difficulty_sequence(3, "Difícil") == ["Difícil"] * 3
+    assert difficulty_sequence(5, "Mixta") == ["Fácil", "Medio", "Difícil", "Fácil", "Medio"]
+    # A quiz planned in parts keeps cycling from where the last part stopped
+    assert difficulty_sequence(2, "Mixta", first_question=5) == ["Difícil", "Fácil"]
+    with pytest.raises(ValueError):
+        difficulty_sequence(2, "Imposible")
+
+
+def test_plan_questions():
+    pages = [page(40), page(10), ""]
+
+    assert plan_questions(pages) == [["Medio"] * QUESTIONS_PER_DOC] * 3
+    plans = plan_questions(pages, 5, "Mixta")
+    assert list(map(len, plans)) == [4, 1, 0]
+    # Mixed levels cycle across pages, not within each page
+    assert plans == [["Fácil", "Medio", "Difícil", "Fácil"], ["Medio"], []]
+
+
+def test_a_tight_budget_truncates_the_plan(monkeypatch):
+    pages = [page(words) for words in (30, 25, 40, 10, 35, 20)]
+    full = plan_questions(pages, 20)
+    full_cost = estimate_cost([count_tokens(text) for text in pages], full)
+    monkeypatch.setattr(get_usage_tracker(), "max_upload_cost", full_cost / 2)
+
+    plans, estimate = plan_within_budget(pages, 20)
+
+    assert 0 < sum(map(len, plans)) < 20
+    assert estimate <= full_cost / 2
+    # The most questions that fit
+    assert estimate_cost([count_tokens(text) for text in pages],
+                         plan_questions(pages, sum(map(len, plans)) + 1)) > full_cost / 2
+
+    monkeypatch.setattr(get_usage_tracker(), "max_upload_cost", 0.0)
+    with pytest.raises(BudgetExceededError):
+        plan_within_budget(pages, 20)
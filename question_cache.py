@@ -0,0 +1,158 @@
+"""Content-addressed cache of generated questions, keyed by page text hash."""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, Optional
+
+from database import DB_PATH, get_connection
+
+MAX_ENTRIES = 50000
+MAX_BYTES = 200 * 1024 * 1024
+MAX_AGE_SECONDS = 90 * 24 * 3600
+EVICT_EVERY = 500  # writes between two eviction passes
+
+def normalize_text(text: str) -> str:
+    """Normalizes page text so that extraction noise does not change the key."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def make_key(text: str, model_name: str, prompt_version: str, *extra: Any) -> str:
+    """Hash of the normalized text plus everything that changes the generated output."""
+    h = hashlib.sha256()
+    for part in (prompt_version, model_name, *extra):
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    h.update(normalize_text(text).encode("utf-8"))
+    return h.hexdigest()
+
+
+class QuestionCache():
+    """
+    Persistent cache of parsed questions with size- and age-based eviction.
+    Entries are evicted least recently used first once the cache grows past
+    `max_entries` or `max_bytes`, and unconditionally after `max_age` seconds.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_entries: int = MAX_ENTRIES,
+                 max_bytes: int = MAX_BYTES, max_age: float = MAX_AGE_SECONDS) -> None:
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Returns the cached values found for `keys`; missing keys are left out."""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        conn = self._conn()
+        found = {}
+        oldest = time.time() - self.max_age
+        # Stay well below SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT key, value FROM question_cache WHERE key IN ({placeholders}) AND created_at >= ?",
+                (*chunk, oldest),
+            ).fetchall()
+            for row in rows:
+                found[row["key"]] = json.loads(row["value"])
+        if found:
+            now = time.time()
+            with conn:
+                conn.executemany(
+                    "UPDATE question_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items: Dict[str, Any]) -> None:
+        """Stores JSON-serializable values under their keys."""
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, value in items.items():
+            data = json.dumps(value, ensure_ascii=False)
+            rows.append((key, data, len(data), now, now))
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO question_cache (key, value, size, created_at, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        with self._lock:
+            self._writes += len(rows)
+            should_evict = self._writes >= EVICT_EVERY
+            if should_evict:
+                self._writes = 0
+        if should_evict:
+            self.evict()
+
+    def put(self, key: str, value: Any) -> None:
+        self.put_many({key: value})
+
+    def evict(self) -> int:
+        """Drops expired entries, then least recently used ones beyond the size limits."""
+        conn = self._conn()
+        with conn:
+            removed = conn.execute(
+                "DELETE FROM question_cache WHERE created_at < ?", (time.time() - self.max_age,)
+            ).rowcount
+            count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM question_cache").fetchone()
+            if count <= self.max_entries and total <= self.max_bytes:
+                return removed
+            # Keep the most recently used entries that fit in both limits
+            kept, kept_bytes = 0, 0
+            for row in conn.execute("SELECT size FROM question_cache ORDER BY last_used_at DESC"):
+                if kept + 1 > self.max_entries or kept_bytes + row["size"] > self.max_bytes:
+                    break
+                kept += 1
+                kept_bytes += row["size"]
+            removed += conn.execute(
+                "DELETE FROM question_cache WHERE key IN "
+                "(SELECT key FROM question_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+                (kept,),
+            ).rowcount
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM question_cache").fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": count,
+                "bytes": total,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_question_cache() -> QuestionCache:
+    """Returns the process-wide question cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = QuestionCache()
+    return _cache
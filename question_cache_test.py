@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+import question_cache
+import quizz_generator
+from question_cache import QuestionCache, make_key
+
+
+class Clock():
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(question_cache.time, "time", clock)
+    return clock
+
+
+def new_cache(tmp_path, **limits):
+    return QuestionCache(db_path=str(tmp_path / "eduplay.db"), **limits)
+
+
+def keys(cache):
+    return {row["key"] for row in cache._conn().execute("SELECT key FROM question_cache")}
+
+
+def test_the_key_ignores_whitespace_but_not_the_plan():
+    assert make_key("La  célula\n es la unidad", "gpt", "v1", "Medio") == \
+           make_key("La célula es la unidad ", "gpt", "v1", "Medio")
+    assert make_key("La célula", "gpt", "v1", "Medio") != make_key("La célula", "gpt", "v1", "Difícil")
+
+
+def test_entries_expire_after_their_max_age(tmp_path, clock):
+    cache = new_cache(tmp_path, max_age=60)
+    cache.put("a", {"questions": [1]})
+    clock.now += 30
+    cache.put("b", {"questions": [2]})
+
+    clock.now += 31
+    # Reading an entry does not extend its life
+    assert cache.get("a") is None
+    assert cache.get("b") == {"questions": [2]}
+
+    assert cache.evict() == 1
+    assert keys(cache) == {"b"}
+
+
+def test_eviction_keeps_the_most_recently_used_entries(tmp_path, clock):
+    cache = new_cache(tmp_path, max_entries=2)
+    for key in "abc":
+        clock.now += 1
+        cache.put(key, {"questions": [key]})
+    clock.now += 1
+    cache.get("a")
+
+    assert cache.evict() == 1
+    assert keys(cache) == {"a", "c"}
+
+
+def test_eviction_by_size(tmp_path, clock):
+    cache = new_cache(tmp_path, max_bytes=100)
+    for key in "abcd":
+        clock.now += 1
+        cache.put(key, {"text": key * 30})
+
+    cache.evict()
+
+    # Each value is 42 bytes of JSON: only the two newest fit
+    assert keys(cache) == {"c", "d"}
+    assert cache.stats()["bytes"] <= 100
+
+
+def test_stats_count_hits_and_misses(tmp_path):
+    cache = new_cache(tmp_path)
+    cache.put_many({"a": 1, "b": 2})
+
+    assert cache.get_many(["a", "b", "c", "a"]) == {"a": 1, "b": 2}
+    assert cache.get("d") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 2)
+    assert stats["hit_rate"] == 0.5
+    assert stats["entries"] == 2
+
+
+def test_partial_results_are_not_cached(tmp_path, monkeypatch):
+    cache = new_cache(tmp_path)
+    monkeypatch.setattr(quizz_generator, "get_question_cache", lambda: cache)
+
+    class PartialChain():
+        async def aiter_apply_and_parse(self, contents, plans, **kwargs):
+            # Fewer questions than planned for the first content only
+            for j, plan in enumerate(plans):
+                yield j, {"questions": [{"question": "?"}] * (len(plan) - (j == 0)), "errors": []}
+
+    monkeypatch.setattr(quizz_generator, "get_qa_chain", lambda model_name: PartialChain())
+    plans = [["Fácil", "Medio", "Difícil"], ["Medio"]]
+
+    results = asyncio.run(quizz_generator.generate_quizz_batch(["Página uno", "Página dos"], plans=plans))
+
+    assert [len(result["questions"]) for result in results] == [2, 1]
+    assert cache.stats()["entries"] == 1
+    assert make_key("Página dos", quizz_generator.DEFAULT_MODEL, quizz_generator.PROMPT_VERSION,
+                    "text", "Medio") in keys(cache)
@@ -1,20 +1,101 @@
-from qcm_chain import QCMGenerateChain
-from qa_llm import QaLlm
+from langchain.prompts import PromptTemplate
+from qcm_chain import (
+    QCMGenerateChain, PROMPT, PROMPT_VERSION, QUESTIONS_PER_DOC, DEFAULT_DIFFICULTY, attach_difficulties
+)
+from question_budget import difficulty_sequence
+from qa_llm import DEFAULT_MODEL, get_engine
+from question_cache import get_question_cache, make_key
 import asyncio
+import threading
+from typing import List, Optional
+
+_chains_lock = threading.Lock()
+_chains = {}
+
+def get_qa_chain(model_name: str = DEFAULT_MODEL, prompt: PromptTemplate = PROMPT) -> QCMGenerateChain:
+    """
+    Returns the shared chain for a model and prompt configuration.
+    Chains hold no per-call state, so one instance serves every page and session.
+    """
+    key = (model_name, id(prompt))
+    with _chains_lock:
+        qa_chain = _chains.get(key)
+        if qa_chain is None:
+            qa_llm = get_engine().get_qa_llm(model_name)
+            qa_chain = QCMGenerateChain.from_llm(qa_llm.get_llm(), prompt=prompt)
+            _chains[key] = qa_chain
+    return qa_chain
 
 async def llm_call(qa_chain: QCMGenerateChain, text: str):
     batch_examples = await asyncio.gather(qa_chain.aapply_and_parse(text))
-    print(f"llm lo ha realizado.")
 
     return batch_examples
 
-async def generate_quizz(content:str):
+async def generate_quizz(content:str, model_name: str = DEFAULT_MODEL, num_questions: int = QUESTIONS_PER_DOC,
+                         difficulty: str = DEFAULT_DIFFICULTY):
     """
-    Generates a quizz from the given content.
+    Generates a quizz of `num_questions` questions from the given content,
+    each tagged with the difficulty it was requested with.
     """
-    qa_llm = QaLlm()
-    qa_chain = QCMGenerateChain.from_llm(qa_llm.get_llm())
+    qa_chain = get_qa_chain(model_name)
+    engine = get_engine()
+    limiter = engine.get_limiter(model_name)
+    difficulties = difficulty_sequence(num_questions, difficulty)
+    inputs = {"doc": content, "num_questions": num_questions, "difficulties": ", ".join(difficulties)}
 
-    return await llm_call(qa_chain, [{"doc": content}])
+    quizz = await engine.run(limiter.call(lambda: llm_call(qa_chain, [inputs])))
+    attach_difficulties(quizz[0][0], difficulties)
+    return quizz
 
+async def generate_quizz_stream(contents: List[str], model_name: str = DEFAULT_MODEL, output_format: str = "text",
+                                num_questions: int = QUESTIONS_PER_DOC, plans: Optional[List[List[str]]] = None):
+    """
+    Generates quizzes for a list of contents, packing several of them per LLM call,
+    and yields (index, parsed result) pairs as soon as each content is done.
+    `plans` holds the requested difficulty of each question per content (see
+    question_budget.plan_questions), `num_questions` of DEFAULT_DIFFICULTY by default.
+    The result is None where generation failed. Contents already generated with
+    the same model, prompt, output format and plan are served from the question
+    cache first and never reach the LLM.
+    """
+    if plans is None:
+        plans = [[DEFAULT_DIFFICULTY] * num_questions for _ in contents]
+    cache = get_question_cache()
+    keys = [
+        make_key(content, model_name, PROMPT_VERSION, output_format, ",".join(plan))
+        for content, plan in zip(contents, plans)
+    ]
+    cached = cache.get_many(keys)
+
+    missing = []
+    for i, key in enumerate(keys):
+        if key in cached:
+            yield i, cached[key]
+        else:
+            missing.append(i)
+
+    if missing:
+        qa_chain = get_qa_chain(model_name)
+        engine = get_engine()
+        stream = engine.stream(qa_chain.aiter_apply_and_parse(
+            [contents[i] for i in missing], limiter=engine.get_limiter(model_name),
+            output_format=output_format, plans=[plans[i] for i in missing], doc_ids=missing,
+        ))
+        async for j, result in stream:
+            i = missing[j]
+            # A partial result is not cached, so the missing questions are asked for next time
+            if result is not None and plans[i] and len(result["questions"]) >= len(plans[i]):
+                cache.put(keys[i], result)
+            yield i, result
+
+async def generate_quizz_batch(contents: List[str], model_name: str = DEFAULT_MODEL, output_format: str = "text",
+                               num_questions: int = QUESTIONS_PER_DOC, plans: Optional[List[List[str]]] = None):
+    """
+    Generates quizzes for a list of contents. Returns one parsed result per
+    content, in order, None where generation failed.
+    """
+    results = [None] * len(contents)
+    async for i, result in generate_quizz_stream(contents, model_name, output_format, num_questions, plans):
+        results[i] = result
 
+    return results
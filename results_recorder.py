@@ -0,0 +1,195 @@
+"""Write-behind recording of finished games into game_results, journaled on disk until committed."""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from database import DB_PATH, get_connection
+from leaderboards import get_leaderboards
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.environ.get("EDUPLAY_RESULTS_JOURNAL", os.path.join("data", "game_results.journal"))
+FLUSH_SECONDS = 1.0
+# A batch this large is flushed right away instead of at the next tick
+FLUSH_BATCH = 200
+
+# Replaying a journal that was already committed inserts nothing twice
+INSERT_RESULT = """
+INSERT OR IGNORE INTO game_results (result_key, user_id, game_id, score, accuracy, time_spent, questions_correct,
+                                    total_questions, answers, completed_at, session_data)
+VALUES (:result_key, :user_id, :game_id, :score, :accuracy, :time_spent, :questions_correct,
+        :total_questions, :answers, :completed_at, :session_data)
+"""
+INSERT_SUBMISSION = """
+INSERT OR IGNORE INTO assignment_submissions (assignment_id, student_id, game_result_id, submitted_at, points_earned, is_late)
+SELECT a.id, r.user_id, r.id, r.completed_at, r.score, COALESCE(r.completed_at > a.due_date, 0)
+FROM assignments AS a, game_results AS r
+WHERE a.id = :assignment_id AND r.result_key = :result_key
+"""
+
+
+class ResultsRecorder():
+    """
+    Queues finished games and writes them to game_results from a background
+    thread, many per transaction. record() only appends a line to a journal
+    file, so a whole classroom finishing at once does not wait on SQLite.
+
+    The journal is rotated into a segment when a batch is taken and the
+    segment is deleted once its batch is committed; segments left by a crash
+    are replayed on start. Results carry a unique key, so a segment that was
+    committed but not yet deleted is not inserted twice.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, journal_path: str = JOURNAL_PATH,
+                 flush_seconds: float = FLUSH_SECONDS) -> None:
+        self.db_path = db_path
+        self.journal_path = journal_path
+        self.flush_seconds = flush_seconds
+        self.metrics = get_metrics()
+        self._pending: List[Dict[str, Any]] = []
+        # Rotated journal segments whose results are not committed yet
+        self._segments: List[str] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._journal = None
+        self._started = False
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def start(self) -> None:
+        """Replays the journal left by a previous process and starts the flusher thread."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            self.recover()
+            self._journal = open(self.journal_path, "a", encoding="utf-8")
+        threading.Thread(target=self._run, name="results-flusher", daemon=True).start()
+        atexit.register(self.flush)
+
+    def record(self, user_id: Optional[int], game_id: Optional[int], score: int, accuracy: float,
+               time_spent: Optional[int], answers: List[Dict[str, Any]],
+               assignment_id: Optional[int] = None, session_data: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Queues a finished game and returns its key. The result is durable when
+        this returns: it is in the journal, and in game_results within
+        FLUSH_SECONDS. With `assignment_id` it is also the user's submission.
+        """
+        result = {
+            "result_key": uuid.uuid4().hex,
+            "user_id": user_id,
+            "game_id": game_id,
+            "score": score,
+            "accuracy": accuracy,
+            "time_spent": time_spent,
+            "questions_correct": sum(1 for answer in answers if answer.get("is_correct")),
+            "total_questions": len(answers),
+            "answers": json.dumps(answers, ensure_ascii=False, default=str),
+            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()),
+            "session_data": json.dumps(session_data, ensure_ascii=False, default=str) if session_data else None,
+            "assignment_id": assignment_id,
+        }
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._journal.write(line)
+            self._journal.flush()
+            self._pending.append(result)
+            pending = len(self._pending)
+            # A duplicate stays valid if a flush rotates and closes the journal meanwhile
+            fd = os.dup(self._journal.fileno())
+        # Outside the lock: concurrent records share the same disk sync
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.metrics.inc("game_results_recorded_total")
+        if pending >= FLUSH_BATCH:
+            self._wakeup.set()
+        return result["result_key"]
+
+    def flush(self) -> int:
+        """Writes the queued results in one transaction; returns how many."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch, self._pending = self._pending, []
+                # New results go to a fresh journal; this batch's lines stay in the segment
+                self._journal.close()
+                segment = f"{self.journal_path}.{uuid.uuid4().hex}"
+                os.replace(self.journal_path, segment)
+                self._segments.append(segment)
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            try:
+                self._write(batch)
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = batch
+                raise
+            # Every earlier segment was either in this batch or requeued into it
+            with self._lock:
+                segments, self._segments = self._segments, []
+            for segment in segments:
+                os.unlink(segment)
+            self.metrics.inc("game_results_flushed_total", len(batch))
+            return len(batch)
+
+    def recover(self) -> int:
+        """Commits the results of journals left by a previous process; returns how many."""
+        paths = glob.glob(f"{glob.escape(self.journal_path)}.*") + [self.journal_path]
+        results = []
+        for path in filter(os.path.exists, paths):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        results.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # The last line of a journal cut short by a crash
+                        logger.warning("skipping a torn line in %s", path)
+        if results:
+            self._write(results)
+            logger.info("recovered %d game results from the journal", len(results))
+        for path in filter(os.path.exists, paths):
+            os.unlink(path)
+        return len(results)
+
+    def _write(self, results: List[Dict[str, Any]]) -> None:
+        with self._conn() as conn:
+            conn.executemany(INSERT_RESULT, results)
+            conn.executemany(INSERT_SUBMISSION, [r for r in results if r.get("assignment_id") is not None])
+        try:
+            get_leaderboards().apply(results)
+        except Exception:
+            logger.exception("could not update the leaderboards in memory")
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_seconds)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("could not flush game results, retrying")
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+def get_results_recorder() -> ResultsRecorder:
+    """Returns the process-wide recorder, replaying any journal left by a previous process."""
+    global _recorder
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = ResultsRecorder()
+            _recorder.start()
+    return _recorder
@@ -0,0 +1,125 @@
+import json
+import os
+
+import pytest
+
+from database import get_connection
+from results_recorder import ResultsRecorder
+
+ANSWERS = [{"question": "¿Uno?", "is_correct": True}, {"question": "¿Dos?", "is_correct": False}]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "eduplay.db"), str(tmp_path / "journal" / "game_results.journal")
+
+
+def make_recorder(paths):
+    db_path, journal_path = paths
+    # The flusher thread never ticks during a test: flushes are explicit
+    return ResultsRecorder(db_path=db_path, journal_path=journal_path, flush_seconds=3600)
+
+
+def results(db_path):
+    return get_connection(db_path).execute(
+        "SELECT result_key, user_id, score, questions_correct, total_questions, answers FROM game_results"
+    ).fetchall()
+
+
+def journal_files(journal_path):
+    directory = os.path.dirname(journal_path)
+    return sorted(name for name in os.listdir(directory) if os.path.getsize(os.path.join(directory, name)))
+
+
+def test_results_are_journaled_then_flushed_in_one_batch(paths):
+    db_path, journal_path = paths
+    recorder = make_recorder(paths)
+    recorder.start()
+
+    keys = [recorder.record(7, None, 100 * i, 0.5, 30, ANSWERS) for i in range(3)]
+
+    assert results(db_path) == []
+    with open(journal_path, encoding="utf-8") as f:
+        assert [json.loads(line)["result_key"] for line in f] == keys
+
+    assert recorder.flush() == 3
+    rows = results(db_path)
+    assert [row["result_key"] for row in rows] == keys
+    assert rows[0]["questions_correct"] == 1
+    assert rows[0]["total_questions"] == 2
+    assert json.loads(rows[0]["answers"]) == ANSWERS
+    # The committed segment is gone and the live journal is empty
+    assert journal_files(journal_path) == []
+    assert recorder.flush() == 0
+
+
+def test_unflushed_results_are_recovered_by_the_next_process(paths):
+    db_path, journal_path = paths
+    crashed = make_recorder(paths)
+    crashed.start()
+    keys = [crashed.record(7, None, 10, 1.0, 5, ANSWERS) for _ in range(2)]
+    # A crash in the middle of writing the next line
+    with open(journal_path, "a", encoding="utf-8") as f:
+        f.write('{"result_key": "cortada", "user_id": 7, "sco')
+
+    recovered = make_recorder(paths)
+    recovered.start()
+
+    assert sorted(row["result_key"] for row in results(db_path)) == sorted(keys)
+    assert journal_files(journal_path) == []
+
+
+def test_replaying_a_committed_segment_inserts_nothing_twice(paths):
+    db_path, journal_path = paths
+    recorder = make_recorder(paths)
+    recorder.start()
+    key = recorder.record(7, None, 10, 1.0, 5, ANSWERS)
+    with open(journal_path, encoding="utf-8") as f:
+        line = f.read()
+    recorder.flush()
+    # The process died after the commit but before deleting the segment
+    with open(f"{journal_path}.segmento", "w", encoding="utf-8") as f:
+        f.write(line)
+
+    assert make_recorder(paths).recover() == 1
+    assert [row["result_key"] for row in results(db_path)] == [key]
+    assert not os.path.exists(f"{journal_path}.segmento")
+
+
+def test_a_failed_flush_keeps_the_batch_for_the_next_one(paths, monkeypatch):
+    db_path, journal_path = paths
+    recorder = make_recorder(paths)
+    recorder.start()
+    first = recorder.record(7, None, 10, 1.0, 5, ANSWERS)
+
+    def locked(batch):
+        raise OSError("database is locked")
+
+    write = recorder._write
+    monkeypatch.setattr(recorder, "_write", locked)
+    with pytest.raises(OSError):
+        recorder.flush()
+    monkeypatch.setattr(recorder, "_write", write)
+
+    second = recorder.record(7, None, 20, 1.0, 5, ANSWERS)
+    assert recorder.flush() == 2
+    assert sorted(row["result_key"] for row in results(db_path)) == sorted([first, second])
+    # Both the failed batch's segment and the second one are deleted
+    assert journal_files(journal_path) == []
+
+
+def test_an_assignment_result_is_also_the_submission(paths):
+    db_path, _ = paths
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute("INSERT INTO assignments (id, title, due_date) VALUES (1, 'Tarea', '2000-01-01 00:00:00')")
+    recorder = make_recorder(paths)
+    recorder.start()
+
+    recorder.record(7, None, 80, 0.8, 40, ANSWERS, assignment_id=1)
+    recorder.flush()
+
+    submission = conn.execute(
+        "SELECT student_id, points_earned, is_late FROM assignment_submissions WHERE assignment_id = 1"
+    ).fetchone()
+    assert tuple(submission) == (7, 80, 1)
@@ -1,13 +1,35 @@
 import asyncio
+from chunking import count_tokens
+from dedup import QuestionDeduplicator
+from metrics import new_upload_id, upload_id as current_upload_id
+from qa_llm import DEFAULT_MODEL
+from qcm_chain import DEFAULT_DIFFICULTY, QUESTIONS_PER_DOC
+from question_budget import difficulty_sequence, estimate_cost
 from quizz_generator import generate_quizz
-from ui_utils import transform
+from usage import BudgetExceededError, get_usage_tracker
 
-async def txt_to_quizz(content):
+async def txt_to_quizz(content, num_questions=QUESTIONS_PER_DOC, difficulty=DEFAULT_DIFFICULTY, user_id=None,
+                       model_name=DEFAULT_MODEL):
 
-    quizz = await generate_quizz(content)
+    upload_id = new_upload_id()
+    current_upload_id.set(upload_id)
+    tracker = get_usage_tracker()
+    plans = [difficulty_sequence(num_questions, difficulty)]
+    estimate = estimate_cost([count_tokens(content, model_name)], plans, model_name)
+
+    def plan(remaining):
+        if estimate > remaining:
+            raise BudgetExceededError(f"El presupuesto disponible (${remaining:.2f}) no alcanza para este texto")
+        return plans, estimate
+
+    tracker.reserve(upload_id, user_id, model_name, 1, plan)
+    status = "failed"
+    try:
+        quizz = await generate_quizz(content, model_name, num_questions, difficulty)
+        status = "done"
+    finally:
+        tracker.finish(upload_id, status)
     if quizz is not None:
-        trasnformed_quizz = transform(quizz[0])
-        return trasnformed_quizz
+        return QuestionDeduplicator().filter(quizz[0][0]["questions"])
 
     return ''
-
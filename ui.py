@@ -3,17 +3,26 @@ from ui_utils import (
     apply_login_theme, check_password, show_logout_button, transform, create_navigation_header, create_stats_card,
     create_progress_bar, create_game_result_card, create_ranking_item,
     create_study_group_card, create_game_mode_card, get_game_mode_options,
-    create_notification_card, load_user_progress, save_user_progress,
+    create_notification_card, load_user_progress, record_game_progress,
     calculate_level_from_points, create_level_badge, create_points_badge
 )
-from pdf_to_quizz import pdf_to_quizz
+from qcm_chain import DEFAULT_DIFFICULTY, DIFFICULTY_LEVELS, MIXED_DIFFICULTY
+from extractors import supported_extensions
+from game_repository import get_game_repository
+from analytics import get_analytics
+from job_queue import ACTIVE_STATUSES, PARTIAL_STATUS, get_job_queue
+from leaderboards import GLOBAL_BOARD, get_leaderboards, subject_board, week_board
+from results_recorder import get_results_recorder
+from upload_store import store_upload
+from usage import BudgetExceededError, get_usage_tracker
 from text_to_quizz import txt_to_quizz
 from generate_pdf import generate_pdf_quiz
+import html
 import json
 import asyncio
 import time
-from datetime import datetime
 import os
+import pandas as pd
 
 # Configuración inicial de la página
 st.set_page_config(
@@ -147,9 +156,6 @@ def init_session_state():
     if 'user_data' not in st.session_state:
         st.session_state.user_data = load_user_progress()
 
-    if 'games_library' not in st.session_state:
-        st.session_state.games_library = []
-
     if 'current_game' not in st.session_state:
         st.session_state.current_game = None
 
@@ -173,31 +179,41 @@ def ensure_data_directory():
         os.makedirs("data")
 
 def create_game_from_questions(questions, title, subject, filename, game_mode="cuestionario"):
-    """Crea un juego a partir de las preguntas generadas"""
-    game = {
-        'id': len(st.session_state.games_library) + 1,
-        'title': title,
-        'subject': subject,
-        'questions': questions,
-        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M"),
-        'difficulty': determine_difficulty(questions),
-        'total_questions': len(questions),
-        'best_score': 0,
-        'times_played': 0,
-        'filename': filename,
-        'game_mode': game_mode
-    }
+    """Guarda en la biblioteca un juego creado a partir de las preguntas generadas"""
+    game = get_game_repository().create_game(
+        title, subject, determine_difficulty(questions), game_mode, questions,
+        filename, st.session_state.user_data.get('id')
+    )
+    # La sesión que lo creó juega con la misma lista, que puede seguir creciendo
+    game['questions'] = questions
     return game
 
+def load_game_questions(game):
+    """Carga las preguntas de un juego de la biblioteca la primera vez que se abre"""
+    if 'questions' not in game:
+        game['questions'] = get_game_repository().get_questions(game['id'])
+    return game['questions']
+
 def determine_difficulty(questions):
-    """Determina la dificultad basada en el número de preguntas"""
-    num_questions = len(questions)
-    if num_questions <= 5:
-        return "Fácil"
-    elif num_questions <= 10:
-        return "Medio"
-    else:
-        return "Difícil"
+    """Determina la dificultad del juego a partir de la dificultad pedida para cada pregunta"""
+    levels = [DIFFICULTY_LEVELS.index(q['difficulty']) for q in questions if q.get('difficulty') in DIFFICULTY_LEVELS]
+    if not levels:
+        return DEFAULT_DIFFICULTY
+    return DIFFICULTY_LEVELS[round(sum(levels) / len(levels))]
+
+def show_question_budget_inputs(key_prefix):
+    """Número de preguntas del quiz completo y dificultad pedida"""
+    col1, col2 = st.columns(2)
+    with col1:
+        num_questions = st.number_input(
+            "❓ Número de preguntas", min_value=1, max_value=100, value=10, key=f"{key_prefix}_num_questions"
+        )
+    with col2:
+        difficulty = st.select_slider(
+            "🎯 Dificultad", options=[*DIFFICULTY_LEVELS, MIXED_DIFFICULTY], value=DEFAULT_DIFFICULTY,
+            key=f"{key_prefix}_difficulty"
+        )
+    return int(num_questions), difficulty
 
 def show_welcome_screen():
     """Pantalla de bienvenida principal"""
@@ -302,6 +318,87 @@ def show_welcome_screen():
             "#667eea"
         ), unsafe_allow_html=True)
 
+def start_pdf_generation(file_path, num_questions=None, difficulty=DEFAULT_DIFFICULTY, user_id=None, file_name=None):
+    """
+    Encola la generación del quiz en la cola de trabajos en segundo plano.
+    `num_questions` preguntas se reparten entre las páginas según su contenido,
+    reducidas si su costo estimado supera el presupuesto disponible.
+    El trabajo sigue aunque el script se vuelva a ejecutar o el navegador se
+    desconecte; su id queda en la URL para retomarlo al recargar la página.
+    """
+    job_id = get_job_queue().submit(file_path, num_questions, difficulty, user_id, file_name=file_name)
+    st.query_params['job'] = job_id
+    return attach_generation(job_id)
+
+def attach_generation(job_id):
+    """
+    Crea el estado local de un trabajo de generación. Las preguntas se agregan
+    a generation['questions'] a medida que cada página termina, así el juego
+    puede empezar antes de procesar todo el PDF.
+    """
+    generation = {
+        'upload_id': job_id,
+        'questions': [],
+        'seq': 0,
+        'total_pages': None,
+        'pages_done': 0,
+        'status': None,
+        'done': False,
+        'error': None,
+        'notice': None,
+    }
+    sync_generation(generation)
+    return generation
+
+def sync_generation(generation):
+    """Trae de la cola el avance del trabajo y las preguntas de las páginas nuevas"""
+    queue = get_job_queue()
+    job = queue.progress(generation['upload_id'])
+    if job is None:
+        generation.update(done=True, error="El trabajo de generación ya no existe")
+        return
+
+    pages = queue.pages(generation['upload_id'], generation['seq'])
+    for page in pages:
+        generation['questions'].extend(page['questions'])
+        generation['seq'] = page['seq']
+    if pages and generation.get('game_id'):
+        # El juego ya creado recibe las preguntas nuevas también en la base de datos
+        queue.sync_game(generation['upload_id'])
+    generation.update(
+        total_pages=job['total_pages'],
+        pages_done=job['pages_done'],
+        notice=job['notice'],
+        error=job['error'],
+        status=job['status'],
+        done=job['status'] not in ACTIVE_STATUSES,
+    )
+
+@st.fragment(run_every=1)
+def show_generation_progress():
+    """Muestra el avance de la generación en vivo hasta que termina"""
+    generation = st.session_state.get('generation')
+    if generation is None:
+        return
+
+    sync_generation(generation)
+    if generation['done'] or (generation['questions'] and not generation.get('playable')):
+        # Refrescar la página completa para habilitar el juego o mostrar el resultado final
+        generation['playable'] = bool(generation['questions'])
+        st.rerun()
+
+    total_pages = generation['total_pages']
+    if total_pages:
+        st.markdown(create_progress_bar(
+            generation['pages_done'], total_pages, "🤖 Procesando documento con IA...", "#667eea"
+        ), unsafe_allow_html=True)
+    else:
+        st.info("🤖 Leyendo documento...")
+
+    st.caption(f"❓ {len(generation['questions'])} preguntas listas para jugar")
+    if generation['notice']:
+        st.caption(generation['notice'])
+
 def show_crear_juego():
     """Pantalla para crear nuevos juegos"""
     st.markdown(create_navigation_header(), unsafe_allow_html=True)
@@ -309,13 +406,13 @@ def show_crear_juego():
     st.markdown("## 📚 Crear Nuevo Juego")
 
     # Tabs para diferentes métodos de creación
-    tab1, tab2 = st.tabs(["📄 Desde PDF", "✏️ Desde Texto"])
+    tab1, tab2 = st.tabs(["📄 Desde Archivo", "✏️ Desde Texto"])
 
     with tab1:
         st.markdown("""
         <div class="welcome-card">
-            <h3>📄 Crear Juego desde PDF</h3>
-            <p>Sube tu archivo PDF y nuestra IA generará automáticamente un juego educativo</p>
+            <h3>📄 Crear Juego desde un Archivo</h3>
+            <p>Sube tu PDF, Word, PowerPoint o texto y nuestra IA generará automáticamente un juego educativo</p>
         </div>
         """, unsafe_allow_html=True)
 
@@ -338,28 +435,70 @@ def show_crear_juego():
         mode_description = next(mode["description"] for mode in game_modes if mode["value"] == selected_mode)
         st.info(f"📝 {mode_description}")
 
-        # Upload de archivo
-        uploaded_file = st.file_uploader("📎 Selecciona tu archivo PDF", type=["pdf"])
+        num_questions, difficulty = show_question_budget_inputs("pdf")
 
-        if uploaded_file is not None:
-            old_file_name = st.session_state.get('uploaded_file_name', None)
-            if (old_file_name != uploaded_file.name):
-                with st.spinner("🤖 Procesando PDF con IA..."):
-                    with open(f"data/{uploaded_file.name}", "wb") as f:
-                        f.write(uploaded_file.getvalue())
+        # Upload de archivo
+        uploaded_file = st.file_uploader("📎 Selecciona tu archivo", type=supported_extensions())
 
-                    st.session_state['uploaded_file_name'] = uploaded_file.name
-                    st.session_state['questions'] = asyncio.run(pdf_to_quizz(f"data/{uploaded_file.name}"))
+        job_id = st.query_params.get('job')
+        if 'generation' not in st.session_state and job_id and get_job_queue().progress(job_id):
+            # Recarga de la página: retomar el trabajo que sigue en la cola
+            generation = attach_generation(job_id)
+            st.session_state['generation'] = generation
+            st.session_state['questions'] = generation['questions']
+            st.session_state['uploaded_file_name'] = get_job_queue().progress(job_id)['file_name']
 
-                    st.success("✅ ¡Quiz generado exitosamente!")
-                    st.balloons()
+        if uploaded_file is not None:
+            old_request = st.session_state.get('generation_request', None)
+            request = (uploaded_file.name, num_questions, difficulty)
+            if (old_request != request):
+                old_generation = st.session_state.get('generation')
+                if old_generation is not None and not old_generation['done']:
+                    get_job_queue().cancel(old_generation['upload_id'])
+                # Guardado por contenido desde el buffer de la subida, sin copiarlo a memoria
+                file_path = store_upload(uploaded_file, os.path.splitext(uploaded_file.name)[1].lower())
+
+                st.session_state['uploaded_file_name'] = uploaded_file.name
+                st.session_state['generation_request'] = request
+                generation = start_pdf_generation(file_path, num_questions, difficulty,
+                                                  st.session_state.user_data.get('id'), uploaded_file.name)
+                st.session_state['generation'] = generation
+                # Lista compartida: crece a medida que cada página termina
+                st.session_state['questions'] = generation['questions']
+
+        generation = st.session_state.get('generation')
+        if generation is not None:
+            sync_generation(generation)
+        if generation is not None and not generation['done']:
+            show_generation_progress()
+        elif generation is not None and not generation.get('announced'):
+            generation['announced'] = True
+            if generation['status'] == PARTIAL_STATUS:
+                st.warning(f"⚠️ {generation['error']}. Puedes jugar con las preguntas listas o reintentarlas.")
+            elif generation['error']:
+                st.error(f"Error generando el quiz: {generation['error']}")
+            else:
+                st.success("✅ ¡Quiz generado exitosamente!")
+                if generation['notice']:
+                    st.warning(generation['notice'])
+                st.balloons()
+
+        if generation is not None and generation['status'] == PARTIAL_STATUS:
+            if st.button("🔁 Reintentar páginas faltantes"):
+                # Solo se generan las páginas que fallaron; las demás ya están guardadas
+                get_job_queue().retry(generation['upload_id'])
+                generation['announced'] = False
+                st.rerun()
 
-        # Crear el juego
-        if 'questions' in st.session_state and game_title:
+        # Crear el juego (disponible desde la primera pregunta generada)
+        if st.session_state.get('questions') and game_title:
             if st.button("🎮 Crear Juego", type="primary"):
                 questions = transform(st.session_state['questions']) if isinstance(st.session_state['questions'][0], dict) else st.session_state['questions']
-                game = create_game_from_questions(questions, game_title, game_subject, uploaded_file.name, selected_mode)
-                st.session_state.games_library.append(game)
+                game = create_game_from_questions(questions, game_title, game_subject,
+                                                  st.session_state['uploaded_file_name'], selected_mode)
+                get_job_queue().attach_game(generation['upload_id'], game['id'])
+                generation['game_id'] = game['id']
+                get_usage_tracker().assign_game(generation['upload_id'], game['id'])
 
                 st.success("🎉 ¡Juego creado y agregado a tu biblioteca!")
 
@@ -367,7 +506,7 @@ def show_crear_juego():
                 col1, col2 = st.columns([2, 1])
                 with col1:
                     st.markdown(create_game_mode_card(
-                        "🎮", game['title'],
+                        "🎮", html.escape(game['title']),
                         f"📚 {game['subject']} | 🎯 {game['difficulty']}",
                         game['difficulty'], game['total_questions']
                     ), unsafe_allow_html=True)
@@ -399,17 +538,30 @@ def show_crear_juego():
             key="text_mode"
         )
 
+        text_num_questions, text_difficulty = show_question_budget_inputs("text")
+
         # Input de texto
         txt = st.text_area('✏️ Ingresa el texto para generar el quiz:', height=200)
 
         if st.button("🚀 Generar Quiz desde Texto", key="button_generar"):
             if txt and text_game_title:
                 with st.spinner("🤖 Generando preguntas con IA..."):
-                    st.session_state['text_questions'] = asyncio.run(txt_to_quizz(txt))
+                    try:
+                        st.session_state['text_questions'] = asyncio.run(txt_to_quizz(
+                            txt, text_num_questions, text_difficulty, st.session_state.user_data.get('id')
+                        ))
+                    except BudgetExceededError as e:
+                        st.error(f"💰 {e}")
+                        return
+
+                    # Sin preguntas válidas (o todas duplicadas) no hay juego que crear
+                    if not st.session_state['text_questions']:
+                        st.warning("⚠️ No se pudieron generar preguntas a partir de este texto. "
+                                   "Prueba con un texto más largo o con más contenido.")
+                        return
 
                     questions = transform(st.session_state['text_questions']) if isinstance(st.session_state['text_questions'][0], dict) else st.session_state['text_questions']
-                    game = create_game_from_questions(questions, text_game_title, text_game_subject, "texto_manual", text_selected_mode)
-                    st.session_state.games_library.append(game)
+                    create_game_from_questions(questions, text_game_title, text_game_subject, "texto_manual", text_selected_mode)
 
                     st.success("✅ ¡Juego creado exitosamente desde texto!")
                     st.balloons()
@@ -420,7 +572,9 @@ def show_mis_juegos():
 
     st.markdown("## 🎮 Mi Biblioteca de Juegos")
 
-    if not st.session_state.games_library:
+    # Solo los resúmenes: las preguntas se cargan al abrir cada juego
+    games = get_game_repository().list_games(st.session_state.user_data.get('id'))
+    if not games:
         st.markdown("""
         <div class="welcome-card">
             <h3>📚 No tienes juegos creados aún</h3>
@@ -434,7 +588,7 @@ def show_mis_juegos():
         return
 
     # Mostrar juegos en grid
-    for i, game in enumerate(st.session_state.games_library):
+    for i, game in enumerate(games):
         if i % 2 == 0:
             col1, col2 = st.columns(2)
 
@@ -448,7 +602,7 @@ def show_mis_juegos():
                 box-shadow: 0 4px 6px rgba(0,0,0,0.1);
                 border-left: 4px solid #667eea;
             ">
-                <h3 style="margin: 0 0 0.5rem 0; color: #333;">{game['title']}</h3>
+                <h3 style="margin: 0 0 0.5rem 0; color: #333;">{html.escape(game['title'])}</h3>
                 <p style="margin: 0.5rem 0; color: #666;">
                     📚 {game['subject']} | 🎯 {game['difficulty']} | ❓ {game['total_questions']} preguntas
                 </p>
@@ -550,67 +704,47 @@ def show_rankings():
 
     st.markdown("## 🏆 Rankings y Estadísticas")
 
-    # Resumen de salas (simulado)
+    # Resumen de salas: precisión promedio de los juegos más jugados
     st.markdown("### 📊 Resumen de Salas")
+    show_game_summary_cards(get_analytics().game_summary().head(3))
 
-    col1, col2, col3 = st.columns(3)
-
-    with col1:
-        st.markdown("""
-        <div style="
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 1.5rem;
-            border-radius: 15px;
-            color: black;
-            text-align: center;
-        ">
-            <h3 style="margin: 0; color: black;">Reacciones Químicas</h3>
-            <h2 style="margin: 0.5rem 0; color: black;">56%</h2>
-        </div>
-        """, unsafe_allow_html=True)
+    tab1, tab2, tab3 = st.tabs(["🌍 Global", "📚 Por Materia", "📅 Semanal"])
 
-    with col2:
-        st.markdown("""
-        <div style="
-            background: linear-gradient(135deg, #a8edea 0%, #fed6e3 100%);
-            padding: 1.5rem;
-            border-radius: 15px;
-            color: #333;
-            text-align: center;
-        ">
-            <h3 style="margin: 0;">Tabla Periódica</h3>
-            <h2 style="margin: 0.5rem 0;">82%</h2>
-        </div>
-        """, unsafe_allow_html=True)
+    with tab1:
+        show_leaderboard(GLOBAL_BOARD)
 
-    with col3:
-        st.markdown("""
-        <div style="
-            background: linear-gradient(135px, #a8edea 0%, #fed6e3 100%);
-            padding: 1.5rem;
-            border-radius: 15px;
-            color: #333;
-            text-align: center;
-        ">
-            <h3 style="margin: 0;">Valencias</h3>
-            <h2 style="margin: 0.5rem 0;">95%</h2>
-        </div>
-        """, unsafe_allow_html=True)
+    with tab2:
+        subjects = get_leaderboards().subjects()
+        if subjects:
+            subject = st.selectbox("📚 Materia", subjects, key="ranking_subject")
+            show_leaderboard(subject_board(subject))
+        else:
+            st.info("Todavía no hay partidas registradas por materia")
+
+    with tab3:
+        show_leaderboard(week_board())
+
+def show_leaderboard(board):
+    """Muestra los mejores jugadores de un ranking y la posición del usuario"""
+    leaderboards = get_leaderboards()
+    players = leaderboards.top(board)
+    if not players:
+        st.info("Todavía no hay partidas registradas en este ranking")
+        return
 
-    # Ranking global
-    st.markdown("### 🌍 Ranking Global")
+    for player in players:
+        show_ranking_item(player)
 
-    # Datos simulados del ranking
-    ranking_data = [
-        {"name": "Gabriel Steven Machicao Quispe", "points": 1020, "avatar": "G"},
-        {"name": "Ana María González", "points": 985, "avatar": "A"},
-        {"name": "Carlos Eduardo Pérez", "points": 920, "avatar": "C"},
-        {"name": "María José Rodríguez", "points": 890, "avatar": "M"},
-        {"name": "Luis Alberto Mendoza", "points": 875, "avatar": "L"}
-    ]
+    me = leaderboards.rank(board, st.session_state.user_data['id'])
+    if me is not None and me["rank"] > len(players):
+        st.markdown("**Tu posición**")
+        show_ranking_item(me)
 
-    for i, player in enumerate(ranking_data, 1):
-        st.markdown(create_ranking_item(i, player["name"], player["points"], player["avatar"]), unsafe_allow_html=True)
+def show_ranking_item(player):
+    """Muestra un jugador del ranking; su nombre lo escribió el usuario, así que se escapa"""
+    name = html.escape(player["name"])
+    st.markdown(create_ranking_item(player["rank"], name, player["points"], html.escape(player["name"][:1].upper())),
+                unsafe_allow_html=True)
 
 def show_configuracion():
     """Pantalla de configuración"""
@@ -650,6 +784,12 @@ def show_configuracion():
         personalized_ads = st.toggle("📢 Anuncios personalizados", value=True)
         dark_mode = st.toggle("🌙 Modo oscuro", value=False)
 
+        st.markdown("### 💰 Consumo de IA")
+        tracker = get_usage_tracker()
+        user_id = st.session_state.user_data.get('id')
+        st.metric("Gastado hoy", f"${tracker.spent_today(user_id):.3f}")
+        st.caption(f"Disponible para el próximo quiz: ${tracker.remaining_budget(user_id):.3f}")
+
         st.markdown("### ⚠️ Zona de Peligro")
         if st.button("🗑️ Desactivar Cuenta", type="secondary"):
             st.warning("Esta acción no se puede deshacer. ¿Estás seguro?")
@@ -720,68 +860,58 @@ def show_novedades():
     </div>
     """, unsafe_allow_html=True)
 
+SUMMARY_CARD_STYLES = [
+    ("linear-gradient(135deg, #667eea 0%, #764ba2 100%)", "black"),
+    ("linear-gradient(135deg, #a8edea 0%, #fed6e3 100%)", "#333"),
+    ("linear-gradient(135deg, #96fbc4 0%, #f9f586 100%)", "#333"),
+]
+
+def show_game_summary_cards(summary, show_time=False):
+    """Tarjetas con la precisión promedio (y el tiempo) de hasta tres juegos"""
+    if summary.empty:
+        st.info("Todavía no hay partidas registradas")
+        return
+
+    for col, (_, game), (background, color) in zip(st.columns(3), summary.iterrows(), SUMMARY_CARD_STYLES):
+        title = html.escape(game['title']) if isinstance(game['title'], str) else "Juego eliminado"
+        time_line = ""
+        if show_time and pd.notna(game['avg_minutes']):
+            time_line = f'<p style="margin: 0.5rem 0; color: {color};">Tiempo: {game["avg_minutes"]:.0f} min.</p>'
+        with col:
+            st.markdown(f"""
+            <div style="
+                background: {background};
+                padding: 1.5rem;
+                border-radius: 15px;
+                color: {color};
+                text-align: center;
+            ">
+                <h3 style="margin: 0; color: {color};">{title}</h3>
+                {time_line}
+                <h2 style="margin: 0.5rem 0; color: {color};">{game['avg_accuracy']:.0f}%</h2>
+            </div>
+            """, unsafe_allow_html=True)
+
 def show_puntajes():
-    """Pantalla de puntajes detallados"""
+    """Pantalla de puntajes detallados, calculados de los resultados de todas las partidas"""
     st.markdown(create_navigation_header(), unsafe_allow_html=True)
 
     st.markdown("## 📊 Resumen de Puntajes")
 
-    # Resumen de puntajes obtenidos
-    col1, col2, col3 = st.columns(3)
+    analytics = get_analytics()
+    summary = analytics.game_summary()
 
-    with col1:
-        st.markdown("""
-        <div style="
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            padding: 1.5rem;
-            border-radius: 15px;
-            color: black;
-            text-align: center;
-        ">
-            <h3 style="margin: 0; color: black;">Crucigrama</h3>
-            <p style="margin: 0.5rem 0; color: black;">Tiempo: 8 min.</p>
-            <h2 style="margin: 0.5rem 0; color: black;">92%</h2>
-        </div>
-        """, unsafe_allow_html=True)
-
-    with col2:
-        st.markdown("""
-        <div style="
-            background: linear-gradient(135deg, #a8edea 0%, #fed6e3 100%);
-            padding: 1.5rem;
-            border-radius: 15px;
-            color: #333;
-            text-align: center;
-        ">
-            <h3 style="margin: 0;">Quiz</h3>
-            <h2 style="margin: 0.5rem 0;">82%</h2>
-        </div>
-        """, unsafe_allow_html=True)
-
-    with col3:
-        st.markdown("""
-        <div style="
-            background: linear-gradient(135deg, #96fbc4 0%, #f9f586 100%);
-            padding: 1.5rem;
-            border-radius: 15px;
-            color: #333;
-            text-align: center;
-        ">
-            <h3 style="margin: 0;">Juego del Ahorcado</h3>
-            <h2 style="margin: 0.5rem 0;">100%</h2>
-        </div>
-        """, unsafe_allow_html=True)
+    # Resumen de puntajes de los juegos más jugados
+    show_game_summary_cards(summary.head(3), show_time=True)
+    if summary.empty:
+        return
 
     # Detalles de los juegos
     st.markdown("### 📋 Detalles")
 
-    games_detail = [
-        {"icon": "🧩", "name": "Crucigrama", "detail": "Tiempo: 8 min"},
-        {"icon": "❓", "name": "Quiz", "detail": "Correctas: 8/10"},
-        {"icon": "🎯", "name": "Juego del Ahorcado", "detail": "Errores: 4"}
-    ]
-
-    for game in games_detail:
+    for game_id, game in summary.iterrows():
+        title = html.escape(game['title']) if isinstance(game['title'], str) else "Juego eliminado"
+        minutes = f" | Tiempo promedio: {game['avg_minutes']:.1f} min" if pd.notna(game['avg_minutes']) else ""
         st.markdown(f"""
         <div style="
             background: #f5f5f5;
@@ -793,17 +923,51 @@ def show_puntajes():
             gap: 1rem;
             color: black;
         ">
-            <div style="font-size: 1.5rem;">{game['icon']}</div>
+            <div style="font-size: 1.5rem;">🎮</div>
             <div>
-                <strong>{game['name']}</strong>
-                <p style="margin: 0; color: #666; font-size: 0.9rem;">{game['detail']}</p>
+                <strong>{title}</strong>
+                <p style="margin: 0; color: #666; font-size: 0.9rem;">Partidas: {game['plays']} | Puntaje promedio: {game['avg_score']:.0f} | Precisión: {game['avg_accuracy']:.0f}%{minutes}</p>
             </div>
         </div>
         """, unsafe_allow_html=True)
 
+    # Análisis por pregunta y por estudiante de un juego
+    games = [game_id for game_id in summary.index if game_id >= 0]
+    if not games:
+        return
+    game_id = st.selectbox(
+        "🎮 Juego", games, key="analytics_game",
+        format_func=lambda game_id: summary.loc[game_id, 'title']
+    )
+
+    st.markdown("### 🎯 Dificultad por pregunta")
+    items = analytics.item_stats(game_id)
+    questions = get_game_repository().get_questions(game_id)
+    items.insert(0, "Pregunta", [
+        questions[i].get('question', '') if i < len(questions) else f"Pregunta {i + 1}" for i in items.index
+    ])
+    st.dataframe(
+        items.rename(columns={
+            "attempts": "Respuestas", "correct_rate": "% correctas", "difficulty": "Índice de dificultad", "band": "Dificultad"
+        }).style.format({"% correctas": "{:.0%}", "Índice de dificultad": "{:.2f}"}),
+        use_container_width=True, hide_index=True
+    )
+
+    st.markdown("### 👩‍🎓 Dominio por estudiante")
+    students = analytics.student_mastery(game_id)
+    st.dataframe(
+        students.rename(columns={
+            "name": "Estudiante", "games": "Partidas", "answered": "Respuestas", "mastery": "Dominio",
+            "minutes": "Minutos", "minutes_per_game": "Minutos por partida"
+        }).style.format({"Dominio": "{:.0%}", "Minutos": "{:.1f}", "Minutos por partida": "{:.1f}"}, na_rep="-"),
+        use_container_width=True, hide_index=True
+    )
+
 def start_game(game):
     """Inicia un juego en modo gamificado"""
+    load_game_questions(game)
     st.session_state.current_game = game
+    st.session_state.game_recorded = False
     st.session_state.current_question_index = 0
     st.session_state.game_score = 0
     st.session_state.current_game_answers = []
@@ -818,6 +982,16 @@ def show_game_interface():
     questions = game['questions']
 
     if question_index >= len(questions):
+        # Si el juego se creó durante la generación, esperar las siguientes páginas
+        generation = st.session_state.get('generation')
+        if generation is not None and generation['questions'] is questions and not generation['done']:
+            sync_generation(generation)
+        if generation is not None and generation['questions'] is questions and not generation['done']:
+            st.info("⏳ Generando más preguntas...")
+            time.sleep(1)
+            st.rerun()
+            return
+
         st.session_state.game_state = 'results'
         st.rerun()
         return
@@ -844,7 +1018,7 @@ def show_game_interface():
             background: url('data:image/svg+xml,<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 100 100"><circle cx="20" cy="20" r="1" fill="white" opacity="0.3"/><circle cx="80" cy="40" r="0.5" fill="white" opacity="0.5"/><circle cx="40" cy="80" r="1.5" fill="white" opacity="0.2"/></svg>');
         "></div>
         <div style="position: relative; z-index: 1;">
-            <h2 style="margin: 0; color: black;">🎮 {game['title']}</h2>
+            <h2 style="margin: 0; color: black;">🎮 {html.escape(game['title'])}</h2>
             <div style="display: flex; justify-content: space-between; align-items: center; margin-top: 1rem;">
                 <span>Pregunta {question_index + 1} de {len(questions)}</span>
                 <span>Puntuación: {st.session_state.game_score}</span>
@@ -940,6 +1114,20 @@ def show_game_results():
     accuracy = (correct_count / total_questions) * 100 if total_questions > 0 else 0
     final_points = st.session_state.game_score
 
+    # Registrar la partida una sola vez, aunque la pantalla se vuelva a ejecutar
+    if not st.session_state.get('game_recorded'):
+        st.session_state.game_recorded = True
+        st.session_state.points_before_game = st.session_state.user_data['points']
+        record_game_progress(st.session_state.user_data, final_points, correct_count, total_questions)
+        # Actualizar mejor puntuación y partidas del juego
+        st.session_state.game_new_record = get_game_repository().record_play(game['id'], final_points)
+        # El resultado detallado se escribe en segundo plano
+        time_spent = int(time.time() - st.session_state.game_start_time) if st.session_state.game_start_time else None
+        get_results_recorder().record(
+            st.session_state.user_data['id'], game['id'], final_points, accuracy, time_spent, answers
+        )
+    points_before = st.session_state.points_before_game
+
     # Calcular tiempo total
     if st.session_state.game_start_time:
         total_time = time.time() - st.session_state.game_start_time
@@ -1000,7 +1188,7 @@ def show_game_results():
         """, unsafe_allow_html=True)
 
     with col3:
-        level_up = calculate_level_from_points(st.session_state.user_data['points'] + final_points) > calculate_level_from_points(st.session_state.user_data['points'])
+        level_up = calculate_level_from_points(points_before + final_points) > calculate_level_from_points(points_before)
         st.markdown(f"""
         <div style="
             background: white;
@@ -1011,7 +1199,7 @@ def show_game_results():
         ">
             <div style="font-size: 2rem; color: #9C27B0;">🎖️</div>
             <h3 style="color: #9C27B0;">Nuevo Nivel</h3>
-            <h2 style="color: #333;">{calculate_level_from_points(st.session_state.user_data['points'] + final_points)}</h2>
+            <h2 style="color: #333;">{calculate_level_from_points(points_before + final_points)}</h2>
         </div>
         """, unsafe_allow_html=True)
 
@@ -1020,24 +1208,9 @@ def show_game_results():
         st.balloons()
         st.success("🎉 ¡Felicidades! ¡Has subido de nivel!")
 
-    # Actualizar estadísticas del usuario
-    user_data = st.session_state.user_data
-    user_data['points'] += final_points
-    user_data['total_games'] += 1
-    user_data['correct_answers'] += correct_count
-    user_data['total_questions'] += total_questions
-    user_data['level'] = calculate_level_from_points(user_data['points'])
-
-    # Actualizar mejor puntuación del juego
-    if final_points > game['best_score']:
-        game['best_score'] = final_points
+    if st.session_state.get('game_new_record'):
         st.success("🎉 ¡Nuevo récord personal!")
 
-    game['times_played'] += 1
-
-    # Guardar progreso
-    save_user_progress(user_data)
-
     # Botones de acción
     col1, col2, col3 = st.columns(3)
 
@@ -1063,7 +1236,7 @@ def show_practice_mode(game):
 
     st.markdown(f"## 📝 Modo Práctica: {game['title']}")
 
-    questions = game['questions']
+    questions = load_game_questions(game)
 
     # Mostrar todas las preguntas en modo práctica
     for i, question in enumerate(questions):
@@ -1106,12 +1279,13 @@ def generate_game_pdf(game):
         try:
             # Crear archivo JSON temporal
             json_filename = f"data/quiz-{game['filename']}.json"
+            questions = load_game_questions(game)
             with open(json_filename, "w", encoding='latin-1', errors='ignore') as f:
-                json_data = json.dumps(game['questions'])
+                json_data = json.dumps(questions)
                 f.write(json_data)
 
             # Generar PDF usando función original
-            generate_pdf_quiz(json_filename, game['questions'])
+            generate_pdf_quiz(json_filename, questions)
 
             st.success("📄 ¡PDF generado exitosamente!")
 
@@ -1,8 +1,8 @@
 import streamlit as st
-import json
-import os
 from datetime import datetime
 import time
+from dedup import QuestionDeduplicator
+from user_progress import get_progress_store
 
 def check_password():
     """
@@ -451,43 +451,21 @@ def create_study_group_card(title, participants, subject_icon="📚"):
     </div>
     """
 
-def save_user_progress(user_data, filename="user_progress.json"):
-    """Guarda el progreso del usuario en un archivo JSON"""
-    import json
-    import os
-
+def record_game_progress(user_data, points, correct_answers, total_questions):
+    """Suma una partida terminada al progreso del usuario y actualiza user_data"""
+    store = get_progress_store()
     try:
-        os.makedirs("data", exist_ok=True)
-        filepath = os.path.join("data", filename)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(user_data, f, ensure_ascii=False, indent=2)
+        store.record_game(user_data['id'], points, correct_answers, total_questions)
+        user_data.update(store.load(user_data['id']))
         return True
     except Exception as e:
         st.error(f"Error al guardar progreso: {e}")
         return False
 
-def load_user_progress(filename="user_progress.json"):
-    """Carga el progreso del usuario desde un archivo JSON"""
-    import json
-    import os
-
-    try:
-        filepath = os.path.join("data", filename)
-        if os.path.exists(filepath):
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
-    except Exception as e:
-        st.error(f"Error al cargar progreso: {e}")
-
-    # Retorna datos por defecto si no se puede cargar
-    return {
-        'level': 1,
-        'points': 250,
-        'total_games': 3,
-        'correct_answers': 18,
-        'total_questions': 24,
-        'achievements': []
-    }
+def load_user_progress(user_id=None):
+    """Carga el progreso del usuario desde la base de datos"""
+    store = get_progress_store()
+    return store.load(user_id if user_id is not None else store.default_user_id())
 
 def get_game_mode_options():
     """Retorna las opciones de modo de juego"""
@@ -594,13 +572,14 @@ def validate_question_format(question):
     return True
 
 def clean_questions(questions):
-    """Limpia y valida las preguntas, removiendo las que no tienen formato correcto"""
+    """Limpia y valida las preguntas, removiendo las que no tienen formato correcto y las casi repetidas"""
     cleaned_questions = []
+    dedup = QuestionDeduplicator()
 
     for question in questions:
-        if validate_question_format(question):
-            cleaned_questions.append(question)
-        else:
+        if not validate_question_format(question):
             st.warning(f"Pregunta con formato incorrecto removida: {question}")
+        elif dedup.add(question):
+            cleaned_questions.append(question)
 
     return cleaned_questions
@@ -0,0 +1,43 @@
+"""Content-addressed storage of uploaded documents, written straight from the upload's buffer."""
+import hashlib
+import os
+import tempfile
+from typing import Any
+
+UPLOADS_DIR = os.environ.get("EDUPLAY_UPLOADS_DIR", "data/uploads")
+
+def as_buffer(data: Any) -> memoryview:
+    """
+    Zero-copy view of an upload: BytesIO-like objects (Streamlit's UploadedFile)
+    expose their buffer with getbuffer(), bytes-like objects are viewed directly.
+    """
+    if hasattr(data, "getbuffer"):
+        return data.getbuffer()
+    return memoryview(data)
+
+def upload_path(digest: str, suffix: str = ".pdf", uploads_dir: str = UPLOADS_DIR) -> str:
+    return os.path.join(uploads_dir, digest[:2], f"{digest}{suffix}")
+
+def store_upload(data: Any, suffix: str = ".pdf", uploads_dir: str = UPLOADS_DIR) -> str:
+    """
+    Stores an upload under the SHA-256 of its content and returns its path.
+    The same document uploaded twice, by anyone and under any name, is
+    stored once; two different documents never overwrite each other.
+    """
+    # Released on exit: an exported buffer keeps a BytesIO from being resized
+    with as_buffer(data) as buffer:
+        path = upload_path(hashlib.sha256(buffer).hexdigest(), suffix, uploads_dir)
+        if os.path.exists(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written under a temporary name and renamed, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(buffer)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return path
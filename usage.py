@@ -0,0 +1,193 @@
+"""Token and cost accounting per upload, user and game, with per-user and per-day budgets."""
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from database import DB_PATH, get_connection
+
+# USD; a single upload, one user in a day, and everyone in a day
+MAX_UPLOAD_COST_USD = float(os.environ.get("EDUPLAY_MAX_UPLOAD_COST_USD", "0.50"))
+USER_DAILY_BUDGET_USD = float(os.environ.get("EDUPLAY_USER_DAILY_BUDGET_USD", "2.00"))
+DAILY_BUDGET_USD = float(os.environ.get("EDUPLAY_DAILY_BUDGET_USD", "50.00"))
+FLUSH_EVERY_CALLS = 20
+
+# Running uploads count for their estimate until their real cost is known
+SPENT_TODAY = """
+SELECT COALESCE(SUM(CASE WHEN status = 'running' THEN MAX(cost_usd, estimated_cost_usd) ELSE cost_usd END), 0)
+FROM generation_usage WHERE created_at >= date('now')
+"""
+RESERVE_USAGE = """
+INSERT INTO generation_usage (upload_id, user_id, model_name, pages, questions_requested, estimated_cost_usd)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (upload_id) DO UPDATE SET
+    pages = pages + excluded.pages,
+    questions_requested = questions_requested + excluded.questions_requested,
+    estimated_cost_usd = estimated_cost_usd + excluded.estimated_cost_usd,
+    updated_at = CURRENT_TIMESTAMP
+"""
+INSERT_USAGE = """
+INSERT OR IGNORE INTO generation_usage (upload_id, user_id, model_name, pages, questions_requested, estimated_cost_usd)
+VALUES (?, ?, ?, ?, ?, ?)
+"""
+
+
+class BudgetExceededError(Exception):
+    """Raised before generation when even a reduced quiz would not fit the remaining budget."""
+
+
+class UsageTracker():
+    """
+    Aggregates the tokens and cost of each upload's LLM calls and stores them
+    in the generation_usage table of eduplay.db.
+
+    Calls are recorded from the LLM engine loop, so they are accumulated in
+    memory and written every FLUSH_EVERY_CALLS calls and when the upload ends.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_upload_cost: float = MAX_UPLOAD_COST_USD,
+                 user_daily_budget: float = USER_DAILY_BUDGET_USD, daily_budget: float = DAILY_BUDGET_USD) -> None:
+        self.db_path = db_path
+        self.max_upload_cost = max_upload_cost
+        self.user_daily_budget = user_daily_budget
+        self.daily_budget = daily_budget
+        self._lock = threading.Lock()
+        self._pending: Dict[str, List[float]] = {}
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def reserve(self, upload_id: str, user_id: Optional[int], model_name: str, pages: int,
+                plan: Callable[[float], Tuple[List[List[str]], float]]) -> Tuple[List[List[str]], float]:
+        """
+        Registers an upload and reserves its estimated cost in the same
+        transaction as the budget check, so concurrent uploads cannot both
+        spend what is left. `plan(remaining)` sizes the quiz to the USD that
+        may still be spent and returns (plans, estimated cost), or raises
+        BudgetExceededError; reserve returns what it returned.
+
+        Reserving again for the same upload adds to its reservation, for
+        documents planned in parts as their pages are extracted.
+        """
+        self.flush()
+        conn = self._conn()
+        # Taken before reading: a concurrent reserve waits until this one is committed
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            plans, estimate = plan(self._remaining(conn, user_id, upload_id))
+            conn.execute(RESERVE_USAGE, (upload_id, user_id, model_name, pages, sum(map(len, plans)), estimate))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return plans, estimate
+
+    def begin(self, upload_id: str, user_id: Optional[int], model_name: str, pages: int,
+              questions_requested: int, estimated_cost: float) -> None:
+        """Registers an upload whose plan was already approved (see reserve); a registered upload is kept."""
+        with self._conn() as conn:
+            conn.execute(INSERT_USAGE, (upload_id, user_id, model_name, pages, questions_requested, estimated_cost))
+
+    def record(self, upload_id: str, prompt_tokens: int, completion_tokens: int, cost: float) -> None:
+        """Adds one LLM call to the upload's totals."""
+        with self._lock:
+            totals = self._pending.setdefault(upload_id, [0, 0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+            totals[3] += cost
+            should_flush = totals[0] >= FLUSH_EVERY_CALLS
+        if should_flush:
+            self.flush(upload_id)
+
+    def flush(self, upload_id: Optional[str] = None) -> None:
+        """Writes the calls accumulated for `upload_id`, or for every upload."""
+        with self._lock:
+            if upload_id is None:
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {upload_id: self._pending.pop(upload_id)} if upload_id in self._pending else {}
+        if not pending:
+            return
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE generation_usage SET calls = calls + ?, prompt_tokens = prompt_tokens + ?, "
+                "completion_tokens = completion_tokens + ?, cost_usd = cost_usd + ?, updated_at = CURRENT_TIMESTAMP "
+                "WHERE upload_id = ?",
+                [(*totals, key) for key, totals in pending.items()],
+            )
+
+    def finish(self, upload_id: str, status: str = "done") -> None:
+        self.flush(upload_id)
+        with self._conn() as conn:
+            conn.execute(
+                "UPDATE generation_usage SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE upload_id = ?",
+                (status, upload_id),
+            )
+
+    def assign_game(self, upload_id: str, game_id: int) -> None:
+        """Links an upload's cost to the game created from its questions."""
+        with self._conn() as conn:
+            conn.execute("UPDATE generation_usage SET game_id = ? WHERE upload_id = ?", (game_id, upload_id))
+
+    def _spent_today(self, conn, user_id: Optional[int] = None) -> float:
+        if user_id is None:
+            return conn.execute(SPENT_TODAY).fetchone()[0]
+        return conn.execute(f"{SPENT_TODAY} AND user_id = ?", (user_id,)).fetchone()[0]
+
+    def _remaining(self, conn, user_id: Optional[int] = None, upload_id: Optional[str] = None) -> float:
+        upload_limit = self.max_upload_cost
+        if upload_id is not None:
+            # An upload planned in parts already holds part of its own limit
+            row = conn.execute("SELECT MAX(cost_usd, estimated_cost_usd) FROM generation_usage WHERE upload_id = ?",
+                               (upload_id,)).fetchone()
+            upload_limit -= row[0] if row else 0.0
+        remaining = min(upload_limit, self.daily_budget - self._spent_today(conn))
+        if user_id is not None:
+            remaining = min(remaining, self.user_daily_budget - self._spent_today(conn, user_id))
+        return max(0.0, remaining)
+
+    def spent_today(self, user_id: Optional[int] = None) -> float:
+        """USD spent (or reserved by running uploads) since midnight UTC, by `user_id` or by everyone."""
+        self.flush()
+        return self._spent_today(self._conn(), user_id)
+
+    def remaining_budget(self, user_id: Optional[int] = None) -> float:
+        """Most a new upload may cost: the tightest of the upload, user and daily limits."""
+        self.flush()
+        return self._remaining(self._conn(), user_id)
+
+    def _summary(self, expression: str, name: str, days: Optional[int]) -> List[Dict[str, Any]]:
+        self.flush()
+        where = f"WHERE created_at >= date('now', '-{int(days)} days')" if days else ""
+        rows = self._conn().execute(
+            f"SELECT {expression} AS {name}, COUNT(*) AS uploads, SUM(calls) AS calls, "
+            f"SUM(prompt_tokens) AS prompt_tokens, SUM(completion_tokens) AS completion_tokens, SUM(cost_usd) AS cost_usd "
+            f"FROM generation_usage {where} GROUP BY {name} ORDER BY cost_usd DESC"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def usage_by_user(self, days: Optional[int] = 30) -> List[Dict[str, Any]]:
+        return self._summary("user_id", "user_id", days)
+
+    def usage_by_game(self, days: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._summary("game_id", "game_id", days)
+
+    def usage_by_day(self, days: Optional[int] = 30) -> List[Dict[str, Any]]:
+        return self._summary("date(created_at)", "day", days)
+
+    def upload_usage(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        self.flush(upload_id)
+        row = self._conn().execute("SELECT * FROM generation_usage WHERE upload_id = ?", (upload_id,)).fetchone()
+        return dict(row) if row else None
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+def get_usage_tracker() -> UsageTracker:
+    """Returns the process-wide usage tracker."""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            _tracker = UsageTracker()
+    return _tracker
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from usage import BudgetExceededError, UsageTracker
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return UsageTracker(db_path=str(tmp_path / "usage.db"), max_upload_cost=1.0, user_daily_budget=1.5,
+                        daily_budget=10.0)
+
+
+def fixed_plan(estimate, delay=0.0):
+    """A plan costing `estimate` that takes `delay` seconds to compute, rejected when it does not fit."""
+    def plan(remaining):
+        time.sleep(delay)
+        if estimate > remaining:
+            raise BudgetExceededError("no alcanza")
+        return [["Medio"] * 2], estimate
+    return plan
+
+
+def test_reserve_records_the_upload_and_its_model(tracker):
+    plans, estimate = tracker.reserve("upload-1", 7, "gpt-4o", 3, fixed_plan(0.4))
+
+    assert plans == [["Medio", "Medio"]]
+    usage = tracker.upload_usage("upload-1")
+    assert usage["model_name"] == "gpt-4o"
+    assert usage["pages"] == 3
+    assert usage["questions_requested"] == 2
+    assert usage["estimated_cost_usd"] == pytest.approx(0.4)
+    assert usage["status"] == "running"
+    # The upload limit is tighter than what is left of the user's day
+    assert tracker.remaining_budget(7) == pytest.approx(1.0)
+    assert tracker.spent_today(7) == pytest.approx(0.4)
+
+
+def test_reserve_counts_running_uploads_against_the_budget(tracker):
+    tracker.reserve("upload-1", 7, "gpt-4o-mini", 1, fixed_plan(0.9))
+    tracker.reserve("upload-2", 7, "gpt-4o-mini", 1, fixed_plan(0.5))
+
+    with pytest.raises(BudgetExceededError):
+        tracker.reserve("upload-3", 7, "gpt-4o-mini", 1, fixed_plan(0.2))
+    assert tracker.upload_usage("upload-3") is None
+
+
+def test_concurrent_reservations_cannot_overspend(tracker):
+    granted, rejected = [], []
+
+    def upload(upload_id):
+        try:
+            # Slow planning widens the window between reading the budget and reserving it
+            tracker.reserve(upload_id, 7, "gpt-4o-mini", 1, fixed_plan(0.9, delay=0.1))
+            granted.append(upload_id)
+        except BudgetExceededError:
+            rejected.append(upload_id)
+
+    threads = [threading.Thread(target=upload, args=(f"upload-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(granted) == 1
+    assert len(rejected) == 3
+    assert tracker.spent_today(7) <= 1.5
+
+
+def test_finished_uploads_count_their_real_cost(tracker):
+    tracker.reserve("upload-1", 7, "gpt-4o-mini", 1, fixed_plan(0.9))
+    tracker.record("upload-1", 1000, 200, 0.1)
+    tracker.finish("upload-1")
+
+    assert tracker.spent_today(7) == pytest.approx(0.1)
+    assert tracker.upload_usage("upload-1")["calls"] == 1
@@ -0,0 +1,144 @@
+"""
+Progreso de los usuarios en la tabla users de eduplay.db
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from database import DB_PATH, get_connection
+
+# Usuario con el que juega quien entra con la contraseña compartida
+DEFAULT_USERNAME = os.environ.get("EDUPLAY_DEFAULT_USERNAME", "estudiante_demo")
+# Archivo donde se guardaba el progreso antes; se importa una vez
+LEGACY_PROGRESS_FILE = os.path.join("data", "user_progress.json")
+
+SELECT_PROGRESS = """
+SELECT id, username, first_name, user_type, level, points, total_games, correct_answers, total_questions
+FROM users WHERE id = ?
+"""
+SELECT_ACHIEVEMENTS = """
+SELECT a.name FROM user_achievements AS ua JOIN achievements AS a ON a.id = ua.achievement_id
+WHERE ua.user_id = ? ORDER BY ua.earned_at
+"""
+# Incrementos atómicos: dos sesiones que terminan a la vez suman las dos.
+# El nivel sigue a ui_utils.calculate_level_from_points (100 puntos por nivel, hasta 10)
+RECORD_GAMES = """
+UPDATE users SET
+    points = points + ?,
+    level = MIN(10, MAX(1, (points + ?) / 100 + 1)),
+    total_games = total_games + ?,
+    correct_answers = correct_answers + ?,
+    total_questions = total_questions + ?
+WHERE id = ?
+"""
+
+
+class ProgressStore():
+    """
+    Puntos, nivel y estadísticas de cada usuario.
+
+    Terminar un juego es un UPDATE de una fila, sin importar cuánto progreso
+    haya acumulado. Con muchas sesiones terminando a la vez las escrituras se
+    agrupan: mientras una transacción escribe, las partidas que llegan se
+    acumulan por usuario y la siguiente transacción las escribe juntas.
+    record_game no retorna hasta que su partida está guardada.
+    """
+
+    def __init__(self, db_path: str = DB_PATH) -> None:
+        self.db_path = db_path
+        # user_id -> [puntos, juegos, respuestas correctas, preguntas]
+        self._pending: Dict[int, list] = {}
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._open_batch = 1
+        self._committed_batch = 0
+
+    def _conn(self):
+        return get_connection(self.db_path)
+
+    def default_user_id(self) -> int:
+        """Id del usuario de la contraseña compartida, creado la primera vez"""
+        with self._conn() as conn:
+            row = conn.execute("SELECT id FROM users WHERE username = ?", (DEFAULT_USERNAME,)).fetchone()
+            if row is not None:
+                user_id = row["id"]
+            else:
+                # Sin contraseña propia: solo se entra con la contraseña compartida
+                user_id = conn.execute(
+                    "INSERT INTO users (username, email, password_hash) VALUES (?, ?, '!')",
+                    (DEFAULT_USERNAME, f"{DEFAULT_USERNAME}@eduplay.local"),
+                ).lastrowid
+        self.import_legacy_progress(user_id)
+        return user_id
+
+    def import_legacy_progress(self, user_id: int, path: str = LEGACY_PROGRESS_FILE) -> bool:
+        """Suma al usuario el progreso de data/user_progress.json, una sola vez"""
+        migrated = f"{path}.migrated"
+        try:
+            # Renombrar primero: si dos sesiones lo intentan a la vez, solo una lo importa
+            os.replace(path, migrated)
+        except FileNotFoundError:
+            return False
+        with open(migrated, encoding="utf-8") as f:
+            legacy = json.load(f)
+        self.record_game(
+            user_id, legacy.get("points", 0), legacy.get("correct_answers", 0),
+            legacy.get("total_questions", 0), legacy.get("total_games", 0),
+        )
+        return True
+
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Progreso del usuario, con los nombres de sus logros"""
+        conn = self._conn()
+        row = conn.execute(SELECT_PROGRESS, (user_id,)).fetchone()
+        if row is None:
+            return None
+        progress = dict(row)
+        progress["achievements"] = [a["name"] for a in conn.execute(SELECT_ACHIEVEMENTS, (user_id,))]
+        return progress
+
+    def record_game(self, user_id: int, points: int, correct_answers: int, total_questions: int,
+                    games: int = 1) -> None:
+        """Suma una partida terminada al progreso del usuario"""
+        with self._pending_lock:
+            deltas = self._pending.setdefault(user_id, [0, 0, 0, 0])
+            for i, value in enumerate((points, games, correct_answers, total_questions)):
+                deltas[i] += value
+            batch = self._open_batch
+
+        with self._flush_lock:
+            if self._committed_batch >= batch:
+                # Otra sesión ya escribió esta partida junto con la suya
+                return
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                flushing = self._open_batch
+                self._open_batch += 1
+            try:
+                with self._conn() as conn:
+                    conn.executemany(RECORD_GAMES, [
+                        (user_points, user_points, user_games, correct, questions, user)
+                        for user, (user_points, user_games, correct, questions) in pending.items()
+                    ])
+            except Exception:
+                # Las partidas vuelven a la cola y las escribe la próxima transacción
+                with self._pending_lock:
+                    for user, values in pending.items():
+                        deltas = self._pending.setdefault(user, [0, 0, 0, 0])
+                        for i, value in enumerate(values):
+                            deltas[i] += value
+                raise
+            self._committed_batch = flushing
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_progress_store() -> ProgressStore:
+    """Retorna el almacén de progreso compartido por todas las sesiones"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ProgressStore()
+    return _store
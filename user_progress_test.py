@@ -0,0 +1,104 @@
+import json
+import threading
+import time
+
+import pytest
+
+from database import get_connection
+from user_progress import ProgressStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProgressStore(db_path=str(tmp_path / "eduplay.db"))
+
+
+def add_user(store, username="ana"):
+    with get_connection(store.db_path) as conn:
+        return conn.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, '!')",
+                            (username, f"{username}@eduplay.local")).lastrowid
+
+
+def test_record_game_adds_to_the_progress(store):
+    user_id = add_user(store)
+
+    store.record_game(user_id, 150, 3, 5)
+    store.record_game(user_id, 80, 4, 5)
+
+    progress = store.load(user_id)
+    assert progress["points"] == 230
+    assert progress["level"] == 3
+    assert progress["total_games"] == 2
+    assert progress["correct_answers"] == 7
+    assert progress["total_questions"] == 10
+    assert progress["achievements"] == []
+
+
+def test_concurrent_sessions_all_count(store):
+    users = [add_user(store, f"alumno{i}") for i in range(4)]
+
+    def play(user_id):
+        for _ in range(25):
+            store.record_game(user_id, 10, 1, 2)
+
+    threads = [threading.Thread(target=play, args=(user,)) for user in users for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for user_id in users:
+        progress = store.load(user_id)
+        assert progress["points"] == 500
+        assert progress["total_games"] == 50
+        assert progress["level"] == 6
+
+
+def test_games_finishing_during_a_write_share_the_next_transaction(store):
+    users = [add_user(store, f"alumno{i}") for i in range(5)]
+    threads = [threading.Thread(target=store.record_game, args=(user, 10, 1, 1)) for user in users]
+
+    # A transaction in progress: every game arriving meanwhile is queued
+    with store._flush_lock:
+        for thread in threads:
+            thread.start()
+        while sum(deltas[1] for deltas in store._pending.values()) < len(users):
+            time.sleep(0.01)
+    for thread in threads:
+        thread.join()
+
+    assert store._open_batch == 2
+    assert [store.load(user)["points"] for user in users] == [10] * 5
+
+
+def test_a_failed_write_is_retried_by_the_next_game(store, monkeypatch):
+    user_id = add_user(store)
+    conn = store._conn
+
+    def locked():
+        raise OSError("database is locked")
+
+    monkeypatch.setattr(store, "_conn", locked)
+    with pytest.raises(OSError):
+        store.record_game(user_id, 40, 2, 2)
+    monkeypatch.setattr(store, "_conn", conn)
+
+    store.record_game(user_id, 60, 1, 2)
+
+    progress = store.load(user_id)
+    assert progress["points"] == 100
+    assert progress["total_games"] == 2
+
+
+def test_legacy_progress_file_is_imported_once(store, tmp_path):
+    user_id = add_user(store)
+    path = tmp_path / "user_progress.json"
+    path.write_text(json.dumps({"points": 320, "total_games": 4, "correct_answers": 9, "total_questions": 12}))
+
+    assert store.import_legacy_progress(user_id, str(path))
+    assert not store.import_legacy_progress(user_id, str(path))
+
+    progress = store.load(user_id)
+    assert progress["points"] == 320
+    assert progress["total_games"] == 4
+    assert progress["level"] == 4